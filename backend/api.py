@@ -1,13 +1,260 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
-import pandas as pd
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Literal, Optional
+import asyncio
+import os
+import re
+import json
+import hashlib
+import importlib.util
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, aclosing
 import numpy as np
-import yfinance as yf
-from finance_sim import run_monte_carlo_simulation, get_historical_stats, calculate_kpis, run_backtest
+from finance_sim import (
+    run_monte_carlo_simulation, run_adaptive_simulation, run_parameter_sweep, solve_contribution_for_goal, get_historical_stats,
+    estimate_asset_covariance, calculate_portfolio_stats, calculate_kpis, run_backtest, run_rolling_backtest,
+    get_monthly_log_returns, get_process_pool, replace_process_pool, ProgressiveSimulation, simulate_progressive_batch
+)
+from cache import TTLCache, ResultCache
+from metrics import (
+    collect, current_timings, stage, timed_call, Registry, Histogram, Counter, Collected
+)
+from executors import WorkQueue, QueueFullError, QueueTimeoutError, WorkerCrashedError
+from jobs import JobQueue, JobLimitError, JobFailed
+from ticker_index import TickerIndex, DEFAULT_INDEX_PATH
+from serialization import (
+    negotiate_format, encode_response, downsample_indices,
+    frame_columns, records_columns, columns_records
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        print(f"Ticker index: {ticker_index.load()} symbols from {ticker_index.path}")
+    except OSError as e:
+        print(f"Ticker index unavailable: {e}")
+    # Warm up in the background: /health answers at once, /ready once it is done
+    warmup = asyncio.create_task(warm_up())
+    yield
+    warmup.cancel()
+    # Release worker threads and processes on shutdown
+    io_queue.executor.shutdown(wait=False, cancel_futures=True)
+    shard_coordinators.shutdown(wait=False, cancel_futures=True)
+    cpu_queue.executor.shutdown(wait=False, cancel_futures=True)
+
+app = FastAPI(title="Finance Simulator API", lifespan=lifespan)
+
+# Ticker statistics barely move within a day: cache them per (ticker, period)
+STATS_PERIOD = "20y"
+ticker_stats_cache = TTLCache(
+    maxsize=int(os.environ.get("STATS_CACHE_SIZE", 256)),
+    ttl=float(os.environ.get("STATS_CACHE_TTL", 6 * 3600)),
+)
+
+# Simulation size limits and sharding (large runs are split across processes)
+MAX_SIMULATIONS = int(os.environ.get("MAX_SIMULATIONS", 1_000_000))
+SIM_SHARDS = int(os.environ.get("SIM_SHARDS", os.cpu_count() or 1))
+SHARD_MIN_PATHS = int(os.environ.get("SHARD_MIN_PATHS", 100_000))
+MAX_BATCH_SCENARIOS = int(os.environ.get("MAX_BATCH_SCENARIOS", 64))
+MAX_PORTFOLIO_ASSETS = int(os.environ.get("MAX_PORTFOLIO_ASSETS", 20))
+# Adaptive runs: paths per batch and default path budget
+ADAPTIVE_BATCH_SIZE = int(os.environ.get("ADAPTIVE_BATCH_SIZE", 5_000))
+ADAPTIVE_MAX_PATHS = int(os.environ.get("ADAPTIVE_MAX_PATHS", 200_000))
+# Streaming runs: how often to check for disconnects/cancellation while batches run
+STREAM_POLL_INTERVAL = float(os.environ.get("STREAM_POLL_INTERVAL", 0.25))
+
+# Covariance estimates and their Cholesky factors, per ticker set
+asset_covariance_cache = TTLCache(
+    maxsize=int(os.environ.get("COVARIANCE_CACHE_SIZE", 128)),
+    ttl=float(os.environ.get("STATS_CACHE_TTL", 6 * 3600)),
+)
+
+# Monthly log returns resampled by the block-bootstrap return model, per ticker set
+BOOTSTRAP_PERIOD = os.environ.get("BOOTSTRAP_PERIOD", "max")
+monthly_returns_cache = TTLCache(
+    maxsize=int(os.environ.get("COVARIANCE_CACHE_SIZE", 128)),
+    ttl=float(os.environ.get("STATS_CACHE_TTL", 6 * 3600)),
+)
+
+# Offline symbol search; TICKER_INDEX_PATH points to a refreshed export
+# (same columns as data/tickers.csv), re-read when the file changes
+ticker_index = TickerIndex(
+    os.environ.get("TICKER_INDEX_PATH", DEFAULT_INDEX_PATH),
+    check_interval=float(os.environ.get("TICKER_INDEX_CHECK_INTERVAL", 60)),
+)
+TICKER_SYMBOL_RE = re.compile(r"^\^?[A-Z0-9][A-Z0-9.\-=]{0,14}$")
+
+# Encoded /simulate responses keyed by a hash of the normalized request;
+# RESULT_CACHE_DIR adds a disk tier that survives restarts
+result_cache = ResultCache(
+    max_bytes=int(os.environ.get("RESULT_CACHE_BYTES", 64 * 1024 * 1024)),
+    directory=os.environ.get("RESULT_CACHE_DIR") or None,
+    max_disk_bytes=int(os.environ.get("RESULT_CACHE_DISK_BYTES", 512 * 1024 * 1024)),
+)
+
+def get_ticker_stats(ticker: str, period: str = STATS_PERIOD):
+    """Cached get_historical_stats; concurrent misses share one fetch."""
+    key = (ticker.upper(), period)
+    return ticker_stats_cache.get_or_load(key, lambda: get_historical_stats(ticker, period=period))
+
+def get_asset_covariance(tickers: tuple, period: str = STATS_PERIOD):
+    """Cached estimate_asset_covariance for a sorted tuple of tickers."""
+    key = (tickers, period)
+    return asset_covariance_cache.get_or_load(key, lambda: estimate_asset_covariance(list(tickers), period=period))
+
+def get_monthly_returns(tickers: tuple, period: str = BOOTSTRAP_PERIOD):
+    """Cached get_monthly_log_returns for a sorted tuple of tickers."""
+    key = (tickers, period)
+    return monthly_returns_cache.get_or_load(key, lambda: get_monthly_log_returns(list(tickers), period=period))
+
+# Background jobs (/jobs): long runs submitted now and fetched later
+job_queue = JobQueue(
+    max_running=int(os.environ.get("JOB_WORKERS", 2)),
+    max_running_per_client=int(os.environ.get("JOB_MAX_RUNNING_PER_CLIENT", 1)),
+    max_queued_per_client=int(os.environ.get("JOB_MAX_QUEUED_PER_CLIENT", 10)),
+    result_ttl=float(os.environ.get("JOB_RESULT_TTL", 3600)),
+)
+
+# Work queues: blocking network fetches run on a bounded thread pool and
+# simulations on the shared process pool, so the event loop stays responsive.
+io_queue = WorkQueue(
+    "io",
+    ThreadPoolExecutor(max_workers=int(os.environ.get("IO_WORKERS", 8)), thread_name_prefix="io"),
+    max_pending=int(os.environ.get("IO_MAX_PENDING", 64)),
+    timeout=float(os.environ.get("IO_TIMEOUT", 30)),
+)
+cpu_queue = WorkQueue(
+    "cpu",
+    get_process_pool(),
+    max_pending=int(os.environ.get("CPU_MAX_PENDING", 2 * (os.cpu_count() or 1))),
+    timeout=float(os.environ.get("CPU_TIMEOUT", 120)),
+    replace_executor=replace_process_pool,
+)
+# Sharded runs are coordinated from a thread while their shards use the process pool
+shard_coordinators = ThreadPoolExecutor(max_workers=int(os.environ.get("SHARD_COORDINATORS", 4)), thread_name_prefix="shards")
+
+async def run_timed(queue: WorkQueue, fn, profile=False, queue_options=None, **kwargs):
+    """
+    Run fn(**kwargs) on a work queue and merge the stage timings recorded in
+    the worker into the current request. Time spent waiting for a free
+    worker is reported as the '<queue>_wait' stage.
+    """
+    started = time.perf_counter()
+    result, report = await queue.run(timed_call, fn, kwargs, profile, **(queue_options or {}))
+    timings = current_timings()
+    if timings is not None:
+        timings.merge(report)
+        timings.add(f"{queue.name}_wait", max(0.0, time.perf_counter() - started - report["elapsed"]))
+    return result
+
+async def run_simulation(profile=False, **kwargs):
+    """Run run_monte_carlo_simulation off the event loop, on the CPU queue."""
+    shards = kwargs.get("shards", 1)
+    if shards > 1:
+        return await run_timed(
+            cpu_queue, run_monte_carlo_simulation, profile=profile,
+            # The shards go to the shared get_process_pool(), which replace_process_pool keeps in step with cpu_queue
+            queue_options={"weight": shards, "run_on": shard_coordinators}, **kwargs
+        )
+    return await run_timed(cpu_queue, run_monte_carlo_simulation, profile=profile, **kwargs)
+
+# Warm-up before reporting ready: start the simulation workers (importing
+# the engine and pandas there) and preload the stats and monthly return
+# arrays of popular tickers, so the first requests skip that work
+WARMUP_TICKERS = [t.strip().upper() for t in os.environ.get("WARMUP_TICKERS", "SPY,QQQ,IWDA.AS").split(",") if t.strip()]
+WARMUP_TIMEOUT = float(os.environ.get("WARMUP_TIMEOUT", 120))
+warmup_state = {"status": "pending", "elapsed_seconds": None, "workers": None, "tickers": {}}
+
+async def warm_up_ticker(ticker):
+    stats = await run_timed(io_queue, get_ticker_stats, ticker=ticker)
+    if stats is None:
+        return "missing"
+    await run_timed(io_queue, get_monthly_returns, tickers=(ticker,))
+    return "ok"
+
+async def warm_up():
+    started = time.perf_counter()
+    warmup_state["status"] = "running"
+    # One tiny run per worker so every process is started and has imported the
+    # engine, leaving at least one cpu_queue slot free for real requests
+    workers = min(int(os.environ.get("SIM_WORKERS", os.cpu_count() or 1)), cpu_queue.max_pending - 1)
+    # A single gather: a gather nested in wait_for leaves an unretrieved
+    # CancelledError behind when shutdown cancels the warm-up
+    runs = [
+        asyncio.wait_for(
+            run_simulation(initial_capital=1.0, contribution_schedule=[(1, 0.0)], num_simulations=16, seed=0),
+            WARMUP_TIMEOUT
+        )
+        for _ in range(workers)
+    ]
+    results = await asyncio.gather(
+        *runs,
+        *(asyncio.wait_for(warm_up_ticker(ticker), WARMUP_TIMEOUT) for ticker in WARMUP_TICKERS),
+        return_exceptions=True
+    )
+    run_failed = any(isinstance(result, BaseException) for result in results[:workers])
+    warmup_state["workers"] = "error" if run_failed else workers
+    warmup_state["tickers"] = {
+        ticker: f"error: {result!r}" if isinstance(result, BaseException) else result
+        for ticker, result in zip(WARMUP_TICKERS, results[workers:])
+    }
+    warmup_state["elapsed_seconds"] = time.perf_counter() - started
+    warmup_state["status"] = "done"
+    print(f"Warm-up done in {warmup_state['elapsed_seconds']:.1f}s: {warmup_state['tickers']}")
+
+# Sampling profiler, opt-in per request (?profile=1 or X-Profile: 1) when enabled
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+
+def profiling_requested(http_request: Request):
+    requested = http_request.query_params.get("profile") in ("1", "true") or http_request.headers.get("x-profile") == "1"
+    if requested and not PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiling is disabled on this server (set PROFILING_ENABLED=1).")
+    return requested
+
+# --- Metrics (Prometheus text format at /metrics) ---
+
+metrics_registry = Registry()
+request_seconds = metrics_registry.register(Histogram(
+    "finance_sim_request_seconds", "Request latency by endpoint.", ["endpoint"]
+))
+stage_seconds = metrics_registry.register(Histogram(
+    "finance_sim_stage_seconds", "Time spent in each stage of a request.", ["endpoint", "stage"]
+))
+work_total = metrics_registry.register(Counter(
+    "finance_sim_work_total", "Work done by the simulation engine (paths, path_years).", ["kind"]
+))
+
+def _cache_samples(field):
+    caches = {
+        "ticker_stats": ticker_stats_cache,
+        "asset_covariance": asset_covariance_cache,
+        "monthly_returns": monthly_returns_cache,
+        "results": result_cache,
+    }
+    return lambda: [({"cache": name}, cache.stats()[field]) for name, cache in caches.items()]
+
+def _queue_samples(field):
+    return lambda: [({"queue": queue.name}, queue.stats()[field]) for queue in (io_queue, cpu_queue)]
 
-app = FastAPI(title="Finance Simulator API")
+for field in ("hits", "misses", "evictions"):
+    metrics_registry.register(Collected(
+        f"finance_sim_cache_{field}_total", f"Cache {field} per cache.", _cache_samples(field), type="counter"
+    ))
+metrics_registry.register(Collected("finance_sim_cache_entries", "Entries per cache.", _cache_samples("size")))
+metrics_registry.register(Collected("finance_sim_queue_pending", "Work units queued or running.", _queue_samples("pending")))
+metrics_registry.register(Collected(
+    "finance_sim_jobs", "Background jobs by status.",
+    lambda: [({"status": status}, n) for status, n in job_queue.stats()["jobs"].items()]
+))
+for field in ("completed", "rejected", "timed_out"):
+    metrics_registry.register(Collected(
+        f"finance_sim_queue_{field}_total", f"Work {field.replace('_', ' ')} per queue.", _queue_samples(field), type="counter"
+    ))
 
 # CORS Configuration
 origins = [
@@ -24,12 +271,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger responses for clients that accept gzip
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Collect per-stage timings for each request into Server-Timing and /metrics."""
+    with collect() as timings:
+        started = time.perf_counter()
+        response = await call_next(request)
+        elapsed = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    endpoint = getattr(route, "path", "unmatched")
+    request_seconds.observe(elapsed, endpoint=endpoint)
+    for name, seconds in timings.stages.items():
+        stage_seconds.observe(seconds, endpoint=endpoint, stage=name)
+    for name, amount in timings.counts.items():
+        work_total.inc(amount, kind=name)
+    if timings.stages:
+        response.headers["Server-Timing"] = f"{timings.server_timing()}, total;dur={elapsed * 1000:.1f}"
+    return response
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Server busy ({exc.queue_name} queue full). Retry shortly."},
+        headers={"Retry-After": "5"},
+    )
+
+@app.exception_handler(JobLimitError)
+async def job_limit_handler(request: Request, exc: JobLimitError):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": f"Too many queued jobs (limit {exc.limit}). Wait for some to finish."},
+        headers={"Retry-After": "30"},
+    )
+
+@app.exception_handler(WorkerCrashedError)
+async def worker_crashed_handler(request: Request, exc: WorkerCrashedError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"{exc} Retry shortly; very large runs may exceed the worker memory."},
+        headers={"Retry-After": "5"},
+    )
+
+@app.exception_handler(QueueTimeoutError)
+async def queue_timeout_handler(request: Request, exc: QueueTimeoutError):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
 # --- Models ---
 
 class ContributionTranche(BaseModel):
     years: int
     monthly_amount: float
 
+class AssetWeight(BaseModel):
+    ticker: str
+    weight: float = Field(..., gt=0)
+
 class SimulationRequest(BaseModel):
     initial_capital: float
     contribution_schedule: List[ContributionTranche]
@@ -41,6 +342,57 @@ class SimulationRequest(BaseModel):
     custom_return: Optional[float] = None
     custom_volatility: Optional[float] = None
     t_df: int = 3
+    num_simulations: int = Field(1000, ge=1, le=MAX_SIMULATIONS)
+    # Same seed + same shard count => identical results
+    seed: Optional[int] = Field(None, ge=0)
+    shards: Optional[int] = Field(None, ge=1, le=64)
+    # Multi-asset portfolio; when set, ticker/custom_* are ignored
+    assets: Optional[List[AssetWeight]] = Field(None, min_length=1, max_length=MAX_PORTFOLIO_ASSETS)
+    rebalance_every: int = Field(1, ge=0)  # years between rebalances, 0 = never
+    max_points: Optional[int] = Field(None, ge=2)  # downsample the fan chart
+    # Variance reduction: same precision with fewer paths (see simulation.estimates)
+    sampling: Literal["pseudo", "antithetic", "sobol"] = "pseudo"
+    control_variate: bool = False
+    # Adaptive mode: simulate in batches until the precision targets are met
+    # (num_simulations is then ignored in favour of the path/time budgets)
+    adaptive: bool = False
+    tolerance: float = Field(0.5, gt=0)  # success probability CI half-width, in %
+    median_tolerance: float = Field(0.01, gt=0)  # relative std error of the median
+    max_simulations: Optional[int] = Field(None, ge=1, le=MAX_SIMULATIONS)  # path budget
+    time_budget: Optional[float] = Field(None, gt=0)  # seconds
+    # Return model: parametric (t-Student + injected crashes) or a block
+    # bootstrap of the ticker's/assets' monthly history
+    return_model: Literal["parametric", "bootstrap"] = "parametric"
+    bootstrap_method: Literal["stationary", "fixed"] = "stationary"
+    block_length: int = Field(12, ge=1, le=120)  # months (mean length if stationary)
+    # Monthly steps (returns, crashes and contributions month by month, reported
+    # per year) and, only then, stochastic AR(1) inflation around inflation_rate
+    time_step: Literal["annual", "monthly"] = "annual"
+    inflation_volatility: Optional[float] = Field(None, gt=0, le=0.2)  # sd of annual inflation, decimal
+    inflation_persistence: float = Field(0.9, ge=0, lt=1)  # month-to-month AR(1) coefficient
+    inflation_return_correlation: float = Field(0.0, ge=-1, le=1)
+
+class ScenarioOverride(BaseModel):
+    """Fields of a SimulationRequest that a sweep scenario may change."""
+    # Anything else (sampling, assets...) is an error rather than silently ignored
+    model_config = ConfigDict(extra="forbid")
+
+    label: Optional[str] = None
+    initial_capital: Optional[float] = None
+    contribution_schedule: Optional[List[ContributionTranche]] = None
+    custom_return: Optional[float] = None
+    custom_volatility: Optional[float] = None
+    black_swan_enabled: Optional[bool] = None
+    inflation_rate: Optional[float] = None
+    financial_goal: Optional[float] = None
+
+class BatchSimulationRequest(BaseModel):
+    base: SimulationRequest
+    scenarios: List[ScenarioOverride] = Field(..., min_length=1, max_length=MAX_BATCH_SCENARIOS)
+
+class ContributionSolverRequest(SimulationRequest):
+    # Desired success probability, in % like success_probability
+    target_probability: float = Field(90.0, gt=0, lt=100)
 
 class BacktestRequest(BaseModel):
     initial_capital: float
@@ -48,76 +400,210 @@ class BacktestRequest(BaseModel):
     ticker: str
     start_year: int
     inflation_rate: float # To calculate real values
+    max_points: Optional[int] = Field(None, ge=2)  # downsample the history
+
+class RollingBacktestRequest(BaseModel):
+    initial_capital: float
+    contribution_schedule: List[ContributionTranche]
+    ticker: str
+    inflation_rate: float
+    start_year: Optional[int] = None # Earliest history to use (None = all)
 
 class TickerSearchResponse(BaseModel):
     symbol: str
     shortName: Optional[str] = None
+    exchange: Optional[str] = None
 
 # --- Endpoints ---
 
+@app.get("/health")
+async def health():
+    """Liveness probe; never waits on the work queues."""
+    return {"status": "ok", "warmup": warmup_state["status"], "queues": {"io": io_queue.stats(), "cpu": cpu_queue.stats()}}
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 503 until the warm-up has finished (even if some tickers
+    failed) and while the simulation pool is broken and cannot be replaced.
+    """
+    state = {**warmup_state, "cpu_pool": "ok" if cpu_queue.recover() else "broken"}
+    if state["status"] != "done" or state["cpu_pool"] != "ok":
+        return JSONResponse(status_code=503, content=state)
+    return state
+
 @app.get("/tickers/search", response_model=List[TickerSearchResponse])
-def search_tickers(query: str):
+async def search_tickers(query: str, limit: int = Query(10, ge=1, le=50)):
     """
-    Search for tickers using Yahoo Finance.
-    Note: yfinance doesn't have a direct search method exposed easily without private APIs or scraping.
-    However, we can try to use a known list or a simple lookup if the user provides a valid ticker.
-    For a real search, we might need an external API or a workaround.
-    
-    For this implementation, we will try to fetch info for the exact ticker 
-    or return a dummy list if it's a keyword search (since yfinance search is limited).
+    Search the local ticker index by symbol prefix or company/fund name
+    (prefix, with typo tolerance). No network calls: lookups run in memory.
+
+    A symbol-like query with no match is echoed back without a name, so
+    tickers missing from the index can still be simulated.
     """
     try:
-        # Simple check if it's a valid ticker
-        ticker = yf.Ticker(query)
-        info = ticker.info
-        if info and 'symbol' in info:
-             return [{"symbol": info['symbol'], "shortName": info.get('shortName', info.get('longName'))}]
-        return []
-    except:
-        return []
+        results = ticker_index.search(query, limit=limit)
+    except OSError:
+        raise HTTPException(status_code=503, detail="Ticker index is not available.")
+    symbol = query.strip().upper()
+    if not results and TICKER_SYMBOL_RE.match(symbol):
+        results = [{"symbol": symbol, "shortName": None, "exchange": None}]
+    return results
 
-@app.post("/simulate")
-def simulate(request: SimulationRequest):
-    # 1. Get Stats for Ticker
+@app.get("/metrics")
+def metrics():
+    """Process-wide counters and stage latencies in Prometheus text format."""
+    return Response(metrics_registry.render(), media_type=Registry.content_type)
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters of the in-process caches, to help size them."""
+    return {
+        "ticker_stats": ticker_stats_cache.stats(),
+        "asset_covariance": asset_covariance_cache.stats(),
+        "monthly_returns": monthly_returns_cache.stats(),
+        "results": result_cache.stats(),
+    }
+
+# SimulationRequest options that only /simulate (and its stream/job variants)
+# use: the engine features plus their tuning knobs, sharding and downsampling.
+# /simulate/batch and /solve/contribution reject them rather than drop them.
+ENGINE_ONLY_OPTIONS = (
+    "shards", "assets", "rebalance_every", "max_points", "sampling", "control_variate",
+    "adaptive", "tolerance", "median_tolerance", "max_simulations", "time_budget",
+    "return_model", "bootstrap_method", "block_length",
+    "time_step", "inflation_volatility", "inflation_persistence", "inflation_return_correlation",
+)
+
+def reject_engine_only_options(request: SimulationRequest, endpoint: str):
+    """400 if request sets options that endpoint would otherwise silently ignore."""
+    fields = type(request).model_fields
+    unsupported = [name for name in ENGINE_ONLY_OPTIONS if getattr(request, name) != fields[name].default]
+    if unsupported:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{endpoint} simulates single-asset parametric annual paths in one run and does not use: "
+                   f"{', '.join(unsupported)}."
+        )
+
+async def resolve_return_assumptions(request: SimulationRequest):
+    """Mean return and volatility for a request: custom values or cached ticker stats."""
     if request.ticker == 'CUSTOM' and request.custom_return is not None and request.custom_volatility is not None:
-        mean_return = request.custom_return / 100.0
-        volatility = request.custom_volatility / 100.0
+        return request.custom_return / 100.0, request.custom_volatility / 100.0, None
+
+    stats = await run_timed(io_queue, get_ticker_stats, ticker=request.ticker)
+    if not stats:
+        raise HTTPException(status_code=404, detail=f"Ticker {request.ticker} not found or no data available.")
+    return stats["mean_return"], stats["volatility"], stats
+
+async def resolve_portfolio(request: SimulationRequest):
+    """Portfolio inputs for run_monte_carlo_simulation plus JSON-friendly stats."""
+    assets = sorted(request.assets, key=lambda a: a.ticker.upper())
+    tickers = tuple(a.ticker.upper() for a in assets)
+    if len(set(tickers)) != len(tickers):
+        raise HTTPException(status_code=400, detail="Each ticker may appear only once in assets.")
+
+    covariance = await run_timed(io_queue, get_asset_covariance, tickers=tickers)
+    if not covariance:
+        raise HTTPException(status_code=404, detail=f"No aligned history available for {', '.join(tickers)}.")
+
+    weights = [a.weight for a in assets]
+    portfolio_stats = calculate_portfolio_stats(list(tickers), weights, covariance=covariance)
+    portfolio = {
+        "mean_returns": covariance["mean_returns"],
+        "cholesky": covariance["cholesky"],
+        "weights": weights,
+        "rebalance_every": request.rebalance_every,
+    }
+    stats = {
+        "mean_return": portfolio_stats["mean_return"],
+        "volatility": portfolio_stats["volatility"],
+        "data_points": portfolio_stats["data_points"],
+        "assets": [
+            {
+                "ticker": ticker,
+                "weight": float(weight),
+                "mean_return": portfolio_stats["details"][ticker]["return"],
+                "volatility": portfolio_stats["details"][ticker]["vol"],
+            }
+            for ticker, weight in zip(tickers, portfolio_stats["weights"])
+        ],
+        "correlation": portfolio_stats["correlation"].tolist(),
+    }
+    return portfolio, stats
+
+async def resolve_bootstrap(request: SimulationRequest):
+    """Block-bootstrap inputs: the cached monthly history of the ticker or portfolio assets."""
+    if request.sampling != "pseudo" or request.control_variate:
+        raise HTTPException(status_code=400, detail="The bootstrap return model only supports pseudo-random sampling without a control variate.")
+    if request.assets:
+        # Same (sorted) column order as the portfolio weights
+        tickers = tuple(sorted(a.ticker.upper() for a in request.assets))
+    elif request.ticker.upper() == "CUSTOM":
+        raise HTTPException(status_code=400, detail="The bootstrap return model needs a ticker with price history, not CUSTOM.")
     else:
-        stats = get_historical_stats(request.ticker)
-        if not stats:
-            raise HTTPException(status_code=404, detail=f"Ticker {request.ticker} not found or no data available.")
-        
-        mean_return = stats["mean_return"]
-        volatility = stats["volatility"]
-    
-    # 2. Prepare Schedule
-    schedule = [(t.years, t.monthly_amount) for t in request.contribution_schedule]
-    
-    # 3. Run Simulation
-    summary_df, median_details, breakdown_df, simulation_stats, final_balances_real = run_monte_carlo_simulation(
-        initial_capital=request.initial_capital,
-        contribution_schedule=schedule,
-        mean_return=mean_return,
-        volatility=volatility,
-        inflation_rate=request.inflation_rate,
-        black_swan_enabled=request.black_swan_enabled,
-        t_df=request.t_df
-    )
-    
-    # 4. Process Results
-    
-    # Fan Chart Data
-    fan_chart = summary_df[["Year", "Invested", "Invested_Real", "P10_Nominal", "Median_Nominal", "P90_Nominal", "P10_Real", "Median_Real", "P90_Real"]].to_dict(orient="records")
+        tickers = (request.ticker.upper(),)
+
+    with stage("history"):
+        log_returns = await run_timed(io_queue, get_monthly_returns, tickers=tickers)
+    if log_returns is None:
+        raise HTTPException(status_code=404, detail=f"Not enough monthly history to bootstrap {', '.join(tickers)}.")
+    return {"log_returns": log_returns, "block_length": request.block_length, "method": request.bootstrap_method}
+
+def result_cache_key(request: SimulationRequest, stats, shards, fmt):
+    """
+    Canonical hash of everything that determines a /simulate response.
+
+    Fields that the run ignores are dropped (custom_* unless ticker is
+    CUSTOM, ticker for portfolios) and assets are sorted, so equivalent
+    requests share an entry. The ticker stats act as a version: when the
+    cached statistics change, older results stop matching.
+    """
+    normalized = request.model_dump(mode="json")
+    if request.assets:
+        normalized["assets"] = sorted(
+            ({"ticker": a.ticker.upper(), "weight": a.weight} for a in request.assets),
+            key=lambda a: a["ticker"]
+        )
+        normalized["ticker"] = normalized["custom_return"] = normalized["custom_volatility"] = None
+        normalized["rebalance_every"] = request.rebalance_every
+    else:
+        normalized["ticker"] = request.ticker.upper()
+        normalized["rebalance_every"] = None
+        if normalized["ticker"] != "CUSTOM" or stats is not None:
+            normalized["custom_return"] = normalized["custom_volatility"] = None
+    normalized["shards"] = shards
+    normalized["format"] = fmt
+    normalized["ticker_stats"] = stats
+
+    canonical = json.dumps(normalized, sort_keys=True, separators=(",", ":"), default=float)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+FAN_CHART_COLUMNS = ["Year", "Invested", "Invested_Real", "P10_Nominal", "Median_Nominal", "P90_Nominal", "P10_Real", "Median_Real", "P90_Real"]
+
+def build_simulation_payload(request: SimulationRequest, outputs, stats, seed, shards, columnar=False):
+    """
+    Shape run_monte_carlo_simulation outputs into the /simulate response.
+
+    Tables are read column by column from the DataFrames and, unless
+    columnar is set, zipped back into the classic list of row objects.
+    """
+    summary_df, median_details, breakdown_df, simulation_stats, final_balances_real = outputs
+    adaptive = simulation_stats["mode"] == "adaptive"
+
+    # Fan Chart Data (optionally downsampled to max_points years)
+    indices = downsample_indices(len(summary_df), request.max_points)
+    fan_chart = frame_columns(summary_df, FAN_CHART_COLUMNS, indices)
     
     # Portfolio Composition Data (Stacked Bar)
-    portfolio_composition = breakdown_df.to_dict(orient="records")
+    portfolio_composition = frame_columns(breakdown_df)
     
     # Median Scenario Breakdown
     # median_details is a list of dicts
     
     # Calculate KPIs for the median scenario
     # We need total contributed. breakdown_df has cumulative contributions.
-    total_contributed = breakdown_df["Aportaciones"].iloc[-1]
+    total_contributed = portfolio_composition["Aportaciones"][-1]
     median_final_balance = median_details[-1]["Saldo Final"] if median_details else request.initial_capital
     
     kpis = calculate_kpis(
@@ -129,27 +615,387 @@ def simulate(request: SimulationRequest):
 
     # Risk Metrics
     # Success Probability: % of simulations where final real balance >= financial_goal
-    success_count = np.sum(final_balances_real >= request.financial_goal)
-    success_prob = float((success_count / len(final_balances_real)) * 100)
+    # (estimated by the engine, with the sampling mode's confidence interval)
+    success = simulation_stats["estimates"]["success_probability"]
+    risk = simulation_stats["risk"]
+
+    if columnar:
+        median_scenario = records_columns(median_details)
+    else:
+        fan_chart = columns_records(fan_chart)
+        portfolio_composition = columns_records(portfolio_composition)
+        median_scenario = median_details
+    bootstrap = simulation_stats.get("bootstrap")
     
     return {
+        "format": "columnar" if columnar else "rows",
         "fan_chart": fan_chart,
         "portfolio_composition": portfolio_composition,
-        "median_scenario": median_details,
+        "median_scenario": median_scenario,
         "kpis": kpis,
         "risk_metrics": {
             "max_drawdown": float(simulation_stats["max_drawdown"]),
-            "success_probability": success_prob,
-            "median_final_balance_real": float(np.median(final_balances_real))
+            "success_probability": success["value"],
+            "success_probability_ci": [success["ci_low"], success["ci_high"]],
+            "median_final_balance_real": float(np.median(final_balances_real)),
+            # Across all paths (max_drawdown above is the median scenario's)
+            "max_drawdown_distribution": risk["max_drawdown"],
+            "value_at_risk": risk["value_at_risk"],
+            "time_to_goal": risk["time_to_goal"],
+            "probability_below_invested": risk["probability_below_invested"]
         },
-        "ticker_stats": stats
+        "ticker_stats": stats,
+        "simulation": {
+            "num_simulations": simulation_stats["paths"] if adaptive else request.num_simulations,
+            "seed": seed,
+            "shards": shards,
+            "sampling": simulation_stats["sampling"],
+            "control_variate": simulation_stats["control_variate"],
+            "confidence_level": simulation_stats["confidence_level"],
+            "return_model": "bootstrap" if bootstrap else "parametric",
+            "bootstrap": bootstrap,
+            "time_step": simulation_stats["time_step"],
+            "inflation_model": simulation_stats["inflation_model"],
+            "estimates": simulation_stats["estimates"],
+            "adaptive": {
+                key: simulation_stats[key]
+                for key in ("batches", "stop_reason", "tolerance", "precision", "elapsed_seconds")
+            } if adaptive else None
+        }
+    }
+
+async def resolve_run_options(request: SimulationRequest):
+    """
+    Inputs shared by /simulate and /simulate/stream: return assumptions (or
+    portfolio / bootstrap history) and the schedule, validated.
+
+    Returns:
+        tuple: (run_options for the engine without the seed, ticker stats)
+    """
+    # 1. Get Stats for Ticker (or the covariance of a multi-asset portfolio)
+    portfolio = None
+    with stage("stats"):
+        if request.assets:
+            portfolio, stats = await resolve_portfolio(request)
+            mean_return, volatility = stats["mean_return"], stats["volatility"]
+        else:
+            mean_return, volatility, stats = await resolve_return_assumptions(request)
+    
+    # 2. Prepare Schedule
+    schedule = [(t.years, t.monthly_amount) for t in request.contribution_schedule]
+    
+    if request.sampling == "sobol" and importlib.util.find_spec("scipy") is None:
+        raise HTTPException(status_code=400, detail="Sobol sampling is not available on this server (scipy is not installed).")
+
+    if request.time_step == "monthly" and request.assets:
+        raise HTTPException(status_code=400, detail="Monthly steps are not available for multi-asset portfolios.")
+    inflation_model = None
+    if request.inflation_volatility is not None:
+        if request.time_step != "monthly":
+            raise HTTPException(status_code=400, detail="Stochastic inflation needs time_step 'monthly'.")
+        inflation_model = {
+            "volatility": request.inflation_volatility,
+            "persistence": request.inflation_persistence,
+            "correlation": request.inflation_return_correlation,
+        }
+
+    bootstrap = None
+    if request.return_model == "bootstrap":
+        bootstrap = await resolve_bootstrap(request)
+
+    run_options = dict(
+        initial_capital=request.initial_capital,
+        contribution_schedule=schedule,
+        mean_return=mean_return,
+        volatility=volatility,
+        inflation_rate=request.inflation_rate,
+        black_swan_enabled=request.black_swan_enabled,
+        t_df=request.t_df,
+        portfolio=portfolio,
+        sampling=request.sampling,
+        control_variate=request.control_variate,
+        financial_goal=request.financial_goal,
+        bootstrap=bootstrap,
+        time_step=request.time_step,
+        inflation_model=inflation_model
+    )
+    return run_options, stats
+
+def default_shards(request: SimulationRequest):
+    return request.shards or (SIM_SHARDS if request.num_simulations >= SHARD_MIN_PATHS else 1)
+
+async def run_adaptive(request: SimulationRequest, run_options, seed, profile=False):
+    """run_adaptive_simulation with the request's precision targets, on the CPU queue."""
+    return await run_timed(
+        cpu_queue, run_adaptive_simulation, profile=profile,
+        tolerance=request.tolerance,
+        median_tolerance=request.median_tolerance,
+        batch_size=ADAPTIVE_BATCH_SIZE,
+        max_paths=request.max_simulations or ADAPTIVE_MAX_PATHS,
+        time_budget=request.time_budget,
+        seed=seed,
+        **run_options
+    )
+
+@app.post("/simulate")
+async def simulate(request: SimulationRequest, http_request: Request):
+    profile = profiling_requested(http_request)
+    run_options, stats = await resolve_run_options(request)
+
+    # 3. Serve repeated requests from the result cache (profiled runs always simulate)
+    shards = default_shards(request)
+    fmt = negotiate_format(http_request)
+    with stage("result_cache"):
+        cache_key = result_cache_key(request, stats, shards, fmt)
+        cached = None if profile else result_cache.get(cache_key)
+    if cached is not None:
+        body, media_type = cached
+        return Response(body, media_type=media_type, headers={"X-Cache": "HIT"})
+
+    # 4. Run Simulation
+    # Always report the seed used so any run can be reproduced later
+    seed = request.seed if request.seed is not None else secrets.randbits(32)
+    if request.adaptive:
+        # Batches run one after another in a single worker
+        shards = 1
+        outputs = await run_adaptive(request, run_options, seed, profile=profile)
+    else:
+        outputs = await run_simulation(
+            num_simulations=request.num_simulations, shards=shards, profile=profile, seed=seed, **run_options
+        )
+    
+    # 5. Process Results
+    with stage("payload"):
+        payload = build_simulation_payload(request, outputs, stats, seed, shards, columnar=(fmt != "json"))
+    if profile:
+        payload["profile"] = current_timings().profiles
+        with stage("serialize"):
+            return encode_response(payload, fmt, headers={"X-Cache": "BYPASS"})
+
+    with stage("serialize"):
+        response = encode_response(payload, fmt, headers={"X-Cache": "MISS"})
+    result_cache.set(cache_key, response.body, response.media_type)
+    return response
+
+# Streaming runs in this process, by run id, so they can be cancelled
+active_streams = {}
+
+def sse_event(event, data):
+    """One Server-Sent Events message; data is a dict or already-encoded JSON bytes."""
+    if not isinstance(data, bytes):
+        data = json.dumps(data, separators=(",", ":"), default=float).encode("utf-8")
+    return b"event: " + event.encode("ascii") + b"\ndata: " + data + b"\n\n"
+
+def progress_payload(request: SimulationRequest, snapshot, columnar=False):
+    """Partial fan chart and running success probability of a streaming run."""
+    import pandas as pd
+
+    years = snapshot["fan_nominal"].shape[1]
+    indices = downsample_indices(years, request.max_points)
+    columns = {"Year": np.arange(years)}
+    for i, name in enumerate(("P10", "Median", "P90")):
+        columns[f"{name}_Nominal"] = snapshot["fan_nominal"][i]
+        columns[f"{name}_Real"] = snapshot["fan_real"][i]
+    fan_chart = frame_columns(pd.DataFrame(columns), indices=indices)
+    success = snapshot["estimates"]["success_probability"]
+    return {
+        "paths_done": snapshot["paths"],
+        "num_simulations": request.num_simulations,
+        "fan_chart": fan_chart if columnar else columns_records(fan_chart),
+        "success_probability": success["value"],
+        "success_probability_ci": [success["ci_low"], success["ci_high"]],
+        "median_final_balance_real": snapshot["estimates"]["median_final_real"]["value"],
+    }
+
+async def progressive_batches(progressive: ProgressiveSimulation, shards):
+    """
+    Run the batches of a progressive simulation on the CPU queue, at most
+    `shards` in flight. Yields the number of batches that completed after
+    every poll interval (0 when none did) so callers can report progress or
+    stop; closing the generator drops the batches that have not started.
+    """
+    pending = {}
+    next_batch = 0
+
+    def submit_batches():
+        nonlocal next_batch
+        while next_batch < len(progressive.batches) and len(pending) < shards:
+            work = run_timed(cpu_queue, simulate_progressive_batch, spec=progressive.spec, blocks=progressive.batches[next_batch])
+            pending[asyncio.ensure_future(work)] = next_batch
+            next_batch += 1
+
+    try:
+        submit_batches()
+        while pending:
+            done, _ = await asyncio.wait(pending, timeout=STREAM_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                progressive.add(pending.pop(task), task.result())
+            # Keep the workers busy while the caller summarizes progress
+            submit_batches()
+            yield len(done)
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def stream_simulation(request: SimulationRequest, http_request: Request, run_id, cancel, run_options, stats, seed, shards, fmt, cache_key):
+    """
+    Event generator of /simulate/stream: 'start', 'progress' after each
+    completed batch, then 'result' (the /simulate body), 'cancelled' or
+    'error'. At most `shards` batches are in flight; on cancellation or
+    disconnect, batches that have not started are dropped.
+    """
+    columnar = fmt != "json"
+    try:
+        yield sse_event("start", {"run_id": run_id, "seed": seed, "num_simulations": request.num_simulations, "shards": shards})
+
+        progressive = ProgressiveSimulation(num_simulations=request.num_simulations, shards=shards, seed=seed, **run_options)
+        if progressive.in_memory:
+            # Small enough to finish in one go: only the final result is sent
+            outputs = await run_simulation(num_simulations=request.num_simulations, shards=1, seed=seed, **run_options)
+        else:
+            async with aclosing(progressive_batches(progressive, shards)) as batches:
+                async for completed in batches:
+                    if cancel.is_set() or await http_request.is_disconnected():
+                        yield sse_event("cancelled", {"run_id": run_id, "paths_done": progressive.paths_done})
+                        return
+                    if completed and progressive.paths_done < request.num_simulations:
+                        try:
+                            snapshot = await run_timed(cpu_queue, progressive.snapshot, queue_options={"run_on": shard_coordinators})
+                        except QueueFullError:
+                            # Progress is best effort: skip this update rather than fail the run
+                            continue
+                        yield sse_event("progress", progress_payload(request, snapshot, columnar))
+
+            outputs = await run_timed(cpu_queue, progressive.finish, queue_options={"run_on": shard_coordinators})
+
+        payload = build_simulation_payload(request, outputs, stats, seed, shards, columnar=columnar)
+        body = JSONResponse(payload).body
+        result_cache.set(cache_key, body, "application/json")
+        yield sse_event("result", body)
+    except (QueueFullError, QueueTimeoutError) as e:
+        status = 503 if isinstance(e, QueueFullError) else 504
+        yield sse_event("error", {"status": status, "detail": str(e)})
+    finally:
+        active_streams.pop(run_id, None)
+
+@app.post("/simulate/stream")
+async def simulate_stream(request: SimulationRequest, http_request: Request):
+    """
+    /simulate as Server-Sent Events: partial percentiles and the running
+    success probability arrive as path batches complete, and the final
+    'result' event carries the same body /simulate returns (same seed and
+    shards give the same numbers). Cancel with DELETE /simulate/stream/{run_id}
+    or by closing the connection.
+    """
+    if request.adaptive:
+        raise HTTPException(status_code=400, detail="Adaptive runs are not streamed; use /simulate.")
+    # MessagePack does not fit in an event stream: columnar JSON instead
+    fmt = "columnar" if negotiate_format(http_request) != "json" else "json"
+    run_options, stats = await resolve_run_options(request)
+
+    shards = default_shards(request)
+    cache_key = result_cache_key(request, stats, shards, fmt)
+    cached = result_cache.get(cache_key)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if cached is not None:
+        body, _ = cached
+        return StreamingResponse(iter([sse_event("result", body)]), media_type="text/event-stream", headers={**headers, "X-Cache": "HIT"})
+
+    seed = request.seed if request.seed is not None else secrets.randbits(32)
+    run_id = secrets.token_hex(8)
+    cancel = active_streams[run_id] = asyncio.Event()
+    events = stream_simulation(request, http_request, run_id, cancel, run_options, stats, seed, shards, fmt, cache_key)
+    return StreamingResponse(events, media_type="text/event-stream", headers={**headers, "X-Cache": "MISS", "X-Run-Id": run_id})
+
+@app.delete("/simulate/stream/{run_id}")
+async def cancel_stream(run_id: str):
+    """Stop a streaming run; batches already running finish, the rest are dropped."""
+    cancel = active_streams.get(run_id)
+    if cancel is None:
+        raise HTTPException(status_code=404, detail=f"No active stream {run_id}.")
+    cancel.set()
+    return {"run_id": run_id, "status": "cancelling"}
+
+@app.post("/simulate/batch")
+async def simulate_batch(request: BatchSimulationRequest):
+    """
+    Compare variants of one plan. Ticker stats are fetched once and every
+    scenario reuses the same random draws (common random numbers), so the
+    differences between scenarios are not masked by sampling noise.
+    """
+    base = request.base
+    reject_engine_only_options(base, "/simulate/batch")
+    mean_return, volatility, stats = await resolve_return_assumptions(base)
+
+    scenarios = []
+    for override in request.scenarios:
+        scenario = override.model_dump(exclude_none=True, exclude={"custom_return", "custom_volatility", "contribution_schedule"})
+        if override.contribution_schedule is not None:
+            scenario["contribution_schedule"] = [(t.years, t.monthly_amount) for t in override.contribution_schedule]
+        if override.custom_return is not None:
+            scenario["mean_return"] = override.custom_return / 100.0
+        if override.custom_volatility is not None:
+            scenario["volatility"] = override.custom_volatility / 100.0
+        scenarios.append(scenario)
+
+    seed = base.seed if base.seed is not None else secrets.randbits(32)
+    results = await run_timed(
+        cpu_queue, run_parameter_sweep,
+        initial_capital=base.initial_capital,
+        contribution_schedule=[(t.years, t.monthly_amount) for t in base.contribution_schedule],
+        scenarios=scenarios,
+        mean_return=mean_return,
+        volatility=volatility,
+        black_swan_enabled=base.black_swan_enabled,
+        inflation_rate=base.inflation_rate,
+        financial_goal=base.financial_goal,
+        num_simulations=base.num_simulations,
+        t_df=base.t_df,
+        seed=seed
+    )
+
+    return {
+        "scenarios": results,
+        "ticker_stats": stats,
+        "simulation": {"num_simulations": base.num_simulations, "seed": seed}
     }
 
+@app.post("/solve/contribution")
+async def solve_contribution(request: ContributionSolverRequest):
+    """
+    Minimum scale of the contribution schedule that reaches financial_goal
+    with target_probability. One set of return paths is drawn and reused for
+    every candidate contribution level, so it costs about one simulation.
+    """
+    reject_engine_only_options(request, "/solve/contribution")
+    mean_return, volatility, stats = await resolve_return_assumptions(request)
+
+    seed = request.seed if request.seed is not None else secrets.randbits(32)
+    result = await run_timed(
+        cpu_queue, solve_contribution_for_goal,
+        initial_capital=request.initial_capital,
+        contribution_schedule=[(t.years, t.monthly_amount) for t in request.contribution_schedule],
+        financial_goal=request.financial_goal,
+        target_probability=request.target_probability / 100.0,
+        mean_return=mean_return,
+        volatility=volatility,
+        black_swan_enabled=request.black_swan_enabled,
+        inflation_rate=request.inflation_rate,
+        num_simulations=request.num_simulations,
+        t_df=request.t_df,
+        seed=seed
+    )
+
+    result["ticker_stats"] = stats
+    result["simulation"] = {"num_simulations": request.num_simulations, "seed": seed}
+    return result
+
 @app.post("/backtest")
-def backtest(request: BacktestRequest):
+async def backtest(request: BacktestRequest, http_request: Request):
     schedule = [(t.years, t.monthly_amount) for t in request.contribution_schedule]
     
-    result = run_backtest(
+    result = await run_timed(
+        io_queue, run_backtest,
         initial_capital=request.initial_capital,
         contribution_schedule=schedule,
         ticker=request.ticker,
@@ -159,5 +1005,143 @@ def backtest(request: BacktestRequest):
     
     if not result:
         raise HTTPException(status_code=404, detail="Could not run backtest. Check ticker or date.")
-        
+
+    fmt = negotiate_format(http_request)
+    indices = downsample_indices(len(result["history"]), request.max_points)
+    if fmt != "json":
+        result["history"] = records_columns(result["history"], indices)
+    elif indices is not None:
+        result["history"] = [result["history"][i] for i in indices]
+    return encode_response(result, fmt)
+
+@app.post("/backtest/rolling")
+async def rolling_backtest(request: RollingBacktestRequest):
+    """Backtest the plan from every possible start month in the ticker's history."""
+    schedule = [(t.years, t.monthly_amount) for t in request.contribution_schedule]
+
+    result = await run_timed(
+        io_queue, run_rolling_backtest,
+        initial_capital=request.initial_capital,
+        contribution_schedule=schedule,
+        ticker=request.ticker,
+        inflation_rate=request.inflation_rate,
+        start_year=request.start_year
+    )
+
+    if not result:
+        raise HTTPException(status_code=404, detail="Could not run rolling backtest. Check ticker or plan length versus available history.")
+
     return result
+
+# --- Background jobs ---
+
+def job_client(http_request: Request):
+    """Who a job belongs to, for the per-client limits: X-Client-Id or the peer address."""
+    return http_request.headers.get("x-client-id") or (http_request.client.host if http_request.client else "unknown")
+
+def job_runner(run):
+    """
+    Wrap run(job) -> result for the job queue: HTTP and timeout errors fail
+    the job with their status, dict results are encoded as JSON, and stage
+    timings go to /metrics under the job kind (no request is there to carry
+    them).
+    """
+    async def run_job(job):
+        with collect() as timings:
+            try:
+                result = await run(job)
+            except HTTPException as e:
+                raise JobFailed(e.status_code, e.detail)
+            except QueueTimeoutError as e:
+                raise JobFailed(504, str(e))
+        for name, seconds in timings.stages.items():
+            stage_seconds.observe(seconds, endpoint=f"job:{job.kind}", stage=name)
+        for name, amount in timings.counts.items():
+            work_total.inc(amount, kind=name)
+        if isinstance(result, dict):
+            return JSONResponse(result).body, "application/json"
+        return result
+    return run_job
+
+def submit_job(kind, http_request: Request, run, priority):
+    job = job_queue.submit(kind, job_client(http_request), job_runner(run), priority=priority)
+    return JSONResponse(job.describe(), status_code=202, headers={"Location": f"/jobs/{job.id}"})
+
+async def simulation_job(job, request: SimulationRequest):
+    """/simulate as a job: same result (and result cache), progress per completed batch."""
+    run_options, stats = await resolve_run_options(request)
+    shards = default_shards(request)
+    cache_key = result_cache_key(request, stats, shards, "json")
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    seed = request.seed if request.seed is not None else secrets.randbits(32)
+    if request.adaptive:
+        shards = 1
+        outputs = await run_adaptive(request, run_options, seed)
+    else:
+        progressive = ProgressiveSimulation(num_simulations=request.num_simulations, shards=shards, seed=seed, **run_options)
+        if progressive.in_memory:
+            outputs = await run_simulation(num_simulations=request.num_simulations, shards=1, seed=seed, **run_options)
+        else:
+            async with aclosing(progressive_batches(progressive, shards)) as batches:
+                async for _ in batches:
+                    job.progress = progressive.paths_done / request.num_simulations
+            outputs = await run_timed(cpu_queue, progressive.finish, queue_options={"run_on": shard_coordinators})
+
+    payload = build_simulation_payload(request, outputs, stats, seed, shards)
+    body = JSONResponse(payload).body
+    result_cache.set(cache_key, body, "application/json")
+    return body, "application/json"
+
+JobPriority = Literal["high", "normal", "low"]
+
+@app.post("/jobs/simulate", status_code=202)
+async def submit_simulation_job(request: SimulationRequest, http_request: Request, priority: JobPriority = "normal"):
+    """Queue a /simulate run; poll GET /jobs/{job_id} and fetch GET /jobs/{job_id}/result."""
+    return submit_job("simulate", http_request, lambda job: simulation_job(job, request), priority)
+
+@app.post("/jobs/simulate/batch", status_code=202)
+async def submit_batch_job(request: BatchSimulationRequest, http_request: Request, priority: JobPriority = "normal"):
+    return submit_job("simulate_batch", http_request, lambda job: simulate_batch(request), priority)
+
+@app.post("/jobs/solve/contribution", status_code=202)
+async def submit_solver_job(request: ContributionSolverRequest, http_request: Request, priority: JobPriority = "normal"):
+    return submit_job("solve_contribution", http_request, lambda job: solve_contribution(request), priority)
+
+@app.post("/jobs/backtest/rolling", status_code=202)
+async def submit_rolling_backtest_job(request: RollingBacktestRequest, http_request: Request, priority: JobPriority = "normal"):
+    return submit_job("backtest_rolling", http_request, lambda job: rolling_backtest(request), priority)
+
+@app.get("/jobs/stats")
+async def job_stats():
+    return job_queue.stats()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No job {job_id} (unknown or expired).")
+    return job.describe()
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """The finished job's body, exactly as the synchronous endpoint returns it."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No job {job_id} (unknown or expired).")
+    if job.status == "failed":
+        raise HTTPException(status_code=job.error["status"], detail=job.error["detail"])
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.status}.")
+    body, media_type = job.result
+    return Response(body, media_type=media_type)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job (work already on a worker finishes but is discarded)."""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No job {job_id} (unknown or expired).")
+    return job.describe()
@@ -0,0 +1,385 @@
+"""
+Benchmark suite for the simulation, backtest and API hot paths.
+
+Runs offline against the deterministic OfflinePriceProvider (no Yahoo
+calls), so two runs on the same machine are directly comparable. Each case
+reports the median wall time over several repeats, throughput and the peak
+traced memory of one extra run under tracemalloc.
+
+Usage:
+    python benchmarks.py                       # full grid
+    python benchmarks.py --quick               # small grid, for a smoke check
+    python benchmarks.py --only monte_carlo    # one group
+    python benchmarks.py --save baseline.json
+    python benchmarks.py --compare baseline.json [--threshold 0.15]
+    python benchmarks.py --only startup [--startup-budget 1.5]
+    python benchmarks.py --check               # correctness checks only, no timings
+
+With --compare the exit code is 1 when any case is slower than the
+baseline by more than the threshold. The startup group times `import api`
+in a fresh interpreter; the exit code is also 1 when that exceeds the
+startup budget or when a heavy dependency is imported eagerly. --check
+runs a few fast correctness checks of the engine and one cold `import api`
+against --startup-budget instead of the timings, and exits with 1 when any
+of them fails.
+"""
+import os
+import tempfile
+
+# Must be set before the API (and its worker processes) read the configuration
+os.environ.setdefault("PRICE_DATA_PROVIDER", "offline")
+os.environ.setdefault("PRICE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "finance-sim-bench-prices"))
+
+import argparse
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from finance_sim import (
+    run_monte_carlo_simulation, run_backtest, run_rolling_backtest, calculate_weighted_stats,
+    get_monthly_log_returns, BOOTSTRAP_METHODS, _simulation_spec, _simulate_monthly_paths
+)
+from price_data import OfflinePriceProvider, PriceStore, set_price_store
+from ticker_index import TickerIndex
+
+BENCH_TICKER = "SPY"
+BENCH_PAIR = ("IWDA.AS", "EEM")
+BACKTEST_START_YEAR = 1995
+
+GROUPS = ("monte_carlo", "backtest", "weighted_stats", "ticker_search", "api", "startup")
+
+# Imported on first use only; `import api` must not load them
+LAZY_MODULES = ("pandas", "yfinance", "scipy", "plotly")
+STARTUP_CASE = "startup[import api]"
+
+
+def _schedule(years, monthly_amount=500.0):
+    return [(years, monthly_amount)]
+
+
+def _measure(fn, repeat):
+    """Median wall time of repeat calls plus traced peak memory of one more call."""
+    fn()  # warm-up: imports, caches, pool start-up
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        "peak_mb": peak / (1024 * 1024),
+    }
+
+
+def _monte_carlo_cases(quick):
+    paths = [1_000, 10_000] if quick else [1_000, 10_000, 100_000]
+    horizons = [10, 30] if quick else [10, 30, 50]
+    for num_paths in paths:
+        for years in horizons:
+            for black_swan in (False, True):
+                name = f"monte_carlo[paths={num_paths},years={years},black_swan={'on' if black_swan else 'off'}]"
+
+                def run(num_paths=num_paths, years=years, black_swan=black_swan):
+                    run_monte_carlo_simulation(
+                        initial_capital=10_000,
+                        contribution_schedule=_schedule(years),
+                        mean_return=0.08,
+                        volatility=0.15,
+                        black_swan_enabled=black_swan,
+                        num_simulations=num_paths,
+                        seed=42,
+                    )
+
+                yield name, run, {"unit": "paths*years/s", "work": num_paths * years}
+
+    # Block bootstrap of the benchmark ticker's monthly history, same plan as above
+    log_returns = get_monthly_log_returns([BENCH_TICKER])
+    num_paths = 10_000
+    years = 30
+    for method in BOOTSTRAP_METHODS:
+        name = f"monte_carlo_bootstrap[paths={num_paths},years={years},method={method}]"
+
+        def run(method=method):
+            run_monte_carlo_simulation(
+                initial_capital=10_000,
+                contribution_schedule=_schedule(years),
+                num_simulations=num_paths,
+                seed=42,
+                bootstrap={"log_returns": log_returns, "block_length": 12, "method": method},
+            )
+
+        yield name, run, {"unit": "paths*years/s", "work": num_paths * years}
+
+    # Monthly steps (480 months), with fixed and stochastic inflation
+    years = 40
+    for inflation in ("fixed", "stochastic"):
+        name = f"monte_carlo_monthly[paths={num_paths},years={years},inflation={inflation}]"
+
+        def run(inflation=inflation):
+            run_monte_carlo_simulation(
+                initial_capital=10_000,
+                contribution_schedule=_schedule(years),
+                num_simulations=num_paths,
+                seed=42,
+                time_step="monthly",
+                inflation_model={"volatility": 0.01, "correlation": -0.2} if inflation == "stochastic" else None,
+            )
+
+        yield name, run, {"unit": "paths*years/s", "work": num_paths * years}
+
+
+def _backtest_cases(quick):
+    def backtest():
+        run_backtest(10_000, _schedule(25), BENCH_TICKER, BACKTEST_START_YEAR, inflation_rate=0.02)
+
+    def rolling():
+        run_rolling_backtest(10_000, _schedule(20), BENCH_TICKER, inflation_rate=0.02)
+
+    yield f"backtest[{BENCH_TICKER},from={BACKTEST_START_YEAR}]", backtest, {"unit": "runs/s", "work": 1}
+    yield f"rolling_backtest[{BENCH_TICKER},years=20]", rolling, {"unit": "runs/s", "work": 1}
+
+
+def _weighted_stats_cases(quick):
+    def weighted():
+        calculate_weighted_stats(BENCH_PAIR[0], BENCH_PAIR[1], 0.6, period="20y")
+
+    yield f"weighted_stats[{BENCH_PAIR[0]}/{BENCH_PAIR[1]},20y]", weighted, {"unit": "runs/s", "work": 1}
+
+
+def _ticker_search_cases(quick):
+    index = TickerIndex()
+    index.load()
+    queries = {"symbol": "IWDA", "name": "vanguard world", "fuzzy": "ishars msci wrld"}
+    for kind, query in queries.items():
+        def search(query=query):
+            index.search(query)
+
+        yield f"ticker_search[{kind}]", search, {"unit": "queries/s", "work": 1}
+
+
+def _api_cases(quick):
+    from fastapi.testclient import TestClient
+    import api
+
+    seeds = iter(range(1, 10**9))
+    paths = [1_000] if quick else [1_000, 10_000]
+
+    # The client stays open (pools running) while the cases are consumed
+    with TestClient(api.app) as client:
+        for num_paths in paths:
+            def post(num_paths=num_paths):
+                # A fresh seed per call so the result cache never answers
+                response = client.post("/simulate", json={
+                    "initial_capital": 10_000,
+                    "contribution_schedule": [{"years": 30, "monthly_amount": 500}],
+                    "ticker": BENCH_TICKER,
+                    "inflation_rate": 0.02,
+                    "tax_rate": 0.19,
+                    "financial_goal": 500_000,
+                    "num_simulations": num_paths,
+                    "seed": next(seeds),
+                })
+                response.raise_for_status()
+
+            yield f"api_simulate[paths={num_paths},years=30]", post, {"unit": "requests/s", "work": 1}
+
+
+def _import_api():
+    """Import the API in a fresh interpreter; returns the lazy modules it loaded."""
+    code = f"import sys, api; print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True
+    ).stdout
+    return [m for m in output.strip().split(",") if m]
+
+
+def _startup_cases(quick):
+    yield STARTUP_CASE, _import_api, {"unit": "imports/s", "work": 1}
+
+
+def check_startup(results, budget):
+    """Print the cold import check; return the problems found."""
+    problems = []
+    seconds = results[STARTUP_CASE]["seconds"]
+    if seconds > budget:
+        problems.append(f"import api took {seconds:.2f}s (budget {budget:.2f}s)")
+    eager = _import_api()
+    if eager:
+        problems.append(f"imported eagerly: {', '.join(eager)}")
+    print(f"\nstartup: {'; '.join(problems) if problems else f'{seconds:.2f}s, within {budget:.2f}s'}")
+    return problems
+
+
+def _check_inflation_spec():
+    """The stochastic inflation model must not replace the return volatility."""
+    spec = _simulation_spec(
+        10_000, _schedule(10), 0.07, 0.15, False, 0.0, 0.02, 5,
+        time_step="monthly", inflation_model={"volatility": 0.01}
+    )
+    if spec["volatility"] != 0.15:
+        return f"inflation_model changed the return volatility to {spec['volatility']}"
+    if spec["inflation_model"]["volatility"] != 0.01:
+        return f"inflation volatility is {spec['inflation_model']['volatility']}, expected 0.01"
+    return None
+
+
+def _check_inflation_correlation():
+    """inflation_model's correlation must take effect in every mode that accepts it."""
+    modes = [
+        ("pseudo", {}), ("antithetic", {"sampling": "antithetic"}), ("sobol", {"sampling": "sobol"}),
+        ("control_variate", {"control_variate": True}),
+        ("bootstrap", {"bootstrap": {"log_returns": get_monthly_log_returns([BENCH_TICKER])}}),
+    ]
+    for name, options in modes:
+        signs = []
+        for correlation in (0.9, -0.9):
+            spec = _simulation_spec(
+                1.0, _schedule(5, 0.0), 0.07, 0.15, False, 0.0, 0.02, 5, time_step="monthly",
+                inflation_model={"volatility": 0.02, "persistence": 0.0, "correlation": correlation}, **options
+            )
+            nominal, real, returns, _ = _simulate_monthly_paths(spec, np.random.default_rng(0), 4_000)
+            inflation = (nominal[:, 1:] / real[:, 1:]) / (nominal[:, :-1] / real[:, :-1]) - 1.0
+            signs.append(np.sign(np.corrcoef(inflation.ravel(), returns.ravel())[0, 1]))
+        if signs != [1.0, -1.0]:
+            return f"correlation has no effect with {name}"
+    return None
+
+
+CHECKS = (_check_inflation_spec, _check_inflation_correlation)
+
+
+def _check_startup_budget(budget):
+    """A cold `import api` must fit the startup budget without heavy imports."""
+    started = time.perf_counter()
+    eager = _import_api()
+    seconds = time.perf_counter() - started
+    if seconds > budget:
+        return f"import api took {seconds:.2f}s (budget {budget:.2f}s)"
+    if eager:
+        return f"imported eagerly: {', '.join(eager)}"
+    return None
+
+
+def run_checks(startup_budget):
+    """Run the correctness and startup checks; return the problems found."""
+    checks = [(check.__name__.lstrip("_"), check) for check in CHECKS]
+    checks.append(("check_startup_budget", lambda: _check_startup_budget(startup_budget)))
+    problems = []
+    for name, check in checks:
+        problem = check()
+        print(f"{name:<40} {'FAIL: ' + problem if problem else 'ok'}")
+        if problem:
+            problems.append(problem)
+    return problems
+
+
+CASES = {
+    "monte_carlo": _monte_carlo_cases,
+    "backtest": _backtest_cases,
+    "weighted_stats": _weighted_stats_cases,
+    "ticker_search": _ticker_search_cases,
+    "api": _api_cases,
+    "startup": _startup_cases,
+}
+
+
+def run_benchmarks(groups, repeat, quick):
+    results = {}
+    for group in groups:
+        for name, fn, info in CASES[group](quick):
+            measured = _measure(fn, repeat)
+            measured["unit"] = info["unit"]
+            measured["throughput"] = info["work"] / measured["seconds"]
+            results[name] = measured
+            print(f"{name:<60} {measured['seconds'] * 1000:>10.2f} ms  "
+                  f"{measured['throughput']:>14,.0f} {info['unit']:<14} {measured['peak_mb']:>8.1f} MB")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the change against a baseline; return the names that regressed."""
+    regressions = []
+    print(f"\n{'case':<60} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<60} {'-':>10} {current['seconds'] * 1000:>8.2f}ms {'new':>8}")
+            continue
+        change = current["seconds"] / previous["seconds"] - 1.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<60} {previous['seconds'] * 1000:>8.2f}ms {current['seconds'] * 1000:>8.2f}ms "
+              f"{change:>+7.1%}{flag}")
+    return regressions
+
+
+def _environment():
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--only", action="append", choices=GROUPS, help="Run only this group (repeatable).")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repeats per case (median is reported).")
+    parser.add_argument("--quick", action="store_true", help="Smaller grid for a fast smoke run.")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as a JSON baseline.")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against a saved baseline.")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Relative slowdown counted as a regression (default 0.15).")
+    parser.add_argument("--check", action="store_true", help="Run the correctness and startup checks only.")
+    parser.add_argument("--startup-budget", type=float, default=1.5,
+                        help="Seconds allowed for a cold `import api` (default 1.5).")
+    args = parser.parse_args(argv)
+
+    set_price_store(PriceStore(OfflinePriceProvider(), cache_dir=os.environ["PRICE_CACHE_DIR"]))
+
+    if args.check:
+        return 1 if run_checks(args.startup_budget) else 0
+
+    groups = args.only or GROUPS
+    results = run_benchmarks(groups, max(args.repeat, 1), args.quick)
+    failed = "startup" in groups and bool(check_startup(results, args.startup_budget))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"environment": _environment(), "results": results}, f, indent=2)
+        print(f"\nBaseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline["results"], args.threshold):
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+In-process caches shared by the API.
+
+TTLCache is a thread-safe LRU cache with per-entry expiry and single-flight
+request coalescing: when several threads miss on the same key at once, only
+one of them runs the loader and the others wait for its result.
+
+ResultCache stores encoded responses in a byte-bounded LRU with an optional
+on-disk tier.
+"""
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class _InFlight:
+    """A load in progress that other callers can wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with time-to-live and single-flight loading.
+
+    Args:
+        maxsize (int): Maximum number of entries before LRU eviction.
+        ttl (float): Seconds an entry stays valid after being stored.
+        cache_none (bool): Whether a loader returning None is cached.
+    """
+
+    def __init__(self, maxsize=256, ttl=3600.0, cache_none=False):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.cache_none = cache_none
+        self._data = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _get_fresh(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def _store(self, key, value, now):
+        self._data[key] = (now + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            found, value = self._get_fresh(key, time.monotonic())
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._store(key, value, time.monotonic())
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value for key, calling loader() on a miss.
+
+        Concurrent misses for the same key share a single loader call; its
+        exception, if any, is re-raised in every waiting caller.
+        """
+        with self._lock:
+            found, value = self._get_fresh(key, time.monotonic())
+            if found:
+                self.hits += 1
+                return value
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                self.misses += 1
+                flight = self._in_flight[key] = _InFlight()
+                owner = True
+
+        if not owner:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if flight.error is None and (flight.value is not None or self.cache_none):
+                    self._store(key, flight.value, time.monotonic())
+                del self._in_flight[key]
+            flight.event.set()
+        return flight.value
+
+    def invalidate(self, key=None):
+        """Drop one key, or every entry when key is None."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of encoded responses, with an optional disk tier.
+
+    Entries are (body bytes, media type) pairs keyed by a hex digest. The
+    memory tier is bounded by total body size; when a directory is given,
+    every entry is also written there so cached results survive restarts,
+    and that tier is trimmed oldest-first to max_disk_bytes.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, directory=None, max_disk_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def _remember(self, key, entry):
+        if key in self._data:
+            self._size -= len(self._data.pop(key)[0])
+        self._data[key] = entry
+        self._size += len(entry[0])
+        while self._size > self.max_bytes and self._data:
+            _, (body, _) = self._data.popitem(last=False)
+            self._size -= len(body)
+            self.evictions += 1
+
+    def _read_disk(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                media_type, body = f.read().split(b"\n", 1)
+            # Refresh the LRU position; a concurrent _trim_disk may have just removed the file
+            os.utime(self._path(key))
+        except (OSError, ValueError):
+            return None
+        return body, media_type.decode("utf-8")
+
+    def _write_disk(self, key, entry):
+        body, media_type = entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(media_type.encode("utf-8") + b"\n" + body)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._trim_disk()
+
+    def _trim_disk(self):
+        try:
+            files = [
+                (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                for entry in os.scandir(self.directory) if entry.name.endswith(".bin")
+            ]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def get(self, key):
+        """Return (body, media_type) or None."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._read_disk(key) if self.directory else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, entry)
+            return entry
+
+    def set(self, key, body, media_type):
+        entry = (bytes(body), media_type)
+        with self._lock:
+            self._remember(key, entry)
+        if self.directory:
+            self._write_disk(key, entry)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._data),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "disk_tier": bool(self.directory),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": ((self.hits + self.disk_hits) / lookups) if lookups else 0.0,
+            }
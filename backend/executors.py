@@ -0,0 +1,161 @@
+"""
+Bounded work queues that keep the event loop free.
+
+Blocking network calls and CPU-heavy simulations are offloaded to separate
+executors. Each WorkQueue caps how much work may be queued or running at once
+(backpressure) and applies a per-request timeout, so a burst of large
+simulations or a slow Yahoo response cannot starve the rest of the API.
+
+A process pool is broken for good once one of its workers dies (e.g. killed
+for running out of memory). A queue given a replace_executor callback swaps
+such a pool for a fresh one instead of failing every later request.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import BrokenExecutor
+
+
+class QueueFullError(Exception):
+    """Raised when a queue has no free capacity for new work."""
+
+    def __init__(self, queue_name):
+        super().__init__(f"{queue_name} queue is full")
+        self.queue_name = queue_name
+
+
+class QueueTimeoutError(Exception):
+    """Raised when queued work does not finish within its timeout."""
+
+    def __init__(self, queue_name, timeout):
+        super().__init__(f"{queue_name} work timed out after {timeout}s")
+        self.queue_name = queue_name
+        self.timeout = timeout
+
+
+class WorkerCrashedError(Exception):
+    """Raised when the executor broke while running the work (a worker died)."""
+
+    def __init__(self, queue_name):
+        super().__init__(f"A {queue_name} worker crashed; the pool was restarted")
+        self.queue_name = queue_name
+
+
+def _is_broken(executor):
+    # Set by concurrent.futures on both thread and process pools
+    return bool(getattr(executor, "_broken", False))
+
+
+class WorkQueue:
+    """
+    Admission control in front of a concurrent.futures executor.
+
+    Args:
+        name (str): Queue name, used in errors and stats.
+        executor: Executor that runs the work (thread or process pool).
+        max_pending (int): Maximum units of work queued or running at once.
+        timeout (float): Default seconds a caller waits for its result.
+        replace_executor (callable, optional): Called with the broken
+            executor; returns the one to use from then on.
+    """
+
+    def __init__(self, name, executor, max_pending, timeout, replace_executor=None):
+        self.name = name
+        self.executor = executor
+        self.replace_executor = replace_executor
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.restarts = 0
+
+    def _acquire(self, weight):
+        with self._lock:
+            if self._pending + weight > self.max_pending:
+                self.rejected += 1
+                raise QueueFullError(self.name)
+            self._pending += weight
+
+    def _release(self, weight, _future=None):
+        with self._lock:
+            self._pending -= weight
+            self.completed += 1
+
+    def recover(self):
+        """
+        Replace the executor if it is broken.
+
+        Returns:
+            bool: Whether the queue can run work now.
+        """
+        executor = self.executor
+        if not _is_broken(executor):
+            return True
+        if self.replace_executor is None:
+            return False
+        replacement = self.replace_executor(executor)
+        with self._lock:
+            if self.executor is executor:
+                self.executor = replacement
+                self.restarts += 1
+        return not _is_broken(self.executor)
+
+    async def run(self, fn, *args, timeout=None, weight=1, run_on=None, **kwargs):
+        """
+        Run fn(*args, **kwargs) off the event loop and await its result.
+
+        Capacity is released when the work actually finishes, not when the
+        caller gives up, so timed-out work still counts against the queue.
+
+        Args:
+            weight (int): Capacity units the work occupies (e.g. shard count).
+            run_on: Run on this executor instead, still counting against
+                this queue (used to orchestrate sharded runs from a thread).
+
+        Raises:
+            QueueFullError: If the queue has no free capacity.
+            QueueTimeoutError: If the result is not ready within the timeout.
+            WorkerCrashedError: If the executor broke while running the work.
+        """
+        weight = min(weight, self.max_pending)
+        self._acquire(weight)
+        # A pool broken by earlier work is replaced before this work is submitted
+        self.recover()
+        try:
+            work = (run_on or self.executor).submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release(weight)
+            raise
+        work.add_done_callback(functools.partial(self._release, weight))
+
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(work)), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            # Only drops work that has not started yet
+            work.cancel()
+            raise QueueTimeoutError(self.name, timeout)
+        except BrokenExecutor:
+            self.recover()
+            raise WorkerCrashedError(self.name)
+        except asyncio.CancelledError:
+            # The caller went away (e.g. a cancelled stream): drop the work if it has not started
+            work.cancel()
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "restarts": self.restarts,
+                "broken": _is_broken(self.executor),
+            }
@@ -1,11 +1,76 @@
+import multiprocessing
+import os
+import threading
+import time
+import warnings
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-import pandas as pd
-import yfinance as yf
+from price_data import get_close_history
+from metrics import stage, count
+
+# Trayectorias por bloque en el modo streaming de run_monte_carlo_simulation
+DEFAULT_CHUNK_SIZE = 25_000
+# Cubetas por año de los histogramas usados para estimar percentiles en streaming
+QUANTILE_SKETCH_BINS = 2 ** 15
+# Percentiles del fan chart
+FAN_PERCENTILES = [10, 50, 90]
+# Estrategias de muestreo de run_monte_carlo_simulation
+SAMPLING_MODES = ("pseudo", "antithetic", "sobol")
+# Secuencias Sobol aleatorizadas independientes por bloque (réplicas para los intervalos de confianza)
+SOBOL_REPLICATES = 16
+# Magnitud media de un crash (uniforme entre -50% y -20%)
+CRASH_MEAN_RETURN = -0.35
+# Bootstrap por bloques de retornos mensuales históricos
+BOOTSTRAP_METHODS = ("stationary", "fixed")
+# Años de bootstrap cuyo retorno cuenta como crash (para marcar Is_Black_Swan)
+BOOTSTRAP_CRASH_RETURN = -0.20
+# Resolución temporal del motor de Monte Carlo
+TIME_STEPS = ("annual", "monthly")
+# Persistencia mensual por defecto del AR(1) de la inflación estocástica
+INFLATION_PERSISTENCE = 0.9
+# Suelo del factor mensual del deflactor (deflación mensual máxima del 50%)
+INFLATION_MIN_MONTHLY_GROWTH = 0.5
+# Cubetas (de 0.1 puntos) del histograma de drawdowns máximos por trayectoria
+DRAWDOWN_BINS = 1000
+# Percentiles del drawdown máximo y del año en que se alcanza la meta
+RISK_PERCENTILES = (10, 50, 90, 95, 99)
+# Niveles de confianza del VaR/CVaR del saldo final real
+VAR_LEVELS = (0.95, 0.99)
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def get_process_pool():
+    """Pool de procesos compartido para simulaciones en shards (SIM_WORKERS procesos)."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            workers = int(os.environ.get("SIM_WORKERS", os.cpu_count() or 1))
+            # forkserver evita heredar locks de los hilos del servidor al hacer fork
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _process_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context(method)
+            )
+        return _process_pool
+
+def replace_process_pool(broken):
+    """
+    Sustituye el pool compartido si sigue siendo `broken` (un worker murió y
+    el pool ya no acepta trabajo) y devuelve el pool vigente.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+    return get_process_pool()
 
 def get_historical_stats(ticker, period="20y"):
     """
     Obtiene estadísticas históricas (retorno medio y volatilidad anualizada)
-    para un ticker dado usando yfinance.
+    para un ticker dado a partir de la caché local de precios (price_data).
     
     Args:
         ticker (str): Símbolo del activo (ej. 'SPY', 'VWRL.AS').
@@ -16,11 +81,11 @@ def get_historical_stats(ticker, period="20y"):
               o None si hay error.
     """
     try:
-        # Descargar datos históricos
-        stock = yf.Ticker(ticker)
-        hist = stock.history(period=period)
+        # Leer cierres históricos (la caché solo descarga los días que falten)
+        with stage("price_fetch"):
+            closes = get_close_history(ticker, period=period)
         
-        if hist.empty:
+        if closes.empty:
             return None
             
         # Calcular retornos diarios
@@ -31,7 +96,7 @@ def get_historical_stats(ticker, period="20y"):
         # 'Close' suele estar ajustado por splits. Para dividendos, mejor calcular Total Return si es posible,
         # pero para simplificar usaremos el cambio porcentual del precio de cierre.
         
-        daily_returns = hist['Close'].pct_change().dropna()
+        daily_returns = closes.pct_change().dropna()
         
         # Anualizar métricas (asumiendo 252 días de trading)
         mean_daily_return = daily_returns.mean()
@@ -49,64 +114,1445 @@ def get_historical_stats(ticker, period="20y"):
         print(f"Error obteniendo datos para {ticker}: {e}")
         return None
 
-def calculate_weighted_stats(ticker1, ticker2, weight1, period="5y"):
+def _cholesky(cov_matrix):
+    """Factor de Cholesky; si la matriz no es definida positiva se recortan sus autovalores."""
+    try:
+        return np.linalg.cholesky(cov_matrix)
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(cov_matrix)
+        floor = max(eigenvalues.max(), 1e-12) * 1e-10
+        repaired = (eigenvectors * np.maximum(eigenvalues, floor)) @ eigenvectors.T
+        return np.linalg.cholesky((repaired + repaired.T) / 2)
+
+def estimate_asset_covariance(tickers, period="5y"):
+    """
+    Estima retornos medios y covarianzas anualizadas de N activos a partir de
+    su historia alineada por fecha, junto con el factor de Cholesky.
+    
+    Args:
+        tickers (list): Símbolos de los activos.
+        period (str): Periodo histórico para la estimación.
+        
+    Returns:
+        dict: {'tickers', 'mean_returns', 'cov_matrix', 'cholesky', 'correlation', 'data_points'}
+              o None si hay error.
+    """
+    import pandas as pd
+
+    try:
+        # Unir todas las series por fecha para asegurar alineación
+        with stage("price_fetch"):
+            data = pd.concat({
+                ticker: get_close_history(ticker, period=period) for ticker in tickers
+            }, axis=1).dropna()
+        
+        if data.empty or len(data.columns) < len(tickers):
+            return None
+            
+        # Calcular retornos diarios
+        returns = data.pct_change().dropna()
+        if len(returns) < 2:
+            return None
+        
+        # Medias y Covarianzas anualizadas
+        cov_matrix = (returns.cov() * 252).to_numpy()
+        
+        return {
+            "tickers": list(tickers),
+            "mean_returns": (returns.mean() * 252).to_numpy(),
+            "cov_matrix": cov_matrix,
+            "cholesky": _cholesky(cov_matrix),
+            "correlation": returns.corr().to_numpy(),
+            "data_points": len(returns)
+        }
+    except Exception as e:
+        print(f"Error estimando covarianzas para {tickers}: {e}")
+        return None
+
+def get_monthly_log_returns(tickers, period="max"):
+    """
+    Retornos mensuales históricos en logaritmos, alineados por fecha, para el
+    bootstrap por bloques.
+
+    Args:
+        tickers (list): Símbolos de los activos (uno para un ticker suelto).
+        period (str): Periodo histórico a usar.
+
+    Returns:
+        np.ndarray: log(1 + r) de forma (meses, activos), o None si hay
+        menos de dos años de historia común.
+    """
+    import pandas as pd
+
+    try:
+        with stage("price_fetch"):
+            closes = pd.concat({
+                ticker: get_close_history(ticker, period=period) for ticker in tickers
+            }, axis=1).dropna()
+        if closes.empty:
+            return None
+        monthly = closes.resample('ME').last().pct_change().dropna()
+        if len(monthly) < 24:
+            return None
+        return np.log1p(monthly.to_numpy(dtype=float))
+    except Exception as e:
+        print(f"Error obteniendo retornos mensuales para {tickers}: {e}")
+        return None
+
+def _normalize_weights(weights):
+    weights = np.asarray(weights, dtype=float)
+    if weights.ndim != 1 or np.any(weights < 0) or weights.sum() <= 0:
+        raise ValueError("Los pesos deben ser no negativos y sumar más de 0")
+    return weights / weights.sum()
+
+def calculate_portfolio_stats(tickers, weights, period="5y", covariance=None):
+    """
+    Calcula estadísticas de una cartera de N activos considerando las
+    correlaciones reales entre ellos.
+    
+    Args:
+        tickers (list): Símbolos de los activos.
+        weights (list): Pesos de cada activo (se normalizan para sumar 1).
+        period (str): Periodo histórico para correlación.
+        covariance (dict, optional): Resultado previo de estimate_asset_covariance
+            para los mismos tickers (evita recalcularlo).
+        
+    Returns:
+        dict: Stats de la cartera combinada o None si hay error.
+    """
+    if covariance is None:
+        covariance = estimate_asset_covariance(tickers, period=period)
+    if covariance is None:
+        return None
+
+    weights = _normalize_weights(weights)
+    mean_returns = covariance["mean_returns"]
+    cov_matrix = covariance["cov_matrix"]
+
+    # Retorno esperado y volatilidad de la cartera: w·mu y sqrt(w' Σ w)
+    return {
+        "mean_return": float(weights @ mean_returns),
+        "volatility": float(np.sqrt(weights @ cov_matrix @ weights)),
+        "weights": weights,
+        "correlation": covariance["correlation"],
+        "data_points": covariance["data_points"],
+        "details": {
+            ticker: {"return": float(mean_returns[i]), "vol": float(np.sqrt(cov_matrix[i, i]))}
+            for i, ticker in enumerate(tickers)
+        }
+    }
+
+def calculate_weighted_stats(ticker1, ticker2, weight1, period="5y"):
+    """
+    Calcula estadísticas ponderadas para una cartera de dos activos,
+    considerando la correlación real entre ellos.
+    
+    Args:
+        ticker1 (str): Primer activo (ej. 'IWDA.AS').
+        ticker2 (str): Segundo activo (ej. 'EEM').
+        weight1 (float): Peso del primer activo (0.0 a 1.0).
+        period (str): Periodo histórico para correlación.
+        
+    Returns:
+        dict: Stats de la cartera combinada.
+    """
+    try:
+        stats = calculate_portfolio_stats([ticker1, ticker2], [weight1, 1.0 - weight1], period=period)
+        if stats is None:
+            return None
+        
+        return {
+            "mean_return": stats["mean_return"],
+            "volatility": stats["volatility"],
+            # Correlación (para mostrar al usuario)
+            "correlation": float(stats["correlation"][0, 1]),
+            "details": stats["details"]
+        }
+    except Exception as e:
+        print(f"Error en cartera mixta: {e}")
+        return None
+
+def _expand_annual_contributions(contribution_schedule):
+    """
+    Expande el calendario de aportaciones a un array año a año.
+
+    Args:
+        contribution_schedule: Lista de tuplas (años, mensualidad).
+
+    Returns:
+        np.ndarray: Aportación anual de cada año de la simulación.
+    """
+    annual_contributions_list = []
+    for duration, monthly_amount in contribution_schedule:
+        # Aseguramos que duration sea entero
+        years_in_tranche = int(duration)
+        annual_amount = monthly_amount * 12
+        annual_contributions_list.extend([annual_amount] * years_in_tranche)
+    return np.asarray(annual_contributions_list, dtype=float)
+
+def _t_std_dev(t_df):
+    # Factor de normalización para t-student (df=t_df, var=df/(df-2) para df>2)
+    # Para estandarizar t-student a varianza 1, dividimos por sqrt(df/(df-2))
+    if t_df > 2:
+        return np.sqrt(t_df / (t_df - 2))
+    return 1.0 # Fallback para df bajos donde varianza es infinita o indefinida
+
+def _antithetic(half_draws, num_paths, reflect):
+    """Intercala cada fila con su reflejo (las filas 2k y 2k+1 forman un par) y recorta a num_paths."""
+    paired = np.empty((2 * len(half_draws),) + half_draws.shape[1:])
+    paired[0::2] = half_draws
+    paired[1::2] = reflect(half_draws)
+    return paired[:num_paths]
+
+def _replicate_sizes(num_paths):
+    """Tamaños de las réplicas Sobol de un bloque (repartidas lo más igual posible)."""
+    replicates = max(1, min(SOBOL_REPLICATES, num_paths))
+    base, extra = divmod(num_paths, replicates)
+    return [base + (1 if i < extra else 0) for i in range(replicates)]
+
+def _sobol_uniforms(rng, num_paths, dims):
+    """
+    Uniformes (num_paths, dims) de secuencias Sobol con scrambling.
+
+    Las filas se reparten en réplicas consecutivas, cada una con su propio
+    scrambling aleatorio derivado de rng: cada réplica es un estimador
+    independiente (QMC aleatorizado), lo que permite medir su error.
+    """
+    from scipy.stats import qmc
+
+    parts = []
+    with warnings.catch_warnings():
+        # Sobol avisa si n no es potencia de 2; seguimos siendo insesgados
+        warnings.simplefilter("ignore", UserWarning)
+        for size in _replicate_sizes(num_paths):
+            parts.append(qmc.Sobol(d=dims, scramble=True, rng=rng).random(size))
+    uniforms = np.concatenate(parts) if parts else np.empty((0, dims))
+    # Evitar 0 y 1 exactos antes de aplicar las inversas de las CDF
+    return np.clip(uniforms, 1e-12, 1 - 1e-12)
+
+def _draw_annual_returns(
+    rng,
+    num_paths,
+    total_years,
+    mean_return,
+    volatility,
+    black_swan_enabled,
+    black_swan_prob,
+    t_df,
+    sampling="pseudo"
+):
+    """
+    Genera de una sola vez la matriz de retornos anuales (trayectorias x años).
+
+    Con sampling='antithetic' cada par de trayectorias usa shocks opuestos
+    (y uniformes u, 1 - u para los cisnes negros). Con sampling='sobol' cada
+    año es una dimensión de una secuencia Sobol aleatorizada: una única
+    uniforme decide si hay cisne negro (u < prob, y entonces fija la magnitud
+    del crash) y, si no, se transforma en shock con la inversa de la CDF
+    t-Student.
+
+    Returns:
+        tuple: (returns, black_swans) ambos de forma (num_paths, total_years).
+    """
+    shape = (num_paths, total_years)
+    scale = volatility / _t_std_dev(t_df)
+
+    if sampling == "sobol":
+        from scipy.special import stdtrit
+
+        uniforms = _sobol_uniforms(rng, num_paths, total_years)
+        if black_swan_enabled:
+            black_swans = uniforms < black_swan_prob
+            shock_uniforms = np.clip((uniforms - black_swan_prob) / (1 - black_swan_prob), 1e-12, 1 - 1e-12)
+        else:
+            black_swans = np.zeros(shape, dtype=bool)
+            shock_uniforms = uniforms
+        returns = stdtrit(t_df, shock_uniforms)
+        returns *= scale
+        returns += mean_return
+        returns[black_swans] = -0.50 + 0.30 * uniforms[black_swans] / black_swan_prob
+        return returns, black_swans
+
+    # Shocks t-Student estandarizados para todas las trayectorias y años
+    if sampling == "antithetic":
+        half = (num_paths + 1) // 2
+        returns = _antithetic(rng.standard_t(t_df, size=(half, total_years)), num_paths, np.negative)
+    else:
+        returns = rng.standard_t(t_df, size=shape)
+    returns *= scale
+    returns += mean_return
+
+    if black_swan_enabled:
+        if sampling == "antithetic":
+            swan_draws = _antithetic(rng.random((half, total_years)), num_paths, lambda u: 1.0 - u)
+        else:
+            swan_draws = rng.random(shape)
+        black_swans = swan_draws < black_swan_prob
+        # Solo generamos magnitudes de crash donde hay cisne negro
+        returns[black_swans] = rng.uniform(-0.50, -0.20, size=int(black_swans.sum()))
+    else:
+        black_swans = np.zeros(shape, dtype=bool)
+
+    return returns, black_swans
+
+def _draw_asset_returns(rng, num_paths, total_years, portfolio, black_swan_enabled, black_swan_prob, t_df, sampling="pseudo"):
+    """
+    Retornos anuales por activo (trayectorias x años x activos) de la t-Student
+    multivariante de la cartera, con la misma estrategia de muestreo que
+    _draw_annual_returns. En Sobol cada año usa una dimensión por activo
+    (normales), otra para el chi-cuadrado y otra para el cisne negro.
+
+    Returns:
+        tuple: (asset_returns, black_swans).
+    """
+    num_assets = len(portfolio["weights"])
+    shape = (num_paths, total_years)
+    swan_draws = None
+
+    if sampling == "sobol":
+        from scipy.special import chdtri, ndtri
+
+        dims = num_assets + 1 + (1 if black_swan_enabled else 0)
+        uniforms = _sobol_uniforms(rng, num_paths, total_years * dims).reshape(num_paths, total_years, dims)
+        normals = ndtri(uniforms[..., :num_assets])
+        chi_squares = chdtri(t_df, 1.0 - uniforms[..., num_assets])
+        if black_swan_enabled:
+            swan_draws = uniforms[..., num_assets + 1]
+    elif sampling == "antithetic":
+        half = (num_paths + 1) // 2
+        normals = _antithetic(rng.standard_normal((half, total_years, num_assets)), num_paths, np.negative)
+        chi_squares = _antithetic(rng.chisquare(t_df, size=(half, total_years)), num_paths, lambda x: x)
+        if black_swan_enabled:
+            swan_draws = _antithetic(rng.random((half, total_years)), num_paths, lambda u: 1.0 - u)
+    else:
+        normals = rng.standard_normal(shape + (num_assets,))
+        chi_squares = rng.chisquare(t_df, size=shape)
+
+    asset_returns = normals @ portfolio["cholesky"].T
+    asset_returns *= (np.sqrt(t_df / chi_squares) / _t_std_dev(t_df))[..., None]
+    asset_returns += portfolio["mean_returns"]
+
+    if black_swan_enabled:
+        if swan_draws is None:
+            swan_draws = rng.random(shape)
+        black_swans = swan_draws < black_swan_prob
+        if sampling == "sobol":
+            crash = -0.50 + 0.30 * swan_draws[black_swans] / black_swan_prob
+        else:
+            crash = rng.uniform(-0.50, -0.20, size=int(black_swans.sum()))
+        asset_returns[black_swans] = crash[:, None]
+    else:
+        black_swans = np.zeros(shape, dtype=bool)
+
+    return asset_returns, black_swans
+
+def _draw_bootstrap_returns(rng, num_paths, total_years, bootstrap):
+    """
+    Retornos anuales por activo remuestreando bloques de meses históricos.
+
+    Cada año compone 12 meses de la historia. Los meses se toman en bloques
+    consecutivos (circulares) que empiezan en una posición aleatoria: de
+    longitud fija block_length (method='fixed') o geométrica de media
+    block_length (method='stationary', Politis-Romano). Así se conservan el
+    agrupamiento de volatilidad, las secuencias reales de caídas y la
+    correlación entre activos (se remuestrean filas completas).
+
+    Los meses no se leen uno a uno: con las sumas acumuladas C de la historia
+    (extendida circularmente), los meses de un año que caen en un mismo
+    bloque suman C[fin] - C[inicio]. La suma del año es la diferencia entre
+    su último y su primer mes más una corrección por cada bloque que empieza
+    a mitad de año, así que las lecturas son O(años + bloques) por
+    trayectoria en lugar de O(meses).
+
+    Returns:
+        tuple: (asset_returns, black_swans) de formas (num_paths, años, activos)
+        y (num_paths, años); black_swans marca los años con retorno medio de
+        los activos por debajo de BOOTSTRAP_CRASH_RETURN.
+    """
+    log_returns = bootstrap["log_returns"]
+    total_months = total_years * 12
+    block_starts, lengths, sources = _bootstrap_blocks(rng, num_paths, total_months, bootstrap)
+    used = block_starts < total_months
+    on_year_start = block_starts % 12 == 0
+    # Celda (año, trayectoria) de cada bloque en las matrices (años, trayectorias) aplanadas
+    cells = block_starts // 12 * num_paths + np.arange(num_paths)
+
+    # Mes de la historia del mes m: m + 1 + offsets[j], con j el último bloque
+    # empezado en m. Basta en el primer y el último mes de cada año; j sale
+    # de contar los bloques empezados por año
+    offsets = _block_jumps(block_starts, lengths, sources)
+    offsets -= 1
+    np.cumsum(offsets, axis=0, out=offsets)
+    started_by_end = np.bincount(cells[used], minlength=total_years * num_paths).reshape(total_years, num_paths)
+    np.cumsum(started_by_end, axis=0, out=started_by_end)
+    started_by_start = np.bincount(
+        cells[used & on_year_start], minlength=total_years * num_paths
+    ).reshape(total_years, num_paths)
+    started_by_start[1:] += started_by_end[:-1]
+
+    year_months = 12 * np.arange(total_years)[:, None]
+    columns = np.arange(num_paths)
+    first = year_months + 1 + offsets.ravel()[(started_by_start - 1) * num_paths + columns]
+    last = year_months + 12 + offsets.ravel()[(started_by_end - 1) * num_paths + columns]
+
+    extended = np.resize(log_returns, (len(log_returns) + total_months, log_returns.shape[1]))
+    cumulative = np.concatenate((np.zeros((1, extended.shape[1])), np.cumsum(extended, axis=0)))
+    yearly = cumulative[last + 1] - cumulative[first]
+
+    # Un bloque que empieza a mitad de año corta la suma telescópica: se
+    # cambia el tramo que seguiría al bloque anterior por el del nuevo
+    restarts = used[1:] & ~on_year_start[1:]
+    corrections = cumulative[(sources[:-1] + lengths[:-1])[restarts]] - cumulative[sources[1:][restarts]]
+    flat = yearly.reshape(total_years * num_paths, -1)
+    for asset in range(flat.shape[1]):
+        flat[:, asset] += np.bincount(cells[1:][restarts], weights=corrections[:, asset], minlength=len(flat))
+
+    asset_returns = np.expm1(yearly.transpose(1, 0, 2))
+    black_swans = asset_returns.mean(axis=2) <= BOOTSTRAP_CRASH_RETURN
+    return asset_returns, black_swans
+
+def _bootstrap_blocks(rng, num_paths, total_months, bootstrap):
+    """
+    Bloques del bootstrap de cada trayectoria, de forma (bloques, trayectorias):
+    mes en que empiezan, longitud y primer mes de la historia que toman. Los
+    bloques que empiezan a partir de total_months sobran.
+    """
+    history = len(bootstrap["log_returns"])
+    block_length = bootstrap["block_length"]
+
+    if bootstrap["method"] == "fixed":
+        num_blocks = -(-total_months // block_length)
+        lengths = np.full((num_blocks, num_paths), block_length, dtype=np.int32)
+    else:
+        # Longitudes geométricas de media block_length (un reinicio con
+        # probabilidad 1 / block_length cada mes); se añaden bloques en el
+        # caso raro de que no cubran todos los meses de alguna trayectoria
+        expected = total_months / block_length
+        num_blocks = int(expected + 4 * np.sqrt(expected)) + 8
+        lengths = np.empty((0, num_paths), dtype=np.int32)
+        while not len(lengths) or lengths.sum(axis=0, dtype=np.int64).min() < total_months:
+            # Inversa de la CDF geométrica; float32 basta para longitudes de meses
+            extra = np.log1p(-rng.random((num_blocks, num_paths), dtype=np.float32))
+            extra *= 1.0 / np.log1p(-1.0 / block_length) if block_length > 1 else 0.0
+            np.clip(extra, 0, total_months - 1, out=extra)
+            lengths = np.concatenate((lengths, extra.astype(np.int32) + 1))
+
+    # int32 basta para índices de meses y reduce a la mitad la memoria del bloque
+    block_starts = np.cumsum(lengths, axis=0, dtype=np.int32) - lengths
+    sources = rng.integers(0, history, size=lengths.shape, dtype=np.int32)
+    return block_starts, lengths, sources
+
+def _block_positions(total_months, block_starts, lengths, sources):
+    """
+    Mes de la historia extendida (sin módulo, hasta historia + meses) que toma
+    cada trayectoria cada mes, de forma (meses, trayectorias). Cada mes avanza
+    uno y al empezar un bloque salta a su origen: una suma acumulada de pasos,
+    sin bucles sobre los meses.
+    """
+    num_paths = block_starts.shape[1]
+    steps = np.ones((total_months, num_paths), dtype=np.int32)
+    jumps = _block_jumps(block_starts, lengths, sources)
+    used = block_starts < total_months
+    cells = block_starts.astype(np.int64) * num_paths + np.arange(num_paths)
+    steps.ravel()[cells[used]] = jumps[used]
+    return np.cumsum(steps, axis=0, out=steps)
+
+def _block_jumps(block_starts, lengths, sources):
+    """Paso de la posición en el mes en que empieza cada bloque (el resto de meses avanza 1)."""
+    jumps = sources.copy()
+    jumps[1:] -= sources[:-1] + lengths[:-1] - 1
+    return jumps
+
+def _bootstrap_positions(rng, num_paths, total_months, bootstrap):
+    """Meses de la historia (meses, trayectorias) que toma cada trayectoria en el bootstrap."""
+    block_starts, lengths, sources = _bootstrap_blocks(rng, num_paths, total_months, bootstrap)
+    positions = _block_positions(total_months, block_starts, lengths, sources)
+    positions %= len(bootstrap["log_returns"])
+    return positions
+
+def _normal_scores(values):
+    """Puntuaciones normales (cuantiles gaussianos de los rangos) de una serie."""
+    ranks = np.argsort(np.argsort(values))
+    quantile = NormalDist().inv_cdf
+    return np.array([quantile((rank + 0.5) / len(values)) for rank in ranks])
+
+def _inflation_innovation_scale(volatility, persistence):
+    """
+    Desviación típica de las innovaciones mensuales del AR(1) de la inflación.
+
+    Con d_t = persistence * d_{t-1} + e_t estacionario, la varianza de la suma
+    de 12 meses consecutivos es var(e) / (1 - persistence^2) * (12 + 2 *
+    sum_k (12 - k) persistence^k). Se elige var(e) para que esa suma (la
+    desviación de la inflación anual respecto a inflation_rate) tenga
+    desviación típica volatility; con persistence = 0 queda volatility / sqrt(12).
+    """
+    lags = np.arange(1, 12)
+    sum_factor = 12.0 + 2.0 * np.sum((12 - lags) * persistence ** lags)
+    return volatility * np.sqrt((1.0 - persistence ** 2) / sum_factor)
+
+def _draw_monthly_returns(rng, num_paths, spec):
+    """
+    Retornos mensuales (trayectorias x meses) de un activo, generados de una
+    sola vez.
+
+    En el modelo paramétrico los 12 meses de cada año son normales con
+    media (1 + media anual)^(1/12) - 1 y volatilidad anual / sqrt(12),
+    escaladas por un mismo chi-cuadrado por año (como los activos de
+    _draw_asset_returns): el retorno de cada año conserva las colas de la
+    t-Student del modelo anual en lugar de promediarlas entre meses. Cada mes
+    tiene un cisne negro independiente con probabilidad
+    1 - (1 - prob anual)^(1/12), así que la probabilidad de al menos un crash
+    en un año es la del modelo anual. Con bootstrap, los meses salen
+    directamente de la historia.
+
+    Returns:
+        tuple: (returns, black_swans, shocks). black_swans es None con
+        bootstrap; shocks son la parte gaussiana N(0, 1) de cada retorno (para
+        correlacionar la inflación): la normal antes de la escala chi-cuadrado
+        y sin los crashes, o la puntuación normal del mes histórico con
+        bootstrap. Es None si no hacen falta.
+    """
+    total_years = len(spec["annual_contributions"])
+    inflation = spec.get("inflation_model")
+    correlated = inflation is not None and inflation["correlation"] != 0.0
+
+    if spec.get("bootstrap") is not None:
+        log_returns = spec["bootstrap"]["log_returns"][:, 0]
+        positions = _bootstrap_positions(rng, num_paths, total_years * 12, spec["bootstrap"])
+        returns = np.expm1(log_returns[positions.T])
+        shocks = None
+        if correlated:
+            shocks = _normal_scores(log_returns)[positions.T]
+        return returns, None, shocks
+
+    t_df = spec["t_df"]
+    sampling = spec.get("sampling", "pseudo")
+    black_swan_enabled = spec["black_swan_enabled"]
+    swan_prob = 1.0 - (1.0 - spec["black_swan_prob"]) ** (1.0 / 12.0)
+    shape = (num_paths, total_years, 12)
+    swan_draws = None
+
+    if sampling == "sobol":
+        from scipy.special import chdtri, ndtri
+
+        dims = 13 + (12 if black_swan_enabled else 0)
+        uniforms = _sobol_uniforms(rng, num_paths, total_years * dims).reshape(num_paths, total_years, dims)
+        normals = ndtri(uniforms[..., :12])
+        chi_squares = chdtri(t_df, 1.0 - uniforms[..., 12])
+        if black_swan_enabled:
+            swan_draws = uniforms[..., 13:]
+    elif sampling == "antithetic":
+        half = (num_paths + 1) // 2
+        normals = _antithetic(rng.standard_normal((half, total_years, 12)), num_paths, np.negative)
+        chi_squares = _antithetic(rng.chisquare(t_df, size=(half, total_years)), num_paths, lambda x: x)
+        if black_swan_enabled:
+            swan_draws = _antithetic(rng.random((half, total_years, 12)), num_paths, lambda u: 1.0 - u)
+    else:
+        normals = rng.standard_normal(shape)
+        chi_squares = rng.chisquare(t_df, size=(num_paths, total_years))
+
+    # La inflación se correlaciona con la normal, no con el shock t-Student:
+    # con colas pesadas sus innovaciones podrían hundir el deflactor
+    shocks = normals.reshape(num_paths, -1).copy() if correlated else None
+    normals *= (np.sqrt(t_df / chi_squares) / _t_std_dev(t_df))[..., None]
+    returns = normals.reshape(num_paths, -1) * (spec["volatility"] / np.sqrt(12.0))
+    returns += (1.0 + spec["mean_return"]) ** (1.0 / 12.0) - 1.0
+
+    if black_swan_enabled:
+        if swan_draws is None:
+            swan_draws = rng.random(shape)
+        black_swans = swan_draws.reshape(num_paths, -1) < swan_prob
+        if sampling == "sobol":
+            returns[black_swans] = -0.50 + 0.30 * swan_draws.reshape(num_paths, -1)[black_swans] / swan_prob
+        else:
+            returns[black_swans] = rng.uniform(-0.50, -0.20, size=int(black_swans.sum()))
+        if correlated:
+            shocks[black_swans] = 0.0
+    else:
+        black_swans = np.zeros(returns.shape, dtype=bool)
+    return returns, black_swans, shocks
+
+def _simulate_monthly_paths(spec, rng, num_paths):
+    """
+    Simula trayectorias con paso mensual y las agrega a fin de año.
+
+    Las aportaciones se abonan al final de cada mes (la mensualidad del
+    calendario). Como _simulate_balances, itera sobre los meses y opera
+    sobre todas las trayectorias a la vez; solo se guardan los saldos de fin
+    de año y el retorno compuesto de cada año.
+
+    Con inflation_model la inflación mensual sigue un AR(1) alrededor de
+    (1 + inflation_rate)^(1/12) - 1 que arranca en su distribución
+    estacionaria; 'volatility' es la desviación típica de la suma de las
+    desviaciones de 12 meses consecutivos, es decir, de la inflación anual
+    (ver _inflation_innovation_scale). Las innovaciones son gaussianas y su
+    parte correlacionada usa la parte gaussiana de los shocks de retorno. Las
+    desviaciones del AR(1) se acumulan en el mismo bucle de meses (cada mes
+    depende del anterior) y el deflactor de cada trayectoria es el np.cumprod
+    de los factores mensuales (1 + inflación) del bloque, acotados por
+    INFLATION_MIN_MONTHLY_GROWTH para que no lleguen a cero ni cambien de
+    signo.
+
+    Returns:
+        tuple: Igual que _simulate_paths (a resolución anual).
+    """
+    annual_contributions = spec["annual_contributions"]
+    total_years = len(annual_contributions)
+    monthly_returns, monthly_swans, shocks = _draw_monthly_returns(rng, num_paths, spec)
+
+    inflation = spec.get("inflation_model")
+    if inflation is not None:
+        persistence = inflation["persistence"]
+        scale = _inflation_innovation_scale(inflation["volatility"], persistence)
+        # innovations pasa a guardar las desviaciones mensuales del AR(1)
+        innovations = rng.standard_normal(monthly_returns.shape)
+        innovations *= scale
+        correlation = inflation["correlation"]
+        if correlation != 0.0:
+            # _draw_monthly_returns devuelve shocks en todos los modos cuando
+            # hay correlación; sin ellos la correlación se ignoraría en silencio
+            if shocks is None:
+                raise ValueError("Este modelo de retornos no admite inflación correlacionada")
+            innovations *= np.sqrt(1.0 - correlation ** 2)
+            innovations += shocks * (correlation * scale)
+        deviation = rng.standard_normal(num_paths) * (scale / np.sqrt(1.0 - persistence ** 2))
+
+    nominal = np.empty((num_paths, total_years + 1))
+    nominal[:, 0] = spec["initial_capital"]
+    returns = np.empty((num_paths, total_years))
+    balance = nominal[:, 0].copy()
+    growth = np.empty(num_paths)
+    year_growth = np.empty(num_paths)
+    for year_idx in range(total_years):
+        monthly_amount = annual_contributions[year_idx] / 12.0
+        year_growth.fill(1.0)
+        for month in range(12 * year_idx, 12 * year_idx + 12):
+            np.add(monthly_returns[:, month], 1.0, out=growth)
+            balance *= growth
+            balance += monthly_amount
+            year_growth *= growth
+            if inflation is not None:
+                deviation *= persistence
+                deviation += innovations[:, month]
+                innovations[:, month] = deviation
+        nominal[:, year_idx + 1] = balance
+        np.subtract(year_growth, 1.0, out=returns[:, year_idx])
+
+    if inflation is None:
+        real = nominal / spec["deflators"]
+    else:
+        factors = innovations
+        factors += (1.0 + spec["inflation_rate"]) ** (1.0 / 12.0)
+        np.maximum(factors, INFLATION_MIN_MONTHLY_GROWTH, out=factors)
+        np.cumprod(factors, axis=1, out=factors)
+        real = nominal.copy()
+        real[:, 1:] /= factors[:, 11::12]
+    if monthly_swans is not None:
+        black_swans = monthly_swans.reshape(num_paths, total_years, 12).any(axis=2)
+    else:
+        black_swans = returns <= BOOTSTRAP_CRASH_RETURN
+    return nominal, real, returns, black_swans
+
+def _simulate_balances(initial_capital, returns, annual_contributions):
+    """
+    Recurrencia vectorizada del saldo nominal: B[t] = B[t-1] * (1 + r_t) + aportación_t.
+
+    Itera sobre los años (decenas) y opera sobre todas las trayectorias a la vez.
+
+    Returns:
+        np.ndarray: Saldos nominales de forma (num_paths, total_years + 1).
+    """
+    num_paths, total_years = returns.shape
+    balances = np.empty((num_paths, total_years + 1))
+    balances[:, 0] = initial_capital
+    for year_idx in range(total_years):
+        np.multiply(balances[:, year_idx], 1.0 + returns[:, year_idx], out=balances[:, year_idx + 1])
+        balances[:, year_idx + 1] += annual_contributions[year_idx]
+    return balances
+
+def _max_drawdowns(curves):
+    """
+    Drawdown máximo de cada trayectoria (forma (trayectorias, años + 1)).
+
+    Drawdown = (Peak - Current) / Peak, con el pico acumulado desde el inicio.
+    Como _simulate_balances, itera sobre los años y opera sobre todas las
+    trayectorias a la vez con vectores de pico y peor caída.
+    """
+    curves = np.atleast_2d(curves)
+    peak = curves[:, 0].astype(float)
+    worst = np.zeros(len(curves))
+    drawdown = np.empty(len(curves))
+    for year_idx in range(1, curves.shape[1]):
+        current = curves[:, year_idx]
+        np.maximum(peak, current, out=peak)
+        positive = peak > 0
+        np.subtract(peak, current, out=drawdown)
+        np.divide(drawdown, peak, out=drawdown, where=positive)
+        np.maximum(worst, drawdown, out=worst, where=positive)
+    return worst
+
+def _max_drawdown(curve):
+    return float(_max_drawdowns(curve)[0])
+
+def _invested_capital(spec):
+    """Capital invertido nominal acumulado por año (años + 1)."""
+    return spec["initial_capital"] + np.concatenate(([0.0], np.cumsum(spec["annual_contributions"])))
+
+def _seed_sequence(seed):
+    """Normaliza seed (None, int, SeedSequence o Generator) a un SeedSequence."""
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(int(seed.integers(2**63)))
+    return np.random.SeedSequence(seed)
+
+def _simulate_paths(spec, rng, num_paths):
+    """
+    Simula num_paths trayectorias completas con los parámetros de spec.
+
+    Returns:
+        tuple: (nominal, real, returns, black_swans). Saldos de forma
+        (num_paths, años + 1); retornos y cisnes negros de forma (num_paths, años).
+    """
+    if spec.get("time_step") == "monthly":
+        return _simulate_monthly_paths(spec, rng, num_paths)
+    if spec.get("portfolio") is not None:
+        return _simulate_portfolio_paths(spec, rng, num_paths)
+
+    annual_contributions = spec["annual_contributions"]
+    if spec.get("bootstrap") is not None:
+        asset_returns, black_swans = _draw_bootstrap_returns(rng, num_paths, len(annual_contributions), spec["bootstrap"])
+        returns = asset_returns[:, :, 0]
+    else:
+        returns, black_swans = _draw_annual_returns(
+            rng, num_paths, len(annual_contributions), spec["mean_return"], spec["volatility"],
+            spec["black_swan_enabled"], spec["black_swan_prob"], spec["t_df"], spec.get("sampling", "pseudo")
+        )
+    nominal = _simulate_balances(spec["initial_capital"], returns, annual_contributions)
+    # Saldo REAL (Deflactado): factor de descuento (1 + inflation)^year
+    real = nominal / spec["deflators"]
+    return nominal, real, returns, black_swans
+
+def _simulate_portfolio_paths(spec, rng, num_paths):
+    """
+    Simula una cartera de N activos con retornos correlacionados.
+
+    Los shocks de todos los activos, años y trayectorias se generan de una vez:
+    normales correlacionadas con el factor de Cholesky y escaladas por un mismo
+    chi-cuadrado por año (t-Student multivariante). Un cisne negro afecta a
+    todos los activos a la vez. Las aportaciones se reparten según los pesos
+    objetivo y la cartera se rebalancea cada rebalance_every años (0 = nunca).
+
+    Returns:
+        tuple: Igual que _simulate_paths; 'returns' es el retorno anual de la cartera.
+    """
+    portfolio = spec["portfolio"]
+    weights = portfolio["weights"]
+    rebalance_every = portfolio["rebalance_every"]
+    annual_contributions = spec["annual_contributions"]
+    total_years = len(annual_contributions)
+    t_df = spec["t_df"]
+
+    shape = (num_paths, total_years)
+    if spec.get("bootstrap") is not None:
+        asset_returns, black_swans = _draw_bootstrap_returns(rng, num_paths, total_years, spec["bootstrap"])
+    else:
+        asset_returns, black_swans = _draw_asset_returns(
+            rng, num_paths, total_years, portfolio, spec["black_swan_enabled"],
+            spec["black_swan_prob"], t_df, spec.get("sampling", "pseudo")
+        )
+
+    holdings = np.outer(np.full(num_paths, float(spec["initial_capital"])), weights)
+    nominal = np.empty((num_paths, total_years + 1))
+    nominal[:, 0] = spec["initial_capital"]
+    returns = np.empty(shape)
+
+    for year_idx in range(total_years):
+        holdings *= 1.0 + asset_returns[:, year_idx]
+        grown = holdings.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns[:, year_idx] = np.where(
+                nominal[:, year_idx] != 0,
+                grown / nominal[:, year_idx] - 1.0,
+                asset_returns[:, year_idx] @ weights
+            )
+        holdings += annual_contributions[year_idx] * weights
+        if rebalance_every and (year_idx + 1) % rebalance_every == 0:
+            holdings = np.outer(holdings.sum(axis=1), weights)
+        nominal[:, year_idx + 1] = holdings.sum(axis=1)
+
+    real = nominal / spec["deflators"]
+    return nominal, real, returns, black_swans
+
+class _QuantileSketch:
+    """
+    Histograma de valores por columna (año) con bordes fijos en espacio asinh.
+
+    Los bordes son los mismos para cualquier sketch, de modo que dos sketches se
+    combinan sumando sus conteos. asinh se comporta como un logaritmo para
+    saldos grandes y admite saldos negativos, con una resolución relativa del
+    orden del 0.2% por cubeta (que la interpolación dentro de la cubeta reduce).
+    """
+
+    LOWER = np.arcsinh(-1e12)
+    UPPER = np.arcsinh(1e15)
+
+    def __init__(self, num_columns, bins=QUANTILE_SKETCH_BINS):
+        self.num_columns = num_columns
+        self.bins = bins
+        self.width = (self.UPPER - self.LOWER) / bins
+        self.counts = np.zeros((num_columns, bins), dtype=np.int64)
+        self.count = 0
+
+    def add(self, values):
+        """Añade una matriz (trayectorias, columnas) de valores."""
+        positions = (np.arcsinh(values) - self.LOWER) / self.width
+        bin_idx = np.clip(positions, 0, self.bins - 1).astype(np.int64)
+        bin_idx += np.arange(self.num_columns, dtype=np.int64) * self.bins
+        self.counts += np.bincount(bin_idx.ravel(), minlength=self.counts.size).reshape(self.counts.shape)
+        self.count += values.shape[0]
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.count += other.count
+
+    def __getstate__(self):
+        # La mayoría de cubetas están vacías: se serializan solo las ocupadas
+        # para que los resultados de cada shard viajen ligeros entre procesos.
+        state = self.__dict__.copy()
+        flat = state.pop("counts").ravel()
+        nonzero = np.flatnonzero(flat)
+        state["nonzero"] = (nonzero, flat[nonzero])
+        return state
+
+    def __setstate__(self, state):
+        nonzero, values = state.pop("nonzero")
+        self.__dict__.update(state)
+        self.counts = np.zeros((self.num_columns, self.bins), dtype=np.int64)
+        self.counts.ravel()[nonzero] = values
+
+    def percentiles(self, qs):
+        """
+        Percentiles aproximados por columna con la misma convención que
+        np.percentile (interpolación lineal sobre el rango q * (n - 1)).
+
+        Returns:
+            np.ndarray: Forma (len(qs), num_columns).
+        """
+        cumulative = np.cumsum(self.counts, axis=1)
+        result = np.empty((len(qs), self.num_columns))
+        for i, q in enumerate(qs):
+            rank = q / 100.0 * (self.count - 1)
+            for col in range(self.num_columns):
+                bin_k = int(np.searchsorted(cumulative[col], rank, side="right"))
+                bin_k = min(bin_k, self.bins - 1)
+                below = cumulative[col, bin_k - 1] if bin_k > 0 else 0
+                in_bin = self.counts[col, bin_k]
+                fraction = (rank - below + 0.5) / in_bin if in_bin else 0.5
+                result[i, col] = np.sinh(self.LOWER + (bin_k + fraction) * self.width)
+        return result
+
+class _RiskSketch:
+    """
+    Métricas de riesgo de todas las trayectorias como conteos combinables
+    (igual que _QuantileSketch): histograma del drawdown máximo en [0, 1],
+    año en que el saldo real alcanza la meta (o nunca) y trayectorias que en
+    algún momento caen por debajo del capital invertido.
+    """
+
+    def __init__(self, total_years):
+        self.drawdown_counts = np.zeros(DRAWDOWN_BINS, dtype=np.int64)
+        # La última posición cuenta las trayectorias que nunca alcanzan la meta
+        self.goal_year_counts = np.zeros(total_years + 2, dtype=np.int64)
+        self.below_invested = 0
+        self.count = 0
+
+    def add(self, spec, nominal, real):
+        """Añade un bloque de saldos (trayectorias, años + 1) en una pasada vectorizada."""
+        drawdowns = _max_drawdowns(nominal)
+        bins = np.minimum((drawdowns * DRAWDOWN_BINS).astype(np.int64), DRAWDOWN_BINS - 1)
+        self.drawdown_counts += np.bincount(bins, minlength=DRAWDOWN_BINS)
+
+        goal = spec.get("financial_goal")
+        if goal is not None:
+            reached = real >= goal
+            years = np.where(reached.any(axis=1), reached.argmax(axis=1), reached.shape[1])
+            self.goal_year_counts += np.bincount(years, minlength=len(self.goal_year_counts))
+
+        below = nominal[:, 1:] < _invested_capital(spec)[1:]
+        self.below_invested += int(below.any(axis=1).sum())
+        self.count += nominal.shape[0]
+
+    def merge(self, other):
+        self.drawdown_counts += other.drawdown_counts
+        self.goal_year_counts += other.goal_year_counts
+        self.below_invested += other.below_invested
+        self.count += other.count
+
+    def summary(self, spec, finals_real):
+        """
+        Resumen para simulation_stats['risk']; las probabilidades van en %.
+
+        Returns:
+            dict: 'max_drawdown' (media, percentiles e histograma por tramos
+            de 5 puntos), 'value_at_risk' (VaR y CVaR del saldo final real por
+            nivel de confianza), 'time_to_goal' (probabilidad acumulada de
+            haber alcanzado la meta por año y percentiles del año; None sin
+            financial_goal) y 'probability_below_invested'.
+        """
+        total = max(self.count, 1)
+        centers = (np.arange(DRAWDOWN_BINS) + 0.5) / DRAWDOWN_BINS
+        drawdown_cdf = np.cumsum(self.drawdown_counts) / total
+        max_drawdown = {
+            "mean": float(self.drawdown_counts @ centers / total),
+            **{
+                f"p{q}": float(centers[min(int(np.searchsorted(drawdown_cdf, q / 100.0)), DRAWDOWN_BINS - 1)])
+                for q in RISK_PERCENTILES
+            },
+            "histogram": {
+                "bin_width": 0.05,
+                "probabilities": (self.drawdown_counts.reshape(20, -1).sum(axis=1) * 100.0 / total).tolist(),
+            },
+        }
+
+        # VaR: saldo final real que solo un (1 - nivel) de los escenarios no supera;
+        # CVaR: saldo medio en esos escenarios
+        value_at_risk = []
+        for level in VAR_LEVELS:
+            var = float(np.percentile(finals_real, (1.0 - level) * 100.0))
+            tail = finals_real[finals_real <= var]
+            value_at_risk.append({
+                "confidence": level,
+                "var": var,
+                "cvar": float(tail.mean()) if tail.size else var,
+            })
+
+        time_to_goal = None
+        if spec.get("financial_goal") is not None:
+            reached_by_year = np.cumsum(self.goal_year_counts[:-1]) / total
+
+            def year_at(q):
+                year = int(np.searchsorted(reached_by_year, q / 100.0))
+                return year if year < len(reached_by_year) else None
+
+            time_to_goal = {
+                "probability_by_year": (reached_by_year * 100.0).tolist(),
+                "never_probability": float(self.goal_year_counts[-1] * 100.0 / total),
+                **{f"p{q}": year_at(q) for q in (10, 50, 90)},
+            }
+
+        return {
+            "max_drawdown": max_drawdown,
+            "value_at_risk": value_at_risk,
+            "time_to_goal": time_to_goal,
+            "probability_below_invested": self.below_invested * 100.0 / total,
+        }
+
+def _expected_final_balance(spec):
+    """
+    Saldo final nominal esperado en forma cerrada (variable de control).
+
+    El saldo es lineal en el retorno de cada año y los años son
+    independientes, así que su esperanza es la recurrencia del saldo con el
+    retorno esperado de cada año: (1 - p) * media + p * crash medio.
+    """
+    swan_prob = spec["black_swan_prob"] if spec["black_swan_enabled"] else 0.0
+    if spec.get("time_step") == "monthly":
+        # Mismo razonamiento mes a mes: los crashes mensuales son independientes
+        monthly_swan_prob = 1.0 - (1.0 - swan_prob) ** (1.0 / 12.0)
+        monthly_mean = (1.0 + spec["mean_return"]) ** (1.0 / 12.0) - 1.0
+        growth = 1.0 + (1 - monthly_swan_prob) * monthly_mean + monthly_swan_prob * CRASH_MEAN_RETURN
+        balance = float(spec["initial_capital"])
+        for contribution in spec["annual_contributions"]:
+            for _ in range(12):
+                balance = balance * growth + contribution / 12.0
+        return balance
+
+    portfolio = spec.get("portfolio")
+    if portfolio is None:
+        expected_returns = np.array([(1 - swan_prob) * spec["mean_return"] + swan_prob * CRASH_MEAN_RETURN])
+        weights = np.ones(1)
+        rebalance_every = 1
+    else:
+        expected_returns = (1 - swan_prob) * portfolio["mean_returns"] + swan_prob * CRASH_MEAN_RETURN
+        weights = portfolio["weights"]
+        rebalance_every = portfolio["rebalance_every"]
+
+    holdings = spec["initial_capital"] * weights
+    for year_idx, contribution in enumerate(spec["annual_contributions"]):
+        holdings = holdings * (1.0 + expected_returns) + contribution * weights
+        if rebalance_every and (year_idx + 1) % rebalance_every == 0:
+            holdings = holdings.sum() * weights
+    return float(holdings.sum())
+
+def _sampling_units(block_sizes, sampling):
+    """
+    Inicio de cada unidad independiente dentro de los saldos finales
+    concatenados: cada trayectoria (pseudo), cada par (antithetic) o cada
+    réplica Sobol (sobol).
+    """
+    starts = []
+    offset = 0
+    for size in block_sizes:
+        if sampling == "antithetic":
+            local = np.arange(0, size, 2)
+        elif sampling == "sobol":
+            local = np.concatenate(([0], np.cumsum(_replicate_sizes(size))[:-1]))
+        else:
+            local = np.arange(size)
+        starts.append(offset + local)
+        offset += size
+    return np.concatenate(starts).astype(np.int64)
+
+def _critical_value(dof, confidence=0.95):
+    # Con pocas unidades (réplicas Sobol) se usa la t-Student en lugar de la normal
+    if dof >= 30:
+        return 1.959963984540054
+    from scipy.stats import t as student_t
+    return float(student_t.ppf(0.5 + confidence / 2, max(dof, 1)))
+
+def _mean_estimate(values, starts, control=None, control_mean=None):
+    """
+    Media de values con su error estándar e intervalo de confianza del 95%,
+    calculados sobre las medias por unidad independiente. Con control y
+    control_mean se aplica la variable de control: values - beta * (control - E[control]).
+
+    Con una sola unidad (p.ej. una trayectoria, o un par antitético) no se
+    puede estimar la varianza: std_error, el intervalo y efficiency son None.
+    """
+    counts = np.diff(np.append(starts, len(values)))
+    unit_values = np.add.reduceat(values, starts) / counts
+    value = float(values.mean())
+    units = len(starts)
+    dof = units - 1
+    if units < 2:
+        return {"value": value, "std_error": None, "ci_low": None, "ci_high": None, "efficiency": None}
+
+    if control is not None and units > 2:
+        unit_controls = np.add.reduceat(control, starts) / counts
+        control_var = unit_controls.var(ddof=1)
+        beta = float(np.cov(unit_values, unit_controls)[0, 1] / control_var) if control_var > 0 else 0.0
+        value -= beta * (float(control.mean()) - control_mean)
+        unit_values = unit_values - beta * unit_controls
+        dof -= 1
+
+    std_error = float(unit_values.std(ddof=1) / np.sqrt(units))
+    margin = _critical_value(dof) * std_error
+    # Eficiencia: varianza de Monte Carlo simple con las mismas trayectorias / varianza obtenida
+    plain_variance = values.var(ddof=1) / len(values)
+    # Sin error medible (p.ej. la media real con variable de control es exacta) no se informa
+    efficiency = float(plain_variance / std_error ** 2) if std_error > 1e-9 * max(abs(value), 1.0) else None
+    return {
+        "value": value,
+        "std_error": std_error,
+        "ci_low": value - margin,
+        "ci_high": value + margin,
+        "efficiency": efficiency,
+    }
+
+def _median_estimate(values, confidence_z=1.959963984540054):
+    """Mediana con intervalo de confianza por estadísticos de orden (binomial)."""
+    n = len(values)
+    half_width = confidence_z * np.sqrt(n) / 2
+    low = int(np.clip(np.floor(n / 2 - half_width), 0, n - 1))
+    high = int(np.clip(np.ceil(n / 2 + half_width), 0, n - 1))
+    ordered = np.partition(values, [low, high])
+    return {
+        "value": float(np.median(values)),
+        # Error estándar equivalente a la anchura del intervalo
+        "std_error": float((ordered[high] - ordered[low]) / (2 * confidence_z)),
+        "ci_low": float(ordered[low]),
+        "ci_high": float(ordered[high]),
+    }
+
+def _wilson_interval(successes, n, confidence_z=1.959963984540054):
+    """Intervalo de Wilson de una proporción binomial (fiable también cerca de 0 y 1)."""
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    z2 = confidence_z ** 2
+    center = (p + z2 / (2 * n)) / (1 + z2 / n)
+    half_width = confidence_z / (1 + z2 / n) * np.sqrt(p * (1 - p) / n + z2 / (4 * n ** 2))
+    return float(center - half_width), float(center + half_width)
+
+def _sampling_estimates(spec, finals_nominal, finals_real, block_sizes):
+    """
+    Estimadores con intervalos de confianza del 95% según la estrategia de
+    muestreo: probabilidad de éxito (en %, si hay financial_goal), saldo final
+    real medio y mediano. Añade el paso temporal, el modelo de inflación y,
+    con bootstrap histórico, su configuración.
+    """
+    sampling = spec.get("sampling", "pseudo")
+    starts = _sampling_units(block_sizes, sampling)
+    control = control_mean = None
+    if spec.get("control_variate"):
+        control = finals_nominal
+        control_mean = _expected_final_balance(spec)
+
+    estimates = {
+        "mean_final_real": _mean_estimate(finals_real, starts, control, control_mean),
+        "median_final_real": _median_estimate(finals_real),
+    }
+    if spec.get("financial_goal") is not None:
+        reached = finals_real >= spec["financial_goal"]
+        success = _mean_estimate(reached * 100.0, starts, control, control_mean)
+        if sampling == "pseudo" and control is None:
+            # Trayectorias independientes: intervalo binomial exacto en forma (Wilson)
+            low, high = _wilson_interval(int(reached.sum()), len(reached))
+            success["ci_low"], success["ci_high"] = low * 100.0, high * 100.0
+        for key in ("value", "ci_low", "ci_high"):
+            if success[key] is not None:
+                success[key] = float(np.clip(success[key], 0.0, 100.0))
+        estimates["success_probability"] = success
+
+    return {
+        "sampling": sampling,
+        "control_variate": control is not None,
+        "confidence_level": 0.95,
+        "estimates": estimates,
+        "bootstrap": {
+            "method": spec["bootstrap"]["method"],
+            "block_length": spec["bootstrap"]["block_length"],
+            "history_months": len(spec["bootstrap"]["log_returns"]),
+        } if spec.get("bootstrap") is not None else None,
+        "time_step": spec.get("time_step", "annual"),
+        "inflation_model": dict(spec["inflation_model"]) if spec.get("inflation_model") is not None else None,
+    }
+
+def _median_path_index(final_balances_nom):
+    # Trayectoria cuyo saldo final nominal está más cerca de la mediana
+    median_val_nom = np.median(final_balances_nom)
+    return int((np.abs(final_balances_nom - median_val_nom)).argmin())
+
+def _build_simulation_outputs(
+    spec,
+    fan_nominal,
+    fan_real,
+    median_curve,
+    median_returns,
+    median_black_swans,
+    final_balances_real,
+    extra_stats=None
+):
+    """
+    Construye las salidas de run_monte_carlo_simulation.
+
+    Args:
+        fan_nominal, fan_real: Percentiles P10/P50/P90 por año, forma (3, años + 1).
+        median_curve: Saldos nominales del escenario mediano (años + 1).
+        median_returns, median_black_swans: Retorno y cisne negro del escenario
+            mediano; la posición i corresponde al año i + 1.
+        final_balances_real: Saldos finales reales de todas las trayectorias.
+        extra_stats: Entradas adicionales para simulation_stats.
+    """
+    import pandas as pd
+
+    initial_capital = spec["initial_capital"]
+    annual_contributions = spec["annual_contributions"]
+    total_years = len(annual_contributions)
+
+    # Calcular acumulados "deterministas"
+    cumulative_contributions = np.concatenate(([0.0], np.cumsum(annual_contributions)))
+    invested_capital_total = initial_capital + cumulative_contributions
+
+    # Calcular Capital Invertido REAL (Deflactado) - Representa el poder adquisitivo del efectivo si se hubiera guardado bajo el colchón
+    invested_capital_real = invested_capital_total / spec["deflators"]
+
+    # DataFrame Resumen (Contiene datos Nominales y Reales)
+    summary_df = pd.DataFrame({
+        "Year": range(total_years + 1),
+        "Invested": invested_capital_total,
+        "Invested_Real": invested_capital_real,
+        "P10_Nominal": fan_nominal[0], "Median_Nominal": fan_nominal[1], "P90_Nominal": fan_nominal[2],
+        "P10_Real": fan_real[0], "Median_Real": fan_real[1], "P90_Real": fan_real[2]
+    })
+
+    # --- Detalle Escenario Mediano (Nominal) ---
+    # Max Drawdown para el escenario mediano
+    max_drawdown = _max_drawdown(median_curve)
+
+    median_details = []
+    for year_idx in range(total_years):
+        prev_balance = median_curve[year_idx]
+        curr_balance = median_curve[year_idx + 1]
+        contrib = annual_contributions[year_idx]
+
+        median_details.append({
+            "Año": int(year_idx + 1),
+            "Saldo Inicial": float(prev_balance),
+            "Aportación Anual": float(contrib),
+            "Retorno (%)": float(median_returns[year_idx] * 100),
+            "Interés Generado": float(curr_balance - prev_balance - contrib),
+            "Saldo Final": float(curr_balance),
+            "Is_Black_Swan": bool(median_black_swans[year_idx])
+        })
+
+    breakdown_df = pd.DataFrame({
+        "Year": range(total_years + 1),
+        "Capital Inicial": [initial_capital] * (total_years + 1),
+        "Aportaciones": cumulative_contributions,
+        "Interés Compuesto": median_curve - initial_capital - cumulative_contributions
+    })
+    # El año 0 no tiene interés generado
+    breakdown_df.loc[0, "Interés Compuesto"] = 0
+
+    # Añadimos columna Is_Black_Swan al breakdown_df para facilitar el ploteo
+    # Ojo: breakdown_df tiene fila 0 (año 0), median_details empieza en año 1.
+    # Rellenamos con False el año 0.
+    breakdown_df["Is_Black_Swan"] = [False] + [d["Is_Black_Swan"] for d in median_details]
+
+    simulation_stats = {
+        "max_drawdown": max_drawdown
+    }
+    simulation_stats.update(extra_stats or {})
+
+    return summary_df, median_details, breakdown_df, simulation_stats, final_balances_real
+
+def _run_in_memory(spec, num_simulations, seed):
+    """Simulación con todas las trayectorias en memoria y percentiles exactos."""
+    rng = np.random.default_rng(seed)
+    with stage("simulate"):
+        nominal, real, returns, black_swans = _simulate_paths(spec, rng, num_simulations)
+
+    with stage("percentiles"):
+        fan_nominal = np.percentile(nominal, FAN_PERCENTILES, axis=0)
+        fan_real = np.percentile(real, FAN_PERCENTILES, axis=0)
+    with stage("median_path"):
+        median_idx = _median_path_index(nominal[:, -1])
+
+    with stage("risk"):
+        risk = _RiskSketch(nominal.shape[1] - 1)
+        risk.add(spec, nominal, real)
+        risk_summary = risk.summary(spec, real[:, -1])
+
+    with stage("estimates"):
+        extra_stats = {"mode": "in_memory", "chunks": 1, "risk": risk_summary}
+        extra_stats.update(_sampling_estimates(spec, nominal[:, -1], real[:, -1], [num_simulations]))
+
+    with stage("outputs"):
+        return _build_simulation_outputs(
+            spec, fan_nominal, fan_real,
+            nominal[median_idx], returns[median_idx], black_swans[median_idx],
+            real[:, -1].copy(),
+            extra_stats=extra_stats
+        )
+
+def _chunk_sizes(num_simulations, chunk_size):
+    full_chunks, remainder = divmod(num_simulations, chunk_size)
+    return [chunk_size] * full_chunks + ([remainder] if remainder else [])
+
+def _plan_blocks(num_simulations, seed, chunk_size, shards=1):
+    """
+    Reparte las trayectorias en bloques, cada uno con su propia semilla.
+
+    Sin shards, los bloques se derivan directamente de la semilla raíz. Con
+    shards, la raíz genera una semilla independiente por shard
+    (SeedSequence.spawn) y cada shard la subdivide en sus bloques, de modo que
+    la misma semilla y el mismo número de shards reproducen exactamente el
+    mismo resultado.
+
+    Returns:
+        list: Una lista de bloques (tamaño, SeedSequence) por shard.
+    """
+    root = _seed_sequence(seed)
+    if shards <= 1:
+        sizes = _chunk_sizes(num_simulations, chunk_size)
+        return [list(zip(sizes, root.spawn(len(sizes))))]
+
+    shards = min(shards, num_simulations)
+    base, extra = divmod(num_simulations, shards)
+    plan = []
+    for shard_idx, shard_seed in enumerate(root.spawn(shards)):
+        sizes = _chunk_sizes(base + (1 if shard_idx < extra else 0), chunk_size)
+        plan.append(list(zip(sizes, shard_seed.spawn(len(sizes)))))
+    return plan
+
+def _simulate_blocks(spec, blocks):
+    """
+    Simula una lista de bloques y devuelve su resumen combinable.
+
+    Es la unidad de trabajo de cada shard, por lo que debe ser picklable para
+    ejecutarse en un pool de procesos.
+    """
+    total_years = len(spec["annual_contributions"])
+    sketch_nominal = _QuantileSketch(total_years + 1)
+    sketch_real = _QuantileSketch(total_years + 1)
+    risk = _RiskSketch(total_years)
+    finals_nominal = []
+    finals_real = []
+
+    for size, block_seed in blocks:
+        with stage("simulate"):
+            nominal, real, _, _ = _simulate_paths(spec, np.random.default_rng(block_seed), size)
+        with stage("percentiles"):
+            sketch_nominal.add(nominal)
+            sketch_real.add(real)
+        with stage("risk"):
+            risk.add(spec, nominal, real)
+        finals_nominal.append(nominal[:, -1].copy())
+        finals_real.append(real[:, -1].copy())
+        del nominal, real
+
+    return {
+        "sketch_nominal": sketch_nominal,
+        "sketch_real": sketch_real,
+        "risk": risk,
+        "finals_nominal": np.concatenate(finals_nominal) if finals_nominal else np.empty(0),
+        "finals_real": np.concatenate(finals_real) if finals_real else np.empty(0),
+    }
+
+def _run_streaming(spec, plan, executor=None):
     """
-    Calcula estadísticas ponderadas para una cartera de dos activos,
-    considerando la correlación real entre ellos.
-    
-    Args:
-        ticker1 (str): Primer activo (ej. 'IWDA.AS').
-        ticker2 (str): Segundo activo (ej. 'EEM').
-        weight1 (float): Peso del primer activo (0.0 a 1.0).
-        period (str): Periodo histórico para correlación.
-        
-    Returns:
-        dict: Stats de la cartera combinada.
+    Simulación por bloques con memoria acotada, opcionalmente repartida en shards.
+
+    Los percentiles por año se acumulan en sketches combinables y de cada
+    bloque solo se conservan los saldos finales. Los shards se combinan en
+    orden, y el escenario mediano se reconstruye al final regenerando su
+    bloque con la misma semilla.
     """
-    weight2 = 1.0 - weight1
-    try:
-        # Descargar datos conjuntos para asegurar alineación de fechas
-        data = yf.download([ticker1, ticker2], period=period, progress=False)['Close']
-        
-        if data.empty or len(data.columns) < 2:
-            return None
-            
-        # Calcular retornos diarios
-        returns = data.pct_change().dropna()
-        
-        # Medias y Covarianzas anualizadas
-        mean_returns = returns.mean() * 252
-        cov_matrix = returns.cov() * 252
-        
-        # Retorno esperado de la cartera
-        # Nota: yfinance devuelve columnas con los tickers, accedemos por nombre
-        r1 = mean_returns[ticker1]
-        r2 = mean_returns[ticker2]
-        portfolio_return = r1 * weight1 + r2 * weight2
-        
-        # Volatilidad de la cartera (Formula: w1^2*s1^2 + w2^2*s2^2 + 2*w1*w2*cov12)
-        var1 = cov_matrix.loc[ticker1, ticker1]
-        var2 = cov_matrix.loc[ticker2, ticker2]
-        cov12 = cov_matrix.loc[ticker1, ticker2]
-        
-        portfolio_variance = (weight1**2 * var1) + (weight2**2 * var2) + (2 * weight1 * weight2 * cov12)
-        portfolio_volatility = np.sqrt(portfolio_variance)
-        
-        # Correlación (para mostrar al usuario)
-        correlation = returns.corr().loc[ticker1, ticker2]
-        
-        return {
-            "mean_return": portfolio_return,
-            "volatility": portfolio_volatility,
+    if executor is not None and len(plan) > 1:
+        # Los shards se miden en bloque: sus etapas internas ocurren en otros procesos
+        with stage("simulate"):
+            shard_results = list(executor.map(_simulate_blocks, [spec] * len(plan), plan))
+    else:
+        shard_results = [_simulate_blocks(spec, blocks) for blocks in plan]
+
+    with stage("percentiles"):
+        total_years = len(spec["annual_contributions"])
+        sketch_nominal = _QuantileSketch(total_years + 1)
+        sketch_real = _QuantileSketch(total_years + 1)
+        risk = _RiskSketch(total_years)
+        for result in shard_results:
+            sketch_nominal.merge(result["sketch_nominal"])
+            sketch_real.merge(result["sketch_real"])
+            risk.merge(result["risk"])
+    finals_nominal = np.concatenate([r["finals_nominal"] for r in shard_results])
+    finals_real = np.concatenate([r["finals_real"] for r in shard_results])
+    del shard_results
+
+    blocks = [block for shard_blocks in plan for block in shard_blocks]
+    return _finish_blocks(
+        spec, blocks, sketch_nominal, sketch_real, risk, finals_nominal, finals_real,
+        {"mode": "streaming", "chunks": len(blocks), "shards": len(plan)}
+    )
+
+def _finish_blocks(spec, blocks, sketch_nominal, sketch_real, risk, finals_nominal, finals_real, extra_stats):
+    """
+    Salidas de una simulación por bloques a partir de sus sketches y saldos
+    finales: percentiles, escenario mediano (regenerando su bloque con la
+    misma semilla), métricas de riesgo y estimadores con intervalos de
+    confianza.
+    """
+    with stage("percentiles"):
+        fan_nominal = sketch_nominal.percentiles(FAN_PERCENTILES)
+        fan_real = sketch_real.percentiles(FAN_PERCENTILES)
+
+    # Regenerar únicamente el bloque que contiene el escenario mediano
+    with stage("median_path"):
+        block_ends = np.cumsum([size for size, _ in blocks])
+        median_idx = _median_path_index(finals_nominal)
+        block_idx = int(np.searchsorted(block_ends, median_idx, side="right"))
+        local_idx = median_idx - (block_ends[block_idx - 1] if block_idx else 0)
+        size, block_seed = blocks[block_idx]
+        nominal, _, returns, black_swans = _simulate_paths(spec, np.random.default_rng(block_seed), size)
+
+    with stage("risk"):
+        extra_stats = dict(extra_stats, risk=risk.summary(spec, finals_real))
+
+    with stage("estimates"):
+        extra_stats.update(_sampling_estimates(spec, finals_nominal, finals_real, [size for size, _ in blocks]))
+
+    with stage("outputs"):
+        return _build_simulation_outputs(
+            spec, fan_nominal, fan_real,
+            nominal[local_idx], returns[local_idx], black_swans[local_idx],
+            finals_real,
+            extra_stats=extra_stats
+        )
+
+def _simulation_spec(
+    initial_capital,
+    contribution_schedule,
+    mean_return,
+    volatility,
+    black_swan_enabled,
+    black_swan_prob,
+    inflation_rate,
+    t_df,
+    portfolio=None,
+    sampling="pseudo",
+    control_variate=False,
+    financial_goal=None,
+    bootstrap=None,
+    time_step="annual",
+    inflation_model=None
+):
+    """Agrupa los parámetros de una simulación (picklable, sin estado aleatorio)."""
+    if sampling not in SAMPLING_MODES:
+        raise ValueError(f"Muestreo desconocido: {sampling} (opciones: {', '.join(SAMPLING_MODES)})")
+    if time_step not in TIME_STEPS:
+        raise ValueError(f"Paso temporal desconocido: {time_step} (opciones: {', '.join(TIME_STEPS)})")
+    if time_step == "monthly" and portfolio is not None:
+        raise ValueError("El paso mensual no admite carteras multiactivo")
+    if inflation_model is not None:
+        if time_step != "monthly":
+            raise ValueError("La inflación estocástica requiere paso mensual")
+        persistence = float(inflation_model.get("persistence", INFLATION_PERSISTENCE))
+        correlation = float(inflation_model.get("correlation", 0.0))
+        inflation_volatility = float(inflation_model["volatility"])
+        if not 0.0 <= persistence < 1.0 or not -1.0 <= correlation <= 1.0:
+            raise ValueError("La persistencia debe estar en [0, 1) y la correlación en [-1, 1]")
+        if not inflation_volatility >= 0.0:
+            raise ValueError("La volatilidad de la inflación no puede ser negativa")
+        inflation_model = {
+            "volatility": inflation_volatility,
+            "persistence": persistence,
             "correlation": correlation,
-            "details": {
-                ticker1: {"return": r1, "vol": np.sqrt(var1)},
-                ticker2: {"return": r2, "vol": np.sqrt(var2)}
-            }
         }
-    except Exception as e:
-        print(f"Error en cartera mixta: {e}")
-        return None
+    annual_contributions = _expand_annual_contributions(contribution_schedule)
+    if portfolio is not None:
+        portfolio = {
+            "mean_returns": np.asarray(portfolio.get("mean_returns", []), dtype=float),
+            "cholesky": np.asarray(portfolio.get("cholesky", []), dtype=float),
+            "weights": _normalize_weights(portfolio["weights"]),
+            "rebalance_every": int(portfolio.get("rebalance_every", 1)),
+        }
+    if bootstrap is not None:
+        if sampling != "pseudo" or control_variate:
+            raise ValueError("El bootstrap histórico solo admite muestreo pseudoaleatorio sin variable de control")
+        method = bootstrap.get("method", "stationary")
+        if method not in BOOTSTRAP_METHODS:
+            raise ValueError(f"Bootstrap desconocido: {method} (opciones: {', '.join(BOOTSTRAP_METHODS)})")
+        log_returns = np.asarray(bootstrap["log_returns"], dtype=float)
+        if log_returns.ndim == 1:
+            log_returns = log_returns[:, None]
+        expected_assets = len(portfolio["weights"]) if portfolio is not None else 1
+        if log_returns.shape[1] != expected_assets:
+            raise ValueError("log_returns debe tener una columna por activo")
+        bootstrap = {
+            "log_returns": log_returns,
+            "block_length": max(1, int(bootstrap.get("block_length", 12))),
+            "method": method,
+        }
+    return {
+        "initial_capital": initial_capital,
+        "annual_contributions": annual_contributions,
+        "mean_return": mean_return,
+        "volatility": volatility,
+        "black_swan_enabled": black_swan_enabled,
+        "black_swan_prob": black_swan_prob,
+        "inflation_rate": inflation_rate,
+        "t_df": t_df,
+        "deflators": (1 + inflation_rate) ** np.arange(len(annual_contributions) + 1),
+        "portfolio": portfolio,
+        "sampling": sampling,
+        # La esperanza del shock t-Student solo existe con más de 1 grado de libertad
+        "control_variate": bool(control_variate) and t_df > 1,
+        "financial_goal": financial_goal,
+        "bootstrap": bootstrap,
+        "time_step": time_step,
+        "inflation_model": inflation_model,
+    }
 
 def run_monte_carlo_simulation(
     initial_capital,
@@ -117,10 +1563,31 @@ def run_monte_carlo_simulation(
     black_swan_prob=0.02,
     inflation_rate=0.02,
     num_simulations=1000,
-    t_df=3
+    t_df=3,
+    seed=None,
+    chunk_size=None,
+    shards=1,
+    executor=None,
+    portfolio=None,
+    sampling="pseudo",
+    control_variate=False,
+    financial_goal=None,
+    bootstrap=None,
+    time_step="annual",
+    inflation_model=None
 ):
     """
     Ejecuta una simulación de Monte Carlo avanzada.
+
+    Todos los shocks t-Student, cisnes negros y magnitudes de crash se generan
+    como matrices completas con un np.random.Generator, y los saldos se
+    construyen con una recurrencia vectorizada sobre los años.
+
+    Si num_simulations supera chunk_size, las trayectorias se procesan por
+    bloques (modo streaming): la memoria queda acotada por el tamaño del bloque
+    y los percentiles del fan chart se estiman con histogramas combinables.
+    Con shards > 1 los bloques se reparten entre procesos (executor o el pool
+    compartido de get_process_pool) con semillas independientes por shard.
     
     Args:
         contribution_schedule: Lista de tuplas (años, mensualidad).
@@ -129,185 +1596,566 @@ def run_monte_carlo_simulation(
         black_swan_enabled: Si se activan los eventos extremos.
         inflation_rate: Tasa de inflación anual (decimal).
         t_df: Grados de libertad para la distribución t-Student.
+        seed: Semilla (int, SeedSequence o Generator) para reproducibilidad.
+        chunk_size: Trayectorias por bloque (por defecto DEFAULT_CHUNK_SIZE).
+        shards: Número de shards en que se reparten las trayectorias.
+        executor: Executor donde ejecutar los shards (p.ej. ProcessPoolExecutor).
+        portfolio: Cartera multiactivo opcional: dict con 'mean_returns',
+            'cholesky' (de estimate_asset_covariance), 'weights' y
+            'rebalance_every' (años entre rebalanceos, 0 = nunca). Sustituye a
+            mean_return/volatility.
+        sampling: 'pseudo' (por defecto), 'antithetic' (pares de trayectorias
+            con shocks opuestos) o 'sobol' (Sobol aleatorizado con réplicas
+            independientes; requiere scipy).
+        control_variate: Corregir los estimadores con el saldo final
+            esperado en forma cerrada como variable de control.
+        financial_goal: Meta en términos reales; si se indica,
+            simulation_stats incluye la probabilidad de éxito estimada.
+        bootstrap: Modelo de retornos histórico opcional en lugar del
+            paramétrico: dict con 'log_returns' (de get_monthly_log_returns,
+            una columna por activo), 'block_length' (meses) y 'method'
+            ('stationary' o 'fixed'). Ignora mean_return, volatility y los
+            cisnes negros inyectados: los crashes son los de la historia.
+        time_step: 'annual' (por defecto) o 'monthly': retornos, crashes y
+            aportaciones mes a mes (la mensualidad del calendario), con las
+            salidas agregadas a fin de año. No admite portfolio.
+        inflation_model: Inflación estocástica opcional (requiere paso
+            mensual): dict con 'volatility' (desviación típica de la
+            inflación anual, decimal), 'persistence' (AR(1) mensual, por
+            defecto INFLATION_PERSISTENCE) y 'correlation' con la parte
+            gaussiana de los shocks de retorno. Oscila alrededor de
+            inflation_rate; el capital invertido real de summary_df sigue
+            deflactado con inflation_rate.
         
     Retorna:
         - summary_df: DataFrame con percentiles (Nominal y Real).
         - median_details: Detalle año a año del escenario mediano.
         - breakdown_df: DataFrame para el gráfico de barras apiladas.
-        - simulation_stats: Diccionario con estadísticas extra (Max Drawdown, etc).
+        - simulation_stats: Diccionario con estadísticas extra (Max Drawdown
+          del escenario mediano, en 'risk' las métricas de riesgo de todas las
+          trayectorias y en 'estimates' los estimadores con intervalo de
+          confianza del 95%).
         - final_balances_real: Array con todos los saldos finales reales (para probabilidad de éxito).
     """
-    
-    # 1. Expandir el calendario de aportaciones a una lista año a año
-    annual_contributions_list = []
-    for duration, monthly_amount in contribution_schedule:
-        # Aseguramos que duration sea entero
-        years_in_tranche = int(duration)
-        annual_amount = monthly_amount * 12
-        annual_contributions_list.extend([annual_amount] * years_in_tranche)
-        
-    total_years = len(annual_contributions_list)
-    
-    # Matriz de resultados NOMINALES (Simulaciones x Años+1)
-    results_nominal = np.zeros((num_simulations, total_years + 1))
-    results_nominal[:, 0] = initial_capital
-    
-    # Matriz de resultados REALES (Ajustados por inflación)
-    results_real = np.zeros((num_simulations, total_years + 1))
-    results_real[:, 0] = initial_capital
-    
-    # Matriz de retornos para análisis
-    returns_matrix = np.zeros((num_simulations, total_years + 1))
-    
-    # Matriz para rastrear Black Swans
-    black_swan_matrix = np.zeros((num_simulations, total_years + 1), dtype=bool)
-    
-    # Factor de normalización para t-student (df=t_df, var=df/(df-2) para df>2)
-    # Para estandarizar t-student a varianza 1, dividimos por sqrt(df/(df-2))
-    if t_df > 2:
-        t_std_dev = np.sqrt(t_df / (t_df - 2))
-    else:
-        t_std_dev = 1.0 # Fallback para df bajos donde varianza es infinita o indefinida
-    
-    for sim in range(num_simulations):
-        balance = initial_capital
-        
-        for year_idx in range(total_years):
-            year_num = year_idx + 1
-            contribution = annual_contributions_list[year_idx]
-            
-            # Lógica de Retorno
-            is_black_swan = False
-            if black_swan_enabled and np.random.random() < black_swan_prob:
-                is_black_swan = True
-                r_t = np.random.uniform(-0.50, -0.20)
-                black_swan_matrix[sim, year_num] = True
-            else:
-                t_random = np.random.standard_t(t_df) / t_std_dev
-                r_t = mean_return + volatility * t_random
-            
-            returns_matrix[sim, year_num] = r_t
-            
-            # Cálculo del saldo NOMINAL
-            balance = balance * (1 + r_t) + contribution
-            results_nominal[sim, year_num] = balance
-            
-            # Cálculo del saldo REAL (Deflactado)
-            # Factor de descuento de inflación: (1 + inflation)^year_num
-            deflator = (1 + inflation_rate) ** year_num
-            results_real[sim, year_num] = balance / deflator
+    spec = _simulation_spec(
+        initial_capital, contribution_schedule, mean_return, volatility,
+        black_swan_enabled, black_swan_prob, inflation_rate, t_df, portfolio,
+        sampling, control_variate, financial_goal, bootstrap, time_step, inflation_model
+    )
+    chunk_size = int(chunk_size or DEFAULT_CHUNK_SIZE)
+    shards = max(1, int(shards or 1))
+    count("paths", num_simulations)
+    count("path_years", num_simulations * len(spec["annual_contributions"]))
 
-    # --- Procesar Resultados (Usamos Nominal por defecto para gráficos estándar, pero guardamos Real) ---
-    
-    # Percentiles NOMINALES
-    p10_nom = np.percentile(results_nominal, 10, axis=0)
-    p50_nom = np.percentile(results_nominal, 50, axis=0)
-    p90_nom = np.percentile(results_nominal, 90, axis=0)
-    
-    # Percentiles REALES
-    p10_real = np.percentile(results_real, 10, axis=0)
-    p50_real = np.percentile(results_real, 50, axis=0)
-    p90_real = np.percentile(results_real, 90, axis=0)
-    
-    # Calcular acumulados "deterministas"
-    cumulative_contributions = [0] * (total_years + 1)
-    current_contrib_sum = 0
-    for i in range(total_years):
-        current_contrib_sum += annual_contributions_list[i]
-        cumulative_contributions[i+1] = current_contrib_sum
-        
-    invested_capital_total = [initial_capital + c for c in cumulative_contributions]
-    
-    # Calcular Capital Invertido REAL (Deflactado) - Representa el poder adquisitivo del efectivo si se hubiera guardado bajo el colchón
-    invested_capital_real = []
-    for i, val in enumerate(invested_capital_total):
-        deflator = (1 + inflation_rate) ** i
-        invested_capital_real.append(val / deflator)
-    
-    # DataFrame Resumen (Contiene datos Nominales y Reales)
-    summary_df = pd.DataFrame({
-        "Year": range(total_years + 1),
-        "Invested": invested_capital_total,
-        "Invested_Real": invested_capital_real,
-        "P10_Nominal": p10_nom, "Median_Nominal": p50_nom, "P90_Nominal": p90_nom,
-        "P10_Real": p10_real, "Median_Real": p50_real, "P90_Real": p90_real
-    })
-    
-    # --- Detalle Escenario Mediano (Nominal) ---
-    final_balances_nom = results_nominal[:, -1]
-    median_val_nom = np.median(final_balances_nom)
-    median_sim_idx = (np.abs(final_balances_nom - median_val_nom)).argmin()
-    
-    # Calcular Max Drawdown para el escenario mediano
-    # Drawdown = (Peak - Current) / Peak
-    median_curve = results_nominal[median_sim_idx, :]
-    peak = median_curve[0]
-    max_drawdown = 0.0
-    
-    for val in median_curve:
-        if val > peak:
-            peak = val
-        dd = (peak - val) / peak
-        if dd > max_drawdown:
-            max_drawdown = dd
-            
-    median_details = []
-    stacked_initial = []
-    stacked_contributed = []
-    stacked_interest = []
-    
-    for i in range(total_years + 1):
-        if i == 0:
-            stacked_initial.append(initial_capital)
-            stacked_contributed.append(0)
-            stacked_interest.append(0)
+    if shards == 1 and num_simulations <= chunk_size:
+        return _run_in_memory(spec, num_simulations, seed)
+
+    plan = _plan_blocks(num_simulations, seed, chunk_size, shards)
+    if len(plan) > 1 and executor is None:
+        executor = get_process_pool()
+    return _run_streaming(spec, plan, executor)
+
+def run_adaptive_simulation(
+    initial_capital,
+    contribution_schedule,
+    financial_goal,
+    mean_return=0.08,
+    volatility=0.15,
+    black_swan_enabled=True,
+    black_swan_prob=0.02,
+    inflation_rate=0.02,
+    t_df=3,
+    seed=None,
+    tolerance=0.5,
+    median_tolerance=0.01,
+    batch_size=5_000,
+    max_paths=200_000,
+    time_budget=None,
+    portfolio=None,
+    sampling="pseudo",
+    control_variate=False,
+    bootstrap=None,
+    time_step="annual",
+    inflation_model=None
+):
+    """
+    Simulación de Monte Carlo con número de trayectorias adaptativo.
+
+    Simula por lotes (con el mismo motor por bloques que el modo streaming) y
+    tras cada lote recalcula el intervalo de confianza del 95% de la
+    probabilidad de éxito (binomial de Wilson en muestreo pseudoaleatorio) y
+    el error estándar de la mediana del saldo final real. Se detiene cuando
+    ambos cumplen la tolerancia o se agota el presupuesto de trayectorias o
+    de tiempo.
+
+    Args:
+        financial_goal: Meta en términos reales.
+        tolerance: Semiamplitud máxima del intervalo de la probabilidad de
+            éxito, en puntos porcentuales.
+        median_tolerance: Error estándar máximo de la mediana, relativo a ella.
+        batch_size: Trayectorias por lote.
+        max_paths: Presupuesto máximo de trayectorias.
+        time_budget: Segundos máximos (None = sin límite); siempre se
+            simula al menos un lote.
+        (resto): Igual que run_monte_carlo_simulation.
+
+    Returns:
+        Las mismas salidas que run_monte_carlo_simulation; simulation_stats
+        incluye 'paths', 'batches', 'stop_reason' ('tolerance', 'max_paths' o
+        'time_budget') y la precisión alcanzada en 'precision'.
+    """
+    spec = _simulation_spec(
+        initial_capital, contribution_schedule, mean_return, volatility,
+        black_swan_enabled, black_swan_prob, inflation_rate, t_df, portfolio,
+        sampling, control_variate, financial_goal, bootstrap, time_step, inflation_model
+    )
+    batch_size = max(1, int(batch_size))
+    if sampling == "antithetic":
+        # Lotes pares para que ningún par quede partido
+        batch_size += batch_size % 2
+    max_paths = max(1, int(max_paths))
+
+    started = time.perf_counter()
+    root = _seed_sequence(seed)
+    total_years = len(spec["annual_contributions"])
+    sketch_nominal = _QuantileSketch(total_years + 1)
+    sketch_real = _QuantileSketch(total_years + 1)
+    risk = _RiskSketch(total_years)
+    finals_nominal = np.empty(0)
+    finals_real = np.empty(0)
+    blocks = []
+
+    while True:
+        size = min(batch_size, max_paths - len(finals_real))
+        block = (size, root.spawn(1)[0])
+        result = _simulate_blocks(spec, [block])
+        blocks.append(block)
+        sketch_nominal.merge(result["sketch_nominal"])
+        sketch_real.merge(result["sketch_real"])
+        risk.merge(result["risk"])
+        finals_nominal = np.concatenate([finals_nominal, result["finals_nominal"]])
+        finals_real = np.concatenate([finals_real, result["finals_real"]])
+        del result
+
+        with stage("estimates"):
+            estimates = _sampling_estimates(spec, finals_nominal, finals_real, [b[0] for b in blocks])["estimates"]
+        success = estimates["success_probability"]
+        median = estimates["median_final_real"]
+        precision = {
+            # None mientras solo haya una unidad independiente (sin intervalo)
+            "success_probability_half_width": (
+                (success["ci_high"] - success["ci_low"]) / 2 if success["ci_low"] is not None else None
+            ),
+            "median_relative_std_error": median["std_error"] / abs(median["value"]) if median["value"] else 0.0,
+        }
+
+        if (precision["success_probability_half_width"] is not None
+                and precision["success_probability_half_width"] <= tolerance
+                and precision["median_relative_std_error"] <= median_tolerance):
+            stop_reason = "tolerance"
+        elif len(finals_real) >= max_paths:
+            stop_reason = "max_paths"
+        elif time_budget is not None and time.perf_counter() - started >= time_budget:
+            stop_reason = "time_budget"
+        else:
             continue
-            
-        year_num = i
-        prev_balance = results_nominal[median_sim_idx, i-1]
-        curr_balance = results_nominal[median_sim_idx, i]
-        r_t = returns_matrix[median_sim_idx, i]
-        contrib = annual_contributions_list[i-1]
-        is_bs = bool(black_swan_matrix[median_sim_idx, i])
-        
-        interest_generated = curr_balance - prev_balance - contrib
-        
-        median_details.append({
-            "Año": int(year_num),
-            "Saldo Inicial": float(prev_balance),
-            "Aportación Anual": float(contrib),
-            "Retorno (%)": float(r_t * 100),
-            "Interés Generado": float(interest_generated),
-            "Saldo Final": float(curr_balance),
-            "Is_Black_Swan": is_bs
-        })
-        
-        stacked_initial.append(initial_capital)
-        stacked_contributed.append(cumulative_contributions[i])
-        total_interest = curr_balance - initial_capital - cumulative_contributions[i]
-        stacked_interest.append(total_interest)
+        break
 
-    breakdown_df = pd.DataFrame({
-        "Year": range(total_years + 1),
-        "Capital Inicial": stacked_initial,
-        "Aportaciones": stacked_contributed,
-        "Interés Compuesto": stacked_interest
-    })
-    
-    # Añadimos columna Is_Black_Swan al breakdown_df para facilitar el ploteo
-    # Ojo: breakdown_df tiene fila 0 (año 0), median_details empieza en año 1.
-    # Rellenamos con False el año 0.
-    bs_column = [False] + [d["Is_Black_Swan"] for d in median_details]
-    breakdown_df["Is_Black_Swan"] = bs_column
-    
-    simulation_stats = {
-        "max_drawdown": max_drawdown
+    count("paths", len(finals_real))
+    count("path_years", len(finals_real) * total_years)
+    return _finish_blocks(
+        spec, blocks, sketch_nominal, sketch_real, risk, finals_nominal, finals_real,
+        {
+            "mode": "adaptive",
+            "chunks": len(blocks),
+            "shards": 1,
+            "paths": len(finals_real),
+            "batches": len(blocks),
+            "stop_reason": stop_reason,
+            "tolerance": {"success_probability_half_width": tolerance, "median_relative_std_error": median_tolerance},
+            "precision": precision,
+            "elapsed_seconds": time.perf_counter() - started,
+        }
+    )
+
+def simulate_progressive_batch(spec, blocks):
+    """
+    Unidad de trabajo de ProgressiveSimulation: simula unos bloques del plan.
+    Es picklable para ejecutarse en el pool de procesos.
+    """
+    return _simulate_blocks(spec, blocks)
+
+class ProgressiveSimulation:
+    """
+    Simulación de Monte Carlo por bloques que se consume lote a lote, para
+    mostrar resultados parciales mientras avanza.
+
+    Usa exactamente el mismo plan de bloques que run_monte_carlo_simulation
+    con la misma semilla, chunk_size y shards, así que finish() da el mismo
+    resultado. Si esa llamada se resolvería en memoria (sin shards y con
+    num_simulations <= chunk_size), in_memory es True y no hay lotes: basta
+    con llamar a run_monte_carlo_simulation.
+
+    Uso: cada lote batches[índice] se simula con
+    simulate_progressive_batch(spec, lote), en cualquier orden y en
+    paralelo, y se entrega con add(índice, resultado); snapshot() resume lo
+    simulado hasta el momento y finish() devuelve las salidas finales.
+
+    Args:
+        Los de run_monte_carlo_simulation salvo executor.
+    """
+
+    def __init__(
+        self,
+        initial_capital,
+        contribution_schedule,
+        mean_return=0.08,
+        volatility=0.15,
+        black_swan_enabled=True,
+        black_swan_prob=0.02,
+        inflation_rate=0.02,
+        num_simulations=1000,
+        t_df=3,
+        seed=None,
+        chunk_size=None,
+        shards=1,
+        portfolio=None,
+        sampling="pseudo",
+        control_variate=False,
+        financial_goal=None,
+        bootstrap=None,
+        time_step="annual",
+        inflation_model=None
+    ):
+        self.spec = _simulation_spec(
+            initial_capital, contribution_schedule, mean_return, volatility,
+            black_swan_enabled, black_swan_prob, inflation_rate, t_df, portfolio,
+            sampling, control_variate, financial_goal, bootstrap, time_step, inflation_model
+        )
+        self.num_simulations = num_simulations
+        chunk_size = int(chunk_size or DEFAULT_CHUNK_SIZE)
+        shards = max(1, int(shards or 1))
+        self.in_memory = shards == 1 and num_simulations <= chunk_size
+
+        self.plan = [] if self.in_memory else _plan_blocks(num_simulations, seed, chunk_size, shards)
+        self.batches = [[block] for shard_blocks in self.plan for block in shard_blocks]
+        total_years = len(self.spec["annual_contributions"])
+        self._sketch_nominal = _QuantileSketch(total_years + 1)
+        self._sketch_real = _QuantileSketch(total_years + 1)
+        self._risk = _RiskSketch(total_years)
+        self._finals = {}
+
+    @property
+    def paths_done(self):
+        return self._sketch_real.count
+
+    def add(self, index, result):
+        """Incorpora el resultado de simulate_progressive_batch para el lote index."""
+        self._sketch_nominal.merge(result["sketch_nominal"])
+        self._sketch_real.merge(result["sketch_real"])
+        self._risk.merge(result["risk"])
+        self._finals[index] = (result["finals_nominal"], result["finals_real"])
+
+    def _done_finals(self):
+        done = sorted(self._finals)
+        finals_nominal = np.concatenate([self._finals[i][0] for i in done])
+        finals_real = np.concatenate([self._finals[i][1] for i in done])
+        return finals_nominal, finals_real, [self.batches[i][0][0] for i in done]
+
+    def snapshot(self):
+        """
+        Resultados parciales con los lotes completados.
+
+        Returns:
+            dict: 'paths' simuladas, 'fan_nominal' y 'fan_real' (percentiles
+            P10/P50/P90 por año, forma (3, años + 1)) y 'estimates' como en
+            simulation_stats.
+        """
+        with stage("percentiles"):
+            fan_nominal = self._sketch_nominal.percentiles(FAN_PERCENTILES)
+            fan_real = self._sketch_real.percentiles(FAN_PERCENTILES)
+        with stage("estimates"):
+            finals_nominal, finals_real, block_sizes = self._done_finals()
+            estimates = _sampling_estimates(self.spec, finals_nominal, finals_real, block_sizes)["estimates"]
+        return {
+            "paths": self.paths_done,
+            "fan_nominal": fan_nominal,
+            "fan_real": fan_real,
+            "estimates": estimates,
+        }
+
+    def finish(self):
+        """Salidas de run_monte_carlo_simulation; requiere todos los lotes."""
+        if len(self._finals) != len(self.batches):
+            raise ValueError("Faltan lotes por simular")
+        finals_nominal, finals_real, _ = self._done_finals()
+        count("paths", self.num_simulations)
+        count("path_years", self.num_simulations * len(self.spec["annual_contributions"]))
+        blocks = [block for (block,) in self.batches]
+        return _finish_blocks(
+            self.spec, blocks, self._sketch_nominal, self._sketch_real, self._risk, finals_nominal, finals_real,
+            {"mode": "streaming", "chunks": len(blocks), "shards": len(self.plan)}
+        )
+
+def _final_balances(initial_capital, returns, annual_contributions):
+    """Como _simulate_balances pero conservando solo el saldo final (memoria O(trayectorias))."""
+    balances = np.full(returns.shape[0], float(initial_capital))
+    for year_idx in range(returns.shape[1]):
+        balances *= 1.0 + returns[:, year_idx]
+        balances += annual_contributions[year_idx]
+    return balances
+
+def _summarize_finals(values):
+    p10, p50, p90 = np.percentile(values, FAN_PERCENTILES)
+    return {"p10": float(p10), "median": float(p50), "p90": float(p90), "mean": float(np.mean(values))}
+
+def _sweep_block(variants, contributions, max_years, size, block_seed, black_swan_prob, t_df):
+    """
+    Saldos finales nominales de cada escenario para un bloque de trayectorias,
+    todos con los mismos números aleatorios (generados una vez por bloque).
+    """
+    rng = np.random.default_rng(block_seed)
+    shape = (size, max_years)
+    shocks = rng.standard_t(t_df, size=shape) / _t_std_dev(t_df)
+    swan_draws = rng.random(shape)
+    crash_returns = rng.uniform(-0.50, -0.20, size=shape)
+
+    for variant, annual_contributions in zip(variants, contributions):
+        total_years = len(annual_contributions)
+        returns = variant["mean_return"] + variant["volatility"] * shocks[:, :total_years]
+        if variant["black_swan_enabled"]:
+            black_swans = swan_draws[:, :total_years] < black_swan_prob
+            returns = np.where(black_swans, crash_returns[:, :total_years], returns)
+        yield _final_balances(variant["initial_capital"], returns, annual_contributions)
+        del returns
+
+def run_parameter_sweep(
+    initial_capital,
+    contribution_schedule,
+    scenarios,
+    mean_return=0.08,
+    volatility=0.15,
+    black_swan_enabled=True,
+    black_swan_prob=0.02,
+    inflation_rate=0.02,
+    financial_goal=None,
+    num_simulations=1000,
+    t_df=3,
+    seed=None,
+    chunk_size=None
+):
+    """
+    Evalúa una rejilla de variantes de un mismo plan con números aleatorios comunes.
+
+    Los shocks t-Student estandarizados, los uniformes de cisne negro y las
+    magnitudes de crash se generan una sola vez por bloque de trayectorias y
+    se reutilizan en todos los escenarios, de modo que las diferencias entre
+    escenarios reflejan los parámetros y no el ruido de muestreo.
+
+    Como en el modo streaming de run_monte_carlo_simulation, las trayectorias
+    se procesan en bloques de chunk_size y de cada bloque solo se conservan,
+    por escenario, un sketch de los saldos finales y sus sumas: la memoria no
+    crece con num_simulations. Con un único bloque los percentiles son exactos.
+
+    Args:
+        scenarios: Lista de dicts que sobrescriben parámetros del plan base
+            (initial_capital, contribution_schedule, mean_return, volatility,
+            black_swan_enabled, inflation_rate, financial_goal) y opcionalmente
+            un 'label'.
+        financial_goal: Meta real para la probabilidad de éxito (opcional).
+        chunk_size: Trayectorias por bloque (por defecto DEFAULT_CHUNK_SIZE).
+        Resto: Igual que run_monte_carlo_simulation.
+
+    Returns:
+        list: Un resumen compacto por escenario (percentiles de saldo final
+        nominal y real, capital invertido y probabilidad de éxito).
+    """
+    base = {
+        "initial_capital": initial_capital,
+        "contribution_schedule": contribution_schedule,
+        "mean_return": mean_return,
+        "volatility": volatility,
+        "black_swan_enabled": black_swan_enabled,
+        "inflation_rate": inflation_rate,
+        "financial_goal": financial_goal,
     }
-    
-    # Retornamos todos los saldos finales REALES para calcular probabilidad de éxito
-    final_balances_real = results_real[:, -1]
+    variants = [{**base, **scenario} for scenario in scenarios]
+    contributions = [_expand_annual_contributions(v["contribution_schedule"]) for v in variants]
+    max_years = max((len(c) for c in contributions), default=0)
+    deflators = [(1 + v["inflation_rate"]) ** len(c) for v, c in zip(variants, contributions)]
 
-    return summary_df, median_details, breakdown_df, simulation_stats, final_balances_real
+    count("paths", num_simulations)
+    count("path_years", num_simulations * max_years)
+    (blocks,) = _plan_blocks(num_simulations, seed, int(chunk_size or DEFAULT_CHUNK_SIZE))
+
+    # Por escenario: saldos finales (nominal, real) exactos con un único bloque
+    # o su sketch con varios, más sus sumas y los éxitos
+    exact = len(blocks) == 1
+    finals = [None] * len(variants)
+    sketches = [_QuantileSketch(2) for _ in variants] if not exact else None
+    sums = np.zeros((len(variants), 2))
+    successes = np.zeros(len(variants), dtype=np.int64)
+
+    for size, block_seed in blocks:
+        with stage("simulate"):
+            block_finals = _sweep_block(variants, contributions, max_years, size, block_seed, black_swan_prob, t_df)
+            for idx, finals_nominal in enumerate(block_finals):
+                pair = np.column_stack((finals_nominal, finals_nominal / deflators[idx]))
+                if exact:
+                    finals[idx] = pair
+                else:
+                    sketches[idx].add(pair)
+                sums[idx] += pair.sum(axis=0)
+                if variants[idx]["financial_goal"] is not None:
+                    successes[idx] += int(np.count_nonzero(pair[:, 1] >= variants[idx]["financial_goal"]))
+
+    results = []
+    with stage("percentiles"):
+        for idx, (variant, annual_contributions) in enumerate(zip(variants, contributions)):
+            fan = np.percentile(finals[idx], FAN_PERCENTILES, axis=0) if exact else sketches[idx].percentiles(FAN_PERCENTILES)
+            means = sums[idx] / num_simulations
+            summaries = [
+                {"p10": float(fan[0, col]), "median": float(fan[1, col]), "p90": float(fan[2, col]), "mean": float(means[col])}
+                for col in range(2)
+            ]
+            goal = variant["financial_goal"]
+            results.append({
+                "label": variant.get("label") or f"Escenario {idx + 1}",
+                "mean_return": float(variant["mean_return"]),
+                "volatility": float(variant["volatility"]),
+                "black_swan_enabled": bool(variant["black_swan_enabled"]),
+                "inflation_rate": float(variant["inflation_rate"]),
+                "total_years": len(annual_contributions),
+                "invested": float(variant["initial_capital"] + annual_contributions.sum()),
+                "final_nominal": summaries[0],
+                "final_real": summaries[1],
+                "success_probability": (
+                    float(successes[idx] * 100.0 / num_simulations) if goal is not None else None
+                ),
+            })
+    return results
+
+def solve_contribution_for_goal(
+    initial_capital,
+    contribution_schedule,
+    financial_goal,
+    target_probability=0.90,
+    mean_return=0.08,
+    volatility=0.15,
+    black_swan_enabled=True,
+    black_swan_prob=0.02,
+    inflation_rate=0.02,
+    num_simulations=1000,
+    t_df=3,
+    seed=None,
+    tolerance=0.01,
+    max_scale=1e9,
+    chunk_size=None
+):
+    """
+    Busca el factor mínimo sobre el calendario de aportaciones que alcanza la
+    probabilidad de éxito objetivo.
+
+    Como el saldo final es lineal en las aportaciones, con un único conjunto de
+    retornos simulados cada trayectoria se resume en dos números:
+    B_final(s) = A + s * C, donde A es el capital inicial capitalizado y C las
+    aportaciones base capitalizadas. La probabilidad de éxito para cualquier
+    factor s se evalúa entonces de forma vectorizada y se busca por bisección.
+    Los retornos se simulan por bloques de chunk_size (los mismos que usaría
+    run_monte_carlo_simulation sin shards) y solo se conservan A y C, así
+    que la memoria es O(trayectorias) y no O(trayectorias * años).
+
+    Args:
+        contribution_schedule: Lista de tuplas (años, mensualidad). Si todas las
+            mensualidades son 0, se usa 1 por mes y el factor equivale a la
+            mensualidad buscada.
+        financial_goal: Meta en términos reales (poder adquisitivo de hoy).
+        target_probability: Probabilidad objetivo (0 a 1).
+        tolerance: Precisión de la bisección en euros de mensualidad.
+        max_scale: Factor máximo explorado antes de declarar la meta inalcanzable.
+        chunk_size: Trayectorias por bloque (por defecto DEFAULT_CHUNK_SIZE).
+        Resto: Igual que run_monte_carlo_simulation.
+
+    Returns:
+        dict: Factor encontrado, calendario resultante y probabilidades.
+    """
+    schedule = [(int(years), float(amount)) for years, amount in contribution_schedule]
+    # Factor equivalente al calendario actual (0 si no hay aportaciones)
+    current_scale = 1.0
+    if not any(amount for _, amount in schedule):
+        schedule = [(years, 1.0) for years, _ in schedule]
+        current_scale = 0.0
+    annual_contributions = _expand_annual_contributions(schedule)
+    total_years = len(annual_contributions)
+
+    count("paths", num_simulations)
+    count("path_years", num_simulations * total_years)
+    chunk_size = int(chunk_size or DEFAULT_CHUNK_SIZE)
+    if num_simulations <= chunk_size:
+        # Mismas trayectorias que _run_in_memory con esta semilla
+        blocks = [(num_simulations, seed)]
+    else:
+        (blocks,) = _plan_blocks(num_simulations, seed, chunk_size)
+
+    grown_initial = np.empty(num_simulations)
+    grown_contributions = np.empty(num_simulations)
+    offset = 0
+    for size, block_seed in blocks:
+        returns, _ = _draw_annual_returns(
+            np.random.default_rng(block_seed), size, total_years, mean_return, volatility,
+            black_swan_enabled, black_swan_prob, t_df
+        )
+        grown_initial[offset:offset + size] = _final_balances(initial_capital, returns, np.zeros(total_years))
+        grown_contributions[offset:offset + size] = _final_balances(0.0, returns, annual_contributions)
+        offset += size
+        del returns
+
+    # Meta REAL convertida a nominal en el último año
+    nominal_goal = financial_goal * (1 + inflation_rate) ** total_years
+
+    def success_probability(scale):
+        return float(np.mean(grown_initial + scale * grown_contributions >= nominal_goal))
+
+    # La tolerancia se expresa sobre la mayor mensualidad del calendario
+    max_monthly = max(amount for _, amount in schedule) if schedule else 1.0
+    scale_tolerance = tolerance / max_monthly if max_monthly > 0 else tolerance
+
+    low, high = 0.0, 1.0
+    iterations = 0
+    feasible = True
+    if success_probability(0.0) >= target_probability:
+        high = 0.0
+    else:
+        # Acotar: duplicar el factor hasta alcanzar el objetivo
+        while success_probability(high) < target_probability:
+            low = high
+            high *= 2
+            iterations += 1
+            if high > max_scale:
+                feasible = False
+                break
+        # Bisección sobre la probabilidad de éxito (monótona en el factor)
+        while feasible and high - low > scale_tolerance:
+            mid = 0.5 * (low + high)
+            if success_probability(mid) >= target_probability:
+                high = mid
+            else:
+                low = mid
+            iterations += 1
+
+    scale = high if feasible else None
+    return {
+        "feasible": feasible,
+        "scale": scale,
+        "contribution_schedule": (
+            [{"years": years, "monthly_amount": amount * scale} for years, amount in schedule]
+            if feasible else None
+        ),
+        "success_probability": success_probability(scale) * 100 if feasible else None,
+        "current_success_probability": success_probability(current_scale) * 100,
+        "target_probability": target_probability * 100,
+        "iterations": iterations,
+    }
 
 def calculate_kpis(initial_capital, total_contributed, final_balance, tax_rate):
     total_invested = initial_capital + total_contributed
@@ -358,16 +2206,14 @@ def run_backtest(
     
     # 2. Obtener datos históricos
     try:
-        stock = yf.Ticker(ticker)
-        hist = stock.history(start=f"{start_year}-01-01")
+        with stage("price_fetch"):
+            data = get_close_history(ticker, start=f"{start_year}-01-01")
         
-        if hist.empty:
+        if data.empty:
             return None
-            
-        data = hist['Close']
         
         # Resamplear a mensual (usando el último precio de cada mes)
-        monthly_data = data.resample('M').last()
+        monthly_data = data.resample('ME').last()
         monthly_returns = monthly_data.pct_change().dropna()
         
         # Alinear longitud
@@ -414,3 +2260,98 @@ def run_backtest(
         print(f"Error en backtest: {e}")
         return None
 
+
+def _expand_monthly_contributions(contribution_schedule):
+    """Expande el calendario de aportaciones a un array mes a mes."""
+    monthly_contributions = []
+    for duration, monthly_amount in contribution_schedule:
+        monthly_contributions.extend([monthly_amount] * (int(duration) * 12))
+    return np.asarray(monthly_contributions, dtype=float)
+
+def _monthly_returns(closes):
+    # Resamplear a mensual (usando el último precio de cada mes)
+    return closes.resample('ME').last().pct_change().dropna()
+
+def run_rolling_backtest(
+    initial_capital,
+    contribution_schedule,
+    ticker,
+    inflation_rate=0.02,
+    start_year=None
+):
+    """
+    Ejecuta el backtest histórico para todas las fechas de inicio posibles.
+
+    Cada ventana de len(calendario) meses consecutivos de la serie de retornos
+    mensuales es un backtest. Todas las ventanas se calculan a la vez: con los
+    factores de crecimiento en una vista deslizante (ventanas x meses), el
+    producto acumulado desde cada mes hasta el final de la ventana da el valor
+    final de cada aportación, y el saldo final es un producto matriz-vector.
+
+    Args:
+        initial_capital: Capital inicial.
+        contribution_schedule: Lista de tuplas (años, mensualidad).
+        ticker: Símbolo del activo.
+        inflation_rate: Tasa de inflación para ajuste real.
+        start_year: Primer año de historia a considerar (None = toda).
+
+    Returns:
+        dict: Distribución de saldos finales y ventanas mejor, peor y mediana,
+        o None si no hay historia suficiente para una ventana completa.
+    """
+    monthly_contributions = _expand_monthly_contributions(contribution_schedule)
+    total_months = len(monthly_contributions)
+    if total_months == 0:
+        return None
+
+    try:
+        start = f"{start_year}-01-01" if start_year else None
+        with stage("price_fetch"):
+            closes = get_close_history(ticker, start=start)
+        monthly_returns = _monthly_returns(closes)
+        if len(monthly_returns) < total_months:
+            return None
+
+        # (ventanas, meses): vista sin copia sobre los factores de crecimiento
+        windows = np.lib.stride_tricks.sliding_window_view(1.0 + monthly_returns.to_numpy(), total_months)
+        # growth_to_end[:, j] = producto de los factores desde el mes j hasta el final
+        growth_to_end = np.cumprod(windows[:, ::-1], axis=1)[:, ::-1]
+
+        # Cada aportación se suma tras el retorno de su mes y crece con los siguientes
+        final_nominal = (
+            initial_capital * growth_to_end[:, 0]
+            + growth_to_end[:, 1:] @ monthly_contributions[:-1]
+            + monthly_contributions[-1]
+        )
+        # Mismo ajuste real aproximado que run_backtest
+        final_real = final_nominal / (1 + inflation_rate) ** (total_months / 12.0)
+
+        dates = monthly_returns.index
+        start_dates = dates[:len(final_nominal)]
+        end_dates = dates[total_months - 1:]
+
+        def window(idx):
+            return {
+                "start_date": start_dates[idx].strftime("%Y-%m-%d"),
+                "end_date": end_dates[idx].strftime("%Y-%m-%d"),
+                "final_balance": float(final_nominal[idx]),
+                "final_balance_real": float(final_real[idx])
+            }
+
+        order = np.argsort(final_nominal, kind="stable")
+        return {
+            "windows": len(final_nominal),
+            "months": total_months,
+            "total_invested": float(initial_capital + monthly_contributions.sum()),
+            "final_nominal": _summarize_finals(final_nominal),
+            "final_real": _summarize_finals(final_real),
+            "best": window(order[-1]),
+            "worst": window(order[0]),
+            "median": window(order[len(order) // 2]),
+            "start_dates": [d.strftime("%Y-%m-%d") for d in start_dates],
+            "final_balances": final_nominal.tolist(),
+            "final_balances_real": final_real.tolist()
+        }
+    except Exception as e:
+        print(f"Error en backtest rolling: {e}")
+        return None
@@ -0,0 +1,257 @@
+"""
+Background jobs for long runs, on a single host.
+
+A JobQueue accepts work from clients, runs at most max_running jobs at once
+(highest priority first, then in submission order) and keeps each result
+for result_ttl seconds after the job finishes. A client may have at most
+max_running_per_client jobs running and max_queued_per_client jobs waiting;
+further submissions are rejected. Everything lives in memory in the API
+process, so no outside broker is needed (and jobs do not survive restarts).
+
+A job is an async callable run as a task on the event loop; the heavy work
+it awaits still goes through the process pool's WorkQueue. When that queue
+is full the job waits and is retried instead of failing.
+"""
+import asyncio
+import heapq
+import itertools
+import secrets
+import time
+
+from executors import QueueFullError, WorkerCrashedError
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobLimitError(Exception):
+    """Raised when a client already has as many queued jobs as allowed."""
+
+    def __init__(self, client, limit):
+        super().__init__(f"Client {client} already has {limit} queued jobs")
+        self.client = client
+        self.limit = limit
+
+
+class JobFailed(Exception):
+    """Raised by a job to finish it as failed with an HTTP-style status."""
+
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class Job:
+    """One submitted unit of work and its outcome."""
+
+    def __init__(self, kind, client, priority, run):
+        self.id = secrets.token_hex(8)
+        self.kind = kind
+        self.client = client
+        self.priority = priority
+        self.run = run
+        self.status = QUEUED
+        self.progress = 0.0
+        self.attempts = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.expires_at = None
+        self.result = None
+        self.error = None
+        self.task = None
+
+    def describe(self):
+        """Status fields reported to clients (no result body)."""
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "priority": self.priority,
+            "progress": self.progress,
+            "created_at": self.created,
+            "started_at": self.started,
+            "finished_at": self.finished,
+            "expires_at": self.expires_at,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """
+    Priority queue of background jobs with per-client limits.
+
+    Not thread-safe: call it from the event loop thread (stats() may also be
+    read from other threads).
+
+    Args:
+        max_running (int): Jobs running at once across all clients.
+        max_running_per_client (int): Jobs one client may have running.
+        max_queued_per_client (int): Jobs one client may have waiting.
+        result_ttl (float): Seconds a finished job (and its result) is kept.
+        retry_delay (float): Seconds before re-dispatching a job whose work
+            queue was full.
+    """
+
+    def __init__(self, max_running=2, max_running_per_client=1, max_queued_per_client=10, result_ttl=3600.0, retry_delay=2.0):
+        self.max_running = max_running
+        self.max_running_per_client = max_running_per_client
+        self.max_queued_per_client = max_queued_per_client
+        self.result_ttl = result_ttl
+        self.retry_delay = retry_delay
+        self._jobs = {}
+        self._waiting = []
+        self._order = itertools.count()
+        self._running = {}
+        self.completed = 0
+        self.rejected = 0
+        self.retried = 0
+
+    def _count(self, client, status):
+        return sum(1 for job in self._jobs.values() if job.client == client and job.status == status)
+
+    def submit(self, kind, client, run, priority="normal"):
+        """
+        Queue run(job) for client; it may update job.progress as it goes.
+
+        Raises:
+            JobLimitError: If the client has max_queued_per_client jobs waiting.
+        """
+        self.purge()
+        if self._count(client, QUEUED) >= self.max_queued_per_client:
+            self.rejected += 1
+            raise JobLimitError(client, self.max_queued_per_client)
+        job = Job(kind, client, priority, run)
+        self._jobs[job.id] = job
+        self._enqueue(job)
+        self._dispatch()
+        return job
+
+    def _enqueue(self, job):
+        heapq.heappush(self._waiting, (PRIORITIES[job.priority], next(self._order), job.id))
+
+    def _dispatch(self):
+        """Start waiting jobs while there is room, skipping clients at their limit."""
+        skipped = []
+        while self._waiting and sum(self._running.values()) < self.max_running:
+            entry = heapq.heappop(self._waiting)
+            job = self._jobs.get(entry[2])
+            if job is None or job.status != QUEUED:
+                continue
+            if self._running.get(job.client, 0) >= self.max_running_per_client:
+                skipped.append(entry)
+                continue
+            self._start(job)
+        for entry in skipped:
+            heapq.heappush(self._waiting, entry)
+
+    def _start(self, job):
+        job.status = RUNNING
+        job.started = time.time()
+        job.attempts += 1
+        self._running[job.client] = self._running.get(job.client, 0) + 1
+        job.task = asyncio.get_running_loop().create_task(self._execute(job))
+        job.task.add_done_callback(lambda task: self._settle(job))
+
+    def _settle(self, job):
+        # A task cancelled before its first step never runs _execute
+        if job.status == RUNNING:
+            job.task = None
+            self._finish(job, CANCELLED)
+            self._dispatch()
+
+    async def _execute(self, job):
+        try:
+            job.result = await job.run(job)
+            self._finish(job, SUCCEEDED)
+            job.progress = 1.0
+        except asyncio.CancelledError:
+            self._finish(job, CANCELLED)
+        except QueueFullError:
+            # The work queue is saturated by other requests: wait and retry
+            self._release(job)
+            job.status = QUEUED
+            job.started = None
+            job.progress = 0.0
+            self.retried += 1
+            asyncio.get_running_loop().call_later(self.retry_delay, self._retry, job)
+        except JobFailed as e:
+            job.error = {"status": e.status_code, "detail": e.detail}
+            self._finish(job, FAILED)
+        except WorkerCrashedError as e:
+            job.error = {"status": 503, "detail": str(e)}
+            self._finish(job, FAILED)
+        except Exception as e:
+            job.error = {"status": 500, "detail": f"{type(e).__name__}: {e}"}
+            self._finish(job, FAILED)
+        finally:
+            job.task = None
+            self._dispatch()
+
+    def _retry(self, job):
+        if job.status == QUEUED:
+            self._enqueue(job)
+            self._dispatch()
+
+    def _release(self, job):
+        self._running[job.client] -= 1
+        if not self._running[job.client]:
+            del self._running[job.client]
+
+    def _finish(self, job, status):
+        if job.status == RUNNING:
+            self._release(job)
+        job.status = status
+        job.finished = time.time()
+        job.expires_at = job.finished + self.result_ttl
+        self.completed += 1
+
+    def get(self, job_id):
+        """The job with this id, or None if unknown or expired."""
+        self.purge()
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued or running job; running work that already started on
+        the process pool finishes there but its result is discarded.
+
+        Returns:
+            Job or None: The job, or None if unknown or expired.
+        """
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # Still waiting: its heap entry is skipped when reached
+            self._finish(job, CANCELLED)
+        return job
+
+    def purge(self):
+        """Drop finished jobs past their expiry."""
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items() if job.expires_at is not None and job.expires_at <= now]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        now = time.time()
+        counts = {status: 0 for status in (QUEUED, RUNNING) + FINISHED}
+        for job in list(self._jobs.values()):
+            if job.expires_at is None or job.expires_at > now:
+                counts[job.status] += 1
+        return {
+            "jobs": counts,
+            "max_running": self.max_running,
+            "max_running_per_client": self.max_running_per_client,
+            "max_queued_per_client": self.max_queued_per_client,
+            "result_ttl_seconds": self.result_ttl,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "retried": self.retried,
+        }
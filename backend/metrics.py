@@ -0,0 +1,283 @@
+"""
+Lightweight request instrumentation.
+
+Hot-path code marks stages with `with stage("simulate"):` and counts work
+with `count("paths", n)`. Both are no-ops unless a StageTimings collector is
+active in the current context (`collect()`), so the engine can be called
+directly without any overhead beyond a context-variable lookup.
+
+Work that runs on an executor is wrapped with `timed_call`, which opens a
+collector in the worker (thread or process) and returns its report next to
+the result so the caller can merge it. Per-request timings feed the
+Server-Timing header; process-wide totals are exported in Prometheus text
+format by a Registry. SamplingProfiler is an opt-in, per-call sampling
+profiler that returns folded stacks.
+"""
+import contextvars
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("stage_timings", default=None)
+
+
+class StageTimings:
+    """Durations (seconds) per stage and work counters of one request."""
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self.profiles = []
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def merge(self, report):
+        """Add the stages and counts of a report() from another collector."""
+        for name, seconds in report.get("stages", {}).items():
+            self.add(name, seconds)
+        for name, amount in report.get("counts", {}).items():
+            self.count(name, amount)
+        if "profile" in report:
+            self.profiles.append(report["profile"])
+
+    def report(self):
+        return {"stages": dict(self.stages), "counts": dict(self.counts)}
+
+    def server_timing(self):
+        """Server-Timing header value, durations in milliseconds."""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items())
+
+
+def current_timings():
+    return _current.get()
+
+
+@contextmanager
+def collect():
+    """Activate a fresh StageTimings for the current context."""
+    timings = StageTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Time a block into the active collector, if any."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def count(name, amount=1):
+    timings = _current.get()
+    if timings is not None:
+        timings.count(name, amount)
+
+
+def timed_call(fn, kwargs, profile=False):
+    """
+    Call fn(**kwargs) under a fresh collector, for use on an executor.
+
+    Module-level so process pools can pickle it.
+
+    Returns:
+        tuple: (result, report) where report holds 'stages', 'counts',
+        'elapsed' (seconds inside the worker) and, if profile is set, the
+        sampled 'profile'.
+    """
+    profiler = SamplingProfiler() if profile else None
+    with collect() as timings:
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.start()
+        try:
+            result = fn(**kwargs)
+        finally:
+            if profiler is not None:
+                profiler.stop()
+        elapsed = time.perf_counter() - start
+    report = timings.report()
+    report["elapsed"] = elapsed
+    if profiler is not None:
+        report["profile"] = profiler.report()
+    return result, report
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of the thread that started it at a fixed interval.
+
+    Args:
+        interval (float): Seconds between samples.
+        max_stacks (int): Distinct stacks kept in report(), most frequent first.
+    """
+
+    def __init__(self, interval=0.005, max_stacks=50):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self._stacks = _Tally()
+        self._samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._target = None
+        self._started = None
+        self._duration = 0.0
+
+    def start(self):
+        self._target = threading.get_ident()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._duration = time.perf_counter() - self._started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            self._stacks[";".join(reversed(stack))] += 1
+            self._samples += 1
+
+    def report(self):
+        """Folded stacks ('outer;inner' -> samples), as used by flame graph tools."""
+        return {
+            "interval_ms": self.interval * 1000,
+            "duration_ms": self._duration * 1000,
+            "samples": self._samples,
+            "stacks": dict(self._stacks.most_common(self.max_stacks)),
+        }
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered Prometheus-style."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {key: {**s, "buckets": list(s["buckets"])} for key, s in self._series.items()}
+        for key, s in series.items():
+            labels = dict(zip(self.labelnames, key))
+            for bound, value in zip(self.buckets, s["buckets"]):
+                yield f"{self.name}_bucket", {**labels, "le": repr(float(bound))}, value
+            yield f"{self.name}_bucket", {**labels, "le": "+Inf"}, s["count"]
+            yield f"{self.name}_sum", labels, s["sum"]
+            yield f"{self.name}_count", labels, s["count"]
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Collected:
+    """
+    Values read at scrape time from a callback returning [(labels, value)],
+    e.g. counters already kept by a cache. type is 'gauge' or 'counter'.
+    """
+
+    def __init__(self, name, help, callback, type="gauge"):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.type = type
+
+    def samples(self):
+        for labels, value in self.callback():
+            yield self.name, labels, value
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Registry:
+    """Collection of metrics rendered in the Prometheus text exposition format."""
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {float(value)!r}")
+        return "\n".join(lines) + "\n"
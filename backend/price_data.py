@@ -0,0 +1,398 @@
+"""
+Capa de datos de precios históricos.
+
+Los precios de cierre se obtienen de un proveedor intercambiable (Yahoo Finance
+o un proveedor sintético sin red) y se guardan en una caché local en disco con
+un fichero .npy columnar por ticker. La caché se refresca de forma incremental
+(solo se descargan los días que faltan) y se lee mediante memory-mapping.
+
+pandas y yfinance se importan en el primer uso y no al cargar el módulo, para
+que el arranque del servidor (y de los procesos del pool) no pague por ellos.
+
+Configuración por variables de entorno:
+    PRICE_DATA_PROVIDER: 'yahoo' (por defecto) u 'offline'.
+    PRICE_CACHE_DIR: Directorio de la caché (por defecto backend/.price_cache).
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import zlib
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".price_cache")
+
+# Estructura de cada fichero de la caché: una fila por sesión de mercado
+PRICE_DTYPE = np.dtype([("date", "<i8"), ("close", "<f8")])
+
+_PERIOD_RE = re.compile(r"^(\d+)(d|wk|mo|y)$")
+
+# Sesiones ya guardadas que se vuelven a pedir en cada refresco para detectar
+# reajustes (splits, dividendos) y tolerancia relativa al compararlas
+OVERLAP_SESSIONS = 5
+OVERLAP_RTOL = 1e-4
+
+
+def _today():
+    return datetime.now(timezone.utc).date()
+
+
+def _period_start(period, end=None):
+    """
+    Convierte un periodo estilo yfinance ('20y', '6mo', '5d', 'ytd', 'max')
+    en la fecha de inicio correspondiente. Devuelve None para 'max'.
+    """
+    import pandas as pd
+
+    end = pd.Timestamp(end or _today())
+    if period is None or period == "max":
+        return None
+    if period == "ytd":
+        return pd.Timestamp(year=end.year, month=1, day=1)
+
+    match = _PERIOD_RE.match(period)
+    if not match:
+        raise ValueError(f"Periodo no soportado: {period}")
+    amount, unit = int(match.group(1)), match.group(2)
+    offsets = {
+        "d": pd.DateOffset(days=amount),
+        "wk": pd.DateOffset(weeks=amount),
+        "mo": pd.DateOffset(months=amount),
+        "y": pd.DateOffset(years=amount),
+    }
+    return end - offsets[unit]
+
+
+def _to_day_index(index):
+    """Normaliza un DatetimeIndex (posiblemente con zona horaria) a días sin hora."""
+    import pandas as pd
+
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.normalize()
+
+
+class PriceProvider:
+    """
+    Interfaz de un proveedor de precios.
+
+    Las subclases implementan fetch_close devolviendo una pd.Series de precios
+    de cierre ajustados indexada por fecha (sin zona horaria), ordenada.
+    """
+
+    name = "base"
+
+    def fetch_close(self, ticker, start=None):
+        """
+        Args:
+            ticker (str): Símbolo del activo.
+            start (date, optional): Primer día a descargar. None = toda la historia.
+
+        Returns:
+            pd.Series: Precios de cierre (vacía si no hay datos).
+        """
+        raise NotImplementedError
+
+
+class YahooPriceProvider(PriceProvider):
+    """Descarga precios de cierre ajustados desde Yahoo Finance."""
+
+    name = "yahoo"
+
+    def fetch_close(self, ticker, start=None):
+        import pandas as pd
+        import yfinance as yf
+
+        stock = yf.Ticker(ticker)
+        if start is None:
+            hist = stock.history(period="max")
+        else:
+            hist = stock.history(start=pd.Timestamp(start).strftime("%Y-%m-%d"))
+
+        if hist.empty:
+            return pd.Series(dtype=float)
+
+        closes = hist["Close"].dropna()
+        closes.index = _to_day_index(closes.index)
+        return closes[~closes.index.duplicated(keep="last")]
+
+
+class OfflinePriceProvider(PriceProvider):
+    """
+    Proveedor sintético y determinista que no necesita red.
+
+    Genera para cada ticker un paseo geométrico con colas gruesas cuyos
+    parámetros y semilla se derivan del propio símbolo, de modo que el mismo
+    ticker produce siempre la misma serie. Útil para desarrollo, benchmarks y
+    entornos sin acceso a Yahoo.
+    """
+
+    name = "offline"
+
+    HISTORY_START = "1993-01-29"
+    HISTORY_END = "2100-12-31"
+
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _full_series(self, ticker):
+        import pandas as pd
+
+        with self._lock:
+            if ticker not in self._series:
+                seed = zlib.crc32(ticker.upper().encode("utf-8"))
+                rng = np.random.default_rng(seed)
+                dates = pd.bdate_range(self.HISTORY_START, self.HISTORY_END)
+
+                annual_return = 0.04 + 0.06 * rng.random()
+                annual_volatility = 0.12 + 0.18 * rng.random()
+                daily_shocks = rng.standard_t(4, size=len(dates)) / np.sqrt(2.0)
+                log_returns = (annual_return - 0.5 * annual_volatility ** 2) / 252 \
+                    + annual_volatility / np.sqrt(252) * daily_shocks
+
+                prices = 100.0 * np.exp(np.cumsum(log_returns))
+                self._series[ticker] = pd.Series(prices, index=dates)
+            return self._series[ticker]
+
+    def fetch_close(self, ticker, start=None):
+        import pandas as pd
+
+        series = self._full_series(ticker)
+        series = series[series.index <= pd.Timestamp(_today())]
+        if start is not None:
+            series = series[series.index >= pd.Timestamp(start)]
+        return series.copy()
+
+
+class PriceStore:
+    """
+    Caché local de precios de cierre con refresco incremental.
+
+    Cada ticker se guarda en <cache_dir>/<TICKER>.npy como array estructurado
+    (fecha en días desde epoch, cierre). Solo se guardan sesiones completas
+    (anteriores a hoy). En cada refresco se piden al proveedor los días
+    posteriores a la última fecha guardada más las últimas OVERLAP_SESSIONS
+    ya guardadas: los cierres ajustados cambian hacia atrás con cada split o
+    dividendo, así que si esas sesiones no coinciden se descarga de nuevo toda
+    la historia y se reescribe el fichero. También se reescribe si la caché
+    la generó otro proveedor. Como máximo se consulta al proveedor una vez al
+    día por ticker (metadatos en <TICKER>.json).
+    """
+
+    def __init__(self, provider, cache_dir=DEFAULT_CACHE_DIR):
+        self.provider = provider
+        self.cache_dir = cache_dir
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # --- Rutas y bloqueos ---
+
+    def _key(self, ticker):
+        return re.sub(r"[^A-Za-z0-9._=^-]", "_", ticker.upper())
+
+    def _data_path(self, ticker):
+        return os.path.join(self.cache_dir, f"{self._key(ticker)}.npy")
+
+    def _meta_path(self, ticker):
+        return os.path.join(self.cache_dir, f"{self._key(ticker)}.json")
+
+    def _lock_for(self, ticker):
+        with self._locks_guard:
+            return self._locks.setdefault(self._key(ticker), threading.Lock())
+
+    # --- Lectura / escritura ---
+
+    def _load(self, ticker, mmap=True):
+        path = self._data_path(ticker)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=PRICE_DTYPE)
+        if mmap:
+            try:
+                return np.load(path, mmap_mode="r")
+            except ValueError:
+                # numpy no puede mapear un fichero sin datos
+                pass
+        return np.load(path)
+
+    def _read_meta(self, ticker):
+        try:
+            with open(self._meta_path(ticker)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _atomic_write(self, path, write):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _save_records(self, ticker, records):
+        self._atomic_write(self._data_path(ticker), lambda f: np.save(f, records))
+
+    def _save_meta(self, ticker, checked_on):
+        meta = {"provider": self.provider.name, "checked_on": checked_on.isoformat()}
+        self._atomic_write(self._meta_path(ticker), lambda f: f.write(json.dumps(meta).encode("utf-8")))
+
+    # --- API pública ---
+
+    def _fetch_records(self, ticker, start, today):
+        """Sesiones cerradas (anteriores a hoy) con cierre válido desde start."""
+        fetched = self.provider.fetch_close(ticker, start=start)
+        days = _to_day_index(fetched.index).values.astype("datetime64[D]").astype(np.int64)
+        closes = fetched.to_numpy(dtype=float)
+        keep = (days < np.datetime64(today, "D").astype(np.int64)) & np.isfinite(closes)
+
+        records = np.empty(int(keep.sum()), dtype=PRICE_DTYPE)
+        records["date"] = days[keep]
+        records["close"] = closes[keep]
+        return records
+
+    def refresh(self, ticker, force=False):
+        """
+        Añade a la caché las sesiones que faltan desde la última fecha guardada,
+        o la reconstruye entera si el proveedor ha reajustado la historia.
+
+        Si el proveedor no devuelve ninguna fila (caída o límite de peticiones)
+        no se marca la consulta del día, así que la siguiente llamada reintenta;
+        una reconstrucción vacía tampoco borra los precios ya guardados.
+
+        Args:
+            ticker (str): Símbolo del activo.
+            force (bool): Consultar al proveedor aunque ya se haya hecho hoy.
+
+        Returns:
+            int: Número de sesiones escritas (toda la historia si se reconstruye).
+        """
+        today = _today()
+        with self._lock_for(ticker):
+            meta = self._read_meta(ticker)
+            if not force and meta.get("checked_on") == today.isoformat() \
+                    and meta.get("provider") == self.provider.name:
+                return 0
+
+            existing = self._load(ticker, mmap=False)
+            switched = meta.get("provider") != self.provider.name
+            if switched:
+                # Precios de otro proveedor (p.ej. sintéticos): no se mezclan
+                existing = existing[:0]
+
+            rebuild = not len(existing)
+            if not rebuild:
+                overlap_from = existing["date"][max(len(existing) - OVERLAP_SESSIONS, 0)]
+                start = date.fromordinal(date(1970, 1, 1).toordinal() + int(overlap_from))
+                fetched = self._fetch_records(ticker, start, today)
+
+                # Las sesiones ya guardadas deben seguir valiendo lo mismo
+                last_day = existing["date"][-1]
+                overlap = fetched[fetched["date"] <= last_day]
+                positions = np.searchsorted(existing["date"], overlap["date"])
+                found = existing["date"][np.minimum(positions, len(existing) - 1)] == overlap["date"]
+                rebuild = not np.allclose(
+                    existing["close"][positions[found]], overlap["close"][found], rtol=OVERLAP_RTOL, atol=0.0
+                )
+                if rebuild:
+                    print(f"Precios de {ticker} reajustados por el proveedor, reconstruyendo la caché")
+
+            if rebuild:
+                records = self._fetch_records(ticker, None, today)
+                written = len(records)
+                received = written > 0
+            else:
+                new_records = fetched[fetched["date"] > last_day]
+                records = np.concatenate([existing, new_records])
+                written = len(new_records)
+                received = len(fetched) > 0
+
+            # Tras cambiar de proveedor se vacía la caché aunque no lleguen
+            # filas: los precios del anterior no deben servirse
+            if written or (rebuild and switched):
+                self._save_records(ticker, records)
+            if received:
+                self._save_meta(ticker, today)
+            return written
+
+    def get_close(self, ticker, period=None, start=None, refresh=True):
+        """
+        Devuelve los precios de cierre de un ticker leyendo de la caché local.
+
+        Args:
+            ticker (str): Símbolo del activo.
+            period (str, optional): Periodo estilo yfinance ('20y', '5y', 'max'...).
+            start (str|date, optional): Fecha de inicio (alternativa a period).
+            refresh (bool): Completar antes la caché con los días que falten.
+
+        Returns:
+            pd.Series: Cierres indexados por fecha (vacía si no hay datos).
+        """
+        import pandas as pd
+
+        if refresh:
+            try:
+                self.refresh(ticker)
+            except Exception as e:
+                # Sin proveedor disponible servimos lo que haya en caché
+                if not os.path.exists(self._data_path(ticker)):
+                    raise
+                print(f"Error refrescando precios de {ticker}, usando caché: {e}")
+
+        records = self._load(ticker, mmap=True)
+        if start is None:
+            start = _period_start(period)
+
+        offset = 0
+        if start is not None:
+            start_day = np.datetime64(pd.Timestamp(start).date(), "D").astype(np.int64)
+            offset = int(np.searchsorted(records["date"], start_day, side="left"))
+
+        window = records[offset:]
+        index = pd.DatetimeIndex(window["date"].astype("datetime64[D]").astype("datetime64[ns]"))
+        return pd.Series(np.array(window["close"]), index=index, name=ticker)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _provider_from_env():
+    name = os.environ.get("PRICE_DATA_PROVIDER", "yahoo").lower()
+    if name == "offline":
+        return OfflinePriceProvider()
+    if name == "yahoo":
+        return YahooPriceProvider()
+    raise ValueError(f"PRICE_DATA_PROVIDER desconocido: {name}")
+
+
+def get_price_store():
+    """Devuelve la caché de precios global, creándola según la configuración."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PriceStore(
+                _provider_from_env(),
+                cache_dir=os.environ.get("PRICE_CACHE_DIR", DEFAULT_CACHE_DIR),
+            )
+        return _store
+
+
+def set_price_store(store):
+    """Sustituye la caché de precios global (p.ej. por una con proveedor offline)."""
+    global _store
+    with _store_lock:
+        _store = store
+
+
+def get_close_history(ticker, period=None, start=None):
+    """Atajo: cierres de un ticker desde la caché global."""
+    return get_price_store().get_close(ticker, period=period, start=start)
@@ -0,0 +1,95 @@
+"""
+Response encoding for the API.
+
+Tables are taken straight from DataFrame columns (no to_dict(orient="records")
+round trip) and can be returned either as the classic list of row objects or
+as compact column arrays, encoded as JSON or MessagePack. Long series can be
+downsampled to a maximum number of points.
+"""
+import numpy as np
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.finance-sim.columnar+json"
+FORMATS = ("json", "columnar", "msgpack")
+
+
+def negotiate_format(request):
+    """
+    Pick the response format from the `format` query parameter or the Accept header.
+
+    Returns:
+        str: 'json' (rows, default), 'columnar' (column arrays as JSON) or
+        'msgpack' (column arrays as MessagePack).
+    """
+    requested = request.query_params.get("format")
+    if requested in FORMATS:
+        return requested
+
+    for media_range in request.headers.get("accept", "").split(","):
+        media_type = media_range.split(";")[0].strip().lower()
+        if media_type in MSGPACK_MEDIA_TYPES:
+            return "msgpack"
+        if media_type == COLUMNAR_JSON_MEDIA_TYPE:
+            return "columnar"
+    return "json"
+
+
+def downsample_indices(length, max_points=None):
+    """Evenly spaced row indices, always keeping the first and last row."""
+    if not max_points or length <= max_points:
+        return None
+    return np.unique(np.linspace(0, length - 1, max_points).round().astype(np.int64))
+
+
+def frame_columns(df, columns=None, indices=None):
+    """DataFrame columns as plain Python lists, optionally taking only some rows."""
+    result = {}
+    for column in columns or df.columns:
+        values = df[column].to_numpy()
+        if indices is not None:
+            values = values[indices]
+        result[column] = values.tolist()
+    return result
+
+
+def records_columns(records, indices=None):
+    """Transpose a list of row dicts into column lists."""
+    if indices is not None:
+        records = [records[i] for i in indices]
+    if not records:
+        return {}
+    return {key: [row[key] for row in records] for key in records[0]}
+
+
+def columns_records(columns):
+    """Transpose column lists back into a list of row dicts."""
+    keys = list(columns)
+    return [dict(zip(keys, row)) for row in zip(*(columns[k] for k in keys))]
+
+
+def _msgpack_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def encode_response(payload, fmt, headers=None):
+    """
+    Encode an already-shaped payload as JSON or MessagePack.
+
+    Raises:
+        HTTPException: 406 if MessagePack is requested but msgpack is not installed.
+    """
+    if fmt != "msgpack":
+        return JSONResponse(payload, headers=headers)
+
+    try:
+        import msgpack
+    except ImportError:
+        raise HTTPException(status_code=406, detail="MessagePack responses are not available on this server.")
+    body = msgpack.packb(payload, default=_msgpack_default, use_bin_type=True)
+    return Response(body, media_type=MSGPACK_MEDIA_TYPES[0], headers=headers)
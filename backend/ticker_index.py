@@ -0,0 +1,234 @@
+"""
+Offline ticker search.
+
+TickerIndex loads symbol, name and exchange rows from a CSV file and answers
+searches from memory, without network calls. Symbols and the words of each
+name are kept in sorted tuples, so prefix lookups are two bisections; typos
+are matched only when nothing matches by prefix, by a bounded prefix edit
+distance against the distinct words that share the query's first letter.
+
+The file is read on first use and re-read when its modification time
+changes (checked at most every check_interval seconds), so the bundled
+data/tickers.csv can be replaced by a refreshed export without a restart.
+"""
+import bisect
+import csv
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "tickers.csv")
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _normalize(text):
+    """Lowercase ASCII with accents stripped."""
+    text = unicodedata.normalize("NFKD", text)
+    return text.encode("ascii", "ignore").decode("ascii").lower()
+
+
+def _words(text):
+    return _WORD_RE.findall(_normalize(text))
+
+
+def _max_typos(query):
+    """Edits tolerated for a query word: none for very short ones."""
+    if len(query) < 3:
+        return 0
+    return 1 if len(query) < 6 else 2
+
+
+def _prefix_distance(query, word, limit):
+    """
+    Smallest edit distance between query and any prefix of word, or None if
+    it exceeds limit. Rows of the Levenshtein table stop early once every
+    cell is past the limit.
+    """
+    if len(word) < len(query) - limit:
+        return None
+    # Prefixes longer than the query plus the allowed edits cannot get closer
+    word = word[:len(query) + limit]
+    previous = list(range(len(word) + 1))
+    for i, q in enumerate(query, 1):
+        current = [i]
+        for j, w in enumerate(word, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (q != w)))
+        if min(current) > limit:
+            return None
+        previous = current
+    best = min(previous)
+    return best if best <= limit else None
+
+
+# One immutable build of the index; searches read a single reference to it
+_IndexSnapshot = namedtuple("_IndexSnapshot", "entries symbol_keys symbol_ids word_keys word_ids")
+
+
+def _prefix_range(keys, prefix):
+    """Slice bounds of the sorted keys that start with prefix."""
+    low = bisect.bisect_left(keys, prefix)
+    high = bisect.bisect_left(keys, prefix + "\uffff")
+    return low, high
+
+
+class TickerIndex:
+    """
+    In-memory symbol/name index built from a CSV with 'symbol', 'name' and
+    'exchange' columns.
+
+    Args:
+        path (str): CSV file to load.
+        check_interval (float): Minimum seconds between modification checks.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, check_interval=60.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked = 0.0
+        self._index = self._build([])
+
+    @staticmethod
+    def _build(rows):
+        """Index snapshot for the CSV rows."""
+        entries = []
+        for row in rows:
+            symbol = (row.get("symbol") or "").strip().upper()
+            if symbol:
+                entries.append({
+                    "symbol": symbol,
+                    "shortName": (row.get("name") or "").strip() or None,
+                    "exchange": (row.get("exchange") or "").strip() or None,
+                })
+
+        symbols = sorted((entry["symbol"], i) for i, entry in enumerate(entries))
+        words = sorted({
+            (word, i) for i, entry in enumerate(entries) for word in _words(entry["shortName"] or "")
+        })
+        return _IndexSnapshot(
+            entries=tuple(entries),
+            symbol_keys=tuple(symbol for symbol, _ in symbols),
+            symbol_ids=tuple(i for _, i in symbols),
+            word_keys=tuple(word for word, _ in words),
+            word_ids=tuple(i for _, i in words),
+        )
+
+    def load(self):
+        """(Re)read the CSV file; returns the number of entries."""
+        with self._lock:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, newline="", encoding="utf-8") as f:
+                index = self._build(csv.DictReader(f))
+            # A single assignment: concurrent searches see the old or the new index, never a mix
+            self._index = index
+            self._mtime = mtime
+            self._checked = time.monotonic()
+            return len(index.entries)
+
+    def refresh(self):
+        """Reload if the file changed since it was read (throttled by check_interval)."""
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked < self.check_interval:
+            return False
+        self._checked = now
+        try:
+            changed = os.path.getmtime(self.path) != self._mtime
+        except OSError:
+            return False
+        if changed:
+            self.load()
+        return changed
+
+    def __len__(self):
+        return len(self._index.entries)
+
+    @staticmethod
+    def _symbol_matches(index, query):
+        """Entries whose symbol starts with query -> rank (exact first, then shorter)."""
+        keys = index.symbol_keys
+        low, high = _prefix_range(keys, query)
+        return {
+            index.symbol_ids[k]: (0, 0) if keys[k] == query else (1, len(keys[k]))
+            for k in range(low, high)
+        }
+
+    @staticmethod
+    def _word_matches(index, query, fuzzy):
+        """
+        Entries with a name word starting with query -> edit distance. With
+        fuzzy set, words that have no prefix match fall back to typo matching.
+        """
+        keys = index.word_keys
+        low, high = _prefix_range(keys, query)
+        if high > low or not fuzzy:
+            return {index.word_ids[k]: 0 for k in range(low, high)}
+
+        limit = _max_typos(query)
+        matches = {}
+        # Typos after the first letter: compare against that letter's words only,
+        # once per distinct word (the keys are sorted, so repeats are adjacent)
+        low, high = _prefix_range(keys, query[0])
+        word, distance = None, None
+        for k in range(low, high):
+            if keys[k] != word:
+                word = keys[k]
+                distance = _prefix_distance(query, word, limit)
+            if distance is not None:
+                entry = index.word_ids[k]
+                matches[entry] = min(distance, matches.get(entry, distance))
+        return matches
+
+    @classmethod
+    def _name_matches(cls, index, words, fuzzy):
+        """Entries matching every query word -> total edit distance."""
+        common = None
+        for word in words:
+            matches = cls._word_matches(index, word, fuzzy)
+            if common is None:
+                common = matches
+            else:
+                common = {entry: common[entry] + d for entry, d in matches.items() if entry in common}
+            if not common:
+                return {}
+        return common or {}
+
+    def search(self, query, limit=10):
+        """
+        Entries matching query, best first.
+
+        Ranking: exact symbol, symbol prefix (shorter symbols first), then
+        name words by prefix. Every word of a multi-word query must match
+        some word of the name. Only when nothing matches are name words
+        within a small edit distance tried, closest first.
+
+        Returns:
+            list: dicts with 'symbol', 'shortName' and 'exchange'.
+        """
+        if self._mtime is None:
+            self.load()
+        else:
+            self.refresh()
+
+        query = query.strip()
+        if not query:
+            return []
+
+        # Read the snapshot once: a reload during this search does not affect it
+        index = self._index
+        ranks = {}
+        if " " not in query:
+            ranks.update(self._symbol_matches(index, query.upper()))
+
+        words = _words(query)
+        for entry in self._name_matches(index, words, fuzzy=False):
+            ranks.setdefault(entry, (2, 0))
+        if not ranks and any(_max_typos(word) for word in words):
+            ranks = {entry: (3, distance) for entry, distance in self._name_matches(index, words, fuzzy=True).items()}
+
+        ordered = sorted(ranks, key=lambda entry: (ranks[entry], index.entries[entry]["symbol"]))
+        return [dict(index.entries[entry]) for entry in ordered[:limit]]
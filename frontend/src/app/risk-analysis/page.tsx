@@ -48,6 +48,13 @@ export default function RiskAnalysisPage() {
   const years = simulationData.median_scenario.map(p => p.Año + startYear);
   const returnColors = annualReturns.map(r => r >= 0 ? '#22c55e' : '#ef4444');
 
+  // Tail risk across all simulated paths
+  const risk = simulationData.risk_metrics;
+  const drawdownHistogram = risk.max_drawdown_distribution.histogram;
+  const drawdownBins = drawdownHistogram.probabilities.map((_, i) => (i + 0.5) * drawdownHistogram.bin_width * 100);
+  const formatMoney = (value: number) => value.toLocaleString('es-ES', { style: 'currency', currency: 'EUR', maximumFractionDigits: 0 });
+  const axisStyle = { gridcolor: isDark ? '#262626' : '#e5e5e5', color: isDark ? '#a3a3a3' : '#525252' };
+
   return (
     <div className="container mx-auto p-6 space-y-8 animate-in fade-in duration-500">
       <div className="space-y-2">
@@ -132,6 +139,107 @@ export default function RiskAnalysisPage() {
         </div>
       </div>
 
+      {/* Riesgo de cola (todas las trayectorias) */}
+      <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
+        <div className="bg-card border border-border rounded-xl p-6 shadow-sm">
+          <div className="flex items-center gap-3 mb-6">
+            <div className="p-2 bg-red-100 dark:bg-red-900/30 rounded-lg">
+              <TrendingDown className="w-6 h-6 text-red-600 dark:text-red-400" />
+            </div>
+            <div>
+              <h3 className="text-xl font-semibold text-foreground">Distribución del Max Drawdown</h3>
+              <p className="text-sm text-muted-foreground">
+                Todas las trayectorias · mediana {(risk.max_drawdown_distribution.p50 * 100).toFixed(1)}% · P95 {(risk.max_drawdown_distribution.p95 * 100).toFixed(1)}%
+              </p>
+            </div>
+          </div>
+          <div className="h-64 w-full">
+            <PlotlyChart
+              data={[
+                {
+                  x: drawdownBins,
+                  y: drawdownHistogram.probabilities,
+                  type: 'bar',
+                  marker: { color: '#ef4444' },
+                  name: 'Trayectorias',
+                },
+              ]}
+              layout={{
+                autosize: true,
+                margin: { t: 20, r: 20, l: 50, b: 40 },
+                paper_bgcolor: "transparent",
+                plot_bgcolor: "transparent",
+                xaxis: { title: { text: 'Caída máxima (%)' }, ...axisStyle },
+                yaxis: { title: { text: 'Probabilidad (%)' }, ...axisStyle },
+                font: { family: 'inherit' },
+                bargap: 0.05,
+              }}
+              useResizeHandler={true}
+              style={{ width: "100%", height: "100%" }}
+              config={{ displayModeBar: false }}
+            />
+          </div>
+        </div>
+
+        <div className="bg-card border border-border rounded-xl p-6 shadow-sm space-y-4">
+          <div className="flex items-center gap-3">
+            <div className="p-2 bg-orange-100 dark:bg-orange-900/30 rounded-lg">
+              <AlertTriangle className="w-6 h-6 text-orange-600 dark:text-orange-400" />
+            </div>
+            <h3 className="text-xl font-semibold text-foreground">Escenarios Adversos</h3>
+          </div>
+          {risk.value_at_risk.map((level) => (
+            <div key={level.confidence} className="flex justify-between border-b border-border/50 pb-2">
+              <span className="text-muted-foreground">
+                Saldo final real en el peor {((1 - level.confidence) * 100).toFixed(0)}% (VaR / CVaR)
+              </span>
+              <span className="font-semibold text-foreground">{formatMoney(level.var)} / {formatMoney(level.cvar)}</span>
+            </div>
+          ))}
+          <div className="flex justify-between border-b border-border/50 pb-2">
+            <span className="text-muted-foreground">Probabilidad de caer alguna vez por debajo de lo invertido</span>
+            <span className="font-semibold text-foreground">{risk.probability_below_invested.toFixed(1)}%</span>
+          </div>
+          {risk.time_to_goal && (
+            <div className="flex justify-between">
+              <span className="text-muted-foreground">Años hasta la meta (P10 / mediana / P90)</span>
+              <span className="font-semibold text-foreground">
+                {[risk.time_to_goal.p10, risk.time_to_goal.p50, risk.time_to_goal.p90].map((y) => y ?? '—').join(' / ')}
+              </span>
+            </div>
+          )}
+          {risk.time_to_goal && (
+            <div className="h-40 w-full">
+              <PlotlyChart
+                data={[
+                  {
+                    x: risk.time_to_goal.probability_by_year.map((_, year) => year + startYear),
+                    y: risk.time_to_goal.probability_by_year,
+                    type: 'scatter',
+                    mode: 'lines',
+                    line: { color: '#2563eb', width: 2 },
+                    name: 'Meta alcanzada',
+                  },
+                ]}
+                layout={{
+                  autosize: true,
+                  margin: { t: 10, r: 20, l: 50, b: 30 },
+                  paper_bgcolor: "transparent",
+                  plot_bgcolor: "transparent",
+                  xaxis: axisStyle,
+                  yaxis: { title: { text: 'Meta alcanzada (%)' }, range: [0, 100], ...axisStyle },
+                  font: { family: 'inherit' },
+                  hovermode: 'x unified',
+                }}
+                useResizeHandler={true}
+                style={{ width: "100%", height: "100%" }}
+                config={{ displayModeBar: false }}
+              />
+            </div>
+          )}
+        </div>
+      </div>
+
       {/* Montaña Rusa Emocional (Drawdown Chart) */}
       <div className="bg-card border border-border rounded-xl p-6 shadow-sm">
         <div className="flex items-center gap-3 mb-6">
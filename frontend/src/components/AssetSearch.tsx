@@ -12,7 +12,7 @@ export default function AssetSearch({ onSelect }: { onSelect: (ticker: string) =
   const [isOpen, setIsOpen] = useState(false);
   const wrapperRef = useRef<HTMLDivElement>(null);
 
-  // Simple debounce implementation
+  // Simple debounce implementation (the search is served from a local index)
   useEffect(() => {
     const timer = setTimeout(async () => {
       if (query.length >= 2) {
@@ -30,7 +30,7 @@ export default function AssetSearch({ onSelect }: { onSelect: (ticker: string) =
         setResults([]);
         setIsOpen(false);
       }
-    }, 500);
+    }, 150);
 
     return () => clearTimeout(timer);
   }, [query]);
@@ -77,7 +77,9 @@ export default function AssetSearch({ onSelect }: { onSelect: (ticker: string) =
             >
               <div className="flex flex-col">
                 <span className="font-medium">{result.symbol}</span>
-                <span className="text-xs text-slate-500">{result.shortName}</span>
+                <span className="text-xs text-slate-500">
+                  {[result.shortName, result.exchange].filter(Boolean).join(' · ')}
+                </span>
               </div>
             </li>
           ))}
@@ -2,6 +2,10 @@ import axios from 'axios';
 import { 
   SimulationRequest, 
   SimulationResponse, 
+  SimulationProgress,
+  SimulationStreamStart,
+  Job,
+  JobPriority,
   BacktestRequest, 
   BacktestResponse, 
   TickerSearchResponse 
@@ -28,6 +32,78 @@ export const runSimulation = async (data: SimulationRequest): Promise<Simulation
   return response.data;
 };
 
+export interface SimulationStreamHandlers {
+  onStart?: (start: SimulationStreamStart) => void;
+  onProgress?: (progress: SimulationProgress) => void;
+}
+
+/**
+ * Runs a simulation over /simulate/stream (Server-Sent Events), reporting
+ * partial percentiles as path batches complete. Resolves with the same body
+ * as runSimulation, or null if the run was cancelled. Aborting the signal
+ * closes the connection, which stops the run on the server.
+ */
+export const streamSimulation = async (
+  data: SimulationRequest,
+  handlers: SimulationStreamHandlers = {},
+  signal?: AbortSignal,
+): Promise<SimulationResponse | null> => {
+  const response = await fetch(`${API_URL}/simulate/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+    body: JSON.stringify(data),
+    signal,
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`Simulation stream failed (${response.status})`);
+  }
+
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += value;
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+      const message = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      const event = message.match(/^event: (.*)$/m)?.[1];
+      const payload = JSON.parse(message.match(/^data: (.*)$/m)?.[1] ?? 'null');
+      if (event === 'start') handlers.onStart?.(payload);
+      else if (event === 'progress') handlers.onProgress?.(payload);
+      else if (event === 'result') return payload as SimulationResponse;
+      else if (event === 'cancelled') return null;
+      else if (event === 'error') throw new Error(payload.detail);
+    }
+  }
+  throw new Error('Simulation stream ended without a result');
+};
+
+export const cancelSimulationStream = async (runId: string): Promise<void> => {
+  await api.delete(`/simulate/stream/${runId}`);
+};
+
+export const submitSimulationJob = async (data: SimulationRequest, priority: JobPriority = 'normal'): Promise<Job> => {
+  const response = await api.post<Job>('/jobs/simulate', data, { params: { priority } });
+  return response.data;
+};
+
+export const getJob = async (jobId: string): Promise<Job> => {
+  const response = await api.get<Job>(`/jobs/${jobId}`);
+  return response.data;
+};
+
+export const getSimulationJobResult = async (jobId: string): Promise<SimulationResponse> => {
+  const response = await api.get<SimulationResponse>(`/jobs/${jobId}/result`);
+  return response.data;
+};
+
+export const cancelJob = async (jobId: string): Promise<Job> => {
+  const response = await api.delete<Job>(`/jobs/${jobId}`);
+  return response.data;
+};
+
 export const runBacktest = async (data: BacktestRequest): Promise<BacktestResponse> => {
   const response = await api.post<BacktestResponse>('/backtest', data);
   return response.data;
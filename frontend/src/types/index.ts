@@ -3,6 +3,11 @@ export interface ContributionTranche {
   monthly_amount: number;
 }
 
+export interface AssetWeight {
+  ticker: string;
+  weight: number;
+}
+
 export interface SimulationRequest {
   initial_capital: number;
   contribution_schedule: ContributionTranche[];
@@ -14,6 +19,26 @@ export interface SimulationRequest {
   custom_return?: number;
   custom_volatility?: number;
   t_df?: number;
+  num_simulations?: number;
+  seed?: number;
+  shards?: number;
+  assets?: AssetWeight[];
+  rebalance_every?: number;
+  max_points?: number;
+  sampling?: "pseudo" | "antithetic" | "sobol";
+  control_variate?: boolean;
+  adaptive?: boolean;
+  tolerance?: number;
+  median_tolerance?: number;
+  max_simulations?: number;
+  time_budget?: number;
+  return_model?: "parametric" | "bootstrap";
+  bootstrap_method?: "stationary" | "fixed";
+  block_length?: number;
+  time_step?: "annual" | "monthly";
+  inflation_volatility?: number | null; // only with time_step "monthly"
+  inflation_persistence?: number;
+  inflation_return_correlation?: number;
 }
 
 export interface BacktestRequest {
@@ -22,11 +47,13 @@ export interface BacktestRequest {
   ticker: string;
   start_year: number;
   inflation_rate: number;
+  max_points?: number;
 }
 
 export interface TickerSearchResponse {
   symbol: string;
-  shortName?: string;
+  shortName?: string | null;
+  exchange?: string | null;
 }
 
 export interface FanChartPoint {
@@ -54,7 +81,36 @@ export interface MedianDetail {
 export interface RiskMetrics {
   max_drawdown: number;
   success_probability: number;
+  success_probability_ci: [number, number];
   median_final_balance_real: number;
+  max_drawdown_distribution: DrawdownDistribution;
+  value_at_risk: ValueAtRisk[];
+  time_to_goal: TimeToGoal | null;
+  probability_below_invested: number;
+}
+
+export interface DrawdownDistribution {
+  mean: number;
+  p10: number;
+  p50: number;
+  p90: number;
+  p95: number;
+  p99: number;
+  histogram: { bin_width: number; probabilities: number[] };
+}
+
+export interface ValueAtRisk {
+  confidence: number;
+  var: number;
+  cvar: number;
+}
+
+export interface TimeToGoal {
+  probability_by_year: number[];
+  never_probability: number;
+  p10: number | null;
+  p50: number | null;
+  p90: number | null;
 }
 
 export interface TickerStats {
@@ -80,6 +136,54 @@ export interface PortfolioCompositionPoint {
   "Is_Black_Swan": boolean;
 }
 
+export interface Estimate {
+  value: number;
+  // null when there is a single independent unit (no variance to estimate)
+  ci_low: number | null;
+  ci_high: number | null;
+  std_error?: number | null;
+  efficiency?: number | null;
+}
+
+export interface SimulationRunInfo {
+  num_simulations: number;
+  seed: number;
+  shards: number;
+  sampling: "pseudo" | "antithetic" | "sobol";
+  control_variate: boolean;
+  confidence_level: number;
+  return_model: "parametric" | "bootstrap";
+  bootstrap: BootstrapRunInfo | null;
+  time_step: "annual" | "monthly";
+  inflation_model: InflationModelInfo | null;
+  estimates: {
+    success_probability: Estimate;
+    mean_final_real: Estimate;
+    median_final_real: Estimate;
+  };
+  adaptive: AdaptiveRunInfo | null;
+}
+
+export interface InflationModelInfo {
+  volatility: number;
+  persistence: number;
+  correlation: number;
+}
+
+export interface BootstrapRunInfo {
+  method: "stationary" | "fixed";
+  block_length: number;
+  history_months: number;
+}
+
+export interface AdaptiveRunInfo {
+  batches: number;
+  stop_reason: "tolerance" | "max_paths" | "time_budget";
+  tolerance: { success_probability_half_width: number; median_relative_std_error: number };
+  precision: { success_probability_half_width: number | null; median_relative_std_error: number };
+  elapsed_seconds: number;
+}
+
 export interface SimulationResponse {
   fan_chart: FanChartPoint[];
   portfolio_composition: PortfolioCompositionPoint[];
@@ -87,6 +191,41 @@ export interface SimulationResponse {
   kpis: KPIs;
   risk_metrics: RiskMetrics;
   ticker_stats: TickerStats;
+  simulation: SimulationRunInfo;
+}
+
+export type PartialFanChartPoint = Omit<FanChartPoint, 'Invested' | 'Invested_Real'>;
+
+export type JobStatus = 'queued' | 'running' | 'succeeded' | 'failed' | 'cancelled';
+export type JobPriority = 'high' | 'normal' | 'low';
+
+export interface Job {
+  job_id: string;
+  kind: 'simulate' | 'simulate_batch' | 'solve_contribution' | 'backtest_rolling';
+  status: JobStatus;
+  priority: JobPriority;
+  progress: number; // 0-1
+  created_at: number; // Unix seconds
+  started_at: number | null;
+  finished_at: number | null;
+  expires_at: number | null;
+  error: { status: number; detail: string } | null;
+}
+
+export interface SimulationStreamStart {
+  run_id: string;
+  seed: number;
+  num_simulations: number;
+  shards: number;
+}
+
+export interface SimulationProgress {
+  paths_done: number;
+  num_simulations: number;
+  fan_chart: PartialFanChartPoint[];
+  success_probability: number;
+  success_probability_ci: [number, number];
+  median_final_balance_real: number;
 }
 
 export interface BacktestPoint {